@@ -2,36 +2,32 @@
 """
 ChroLens_Sorting 1.2 - 自動檔案整理工具
 新增功能：復原、預覽、正則、自動子資料夾、遞迴搜尋、重命名規則、通知、多設定檔、模板系統、統計報表
+
+啟動優化：整理引擎、更新、通知、匯出等模組於第一次使用時才載入；
+限速、大檔案續傳與歷史速度於視窗顯示後才設定，統計與模板於視窗顯示後由背景執行緒讀取。
+以 --startup-time 啟動可量測匯入時間與首次繪製時間。
 """
 
-try:
-    from version_manager import VersionManager
-    from version_info_dialog import VersionInfoDialog
-except ImportError:
-    pass
+import time
+_T_START = time.perf_counter()  # 啟動時間量測起點（需在其他匯入之前）
+
 import os
 import shutil
 import re
 import json
 import datetime
 import sys
-import threading
-import csv
 from collections import defaultdict
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 from tkinter import filedialog, messagebox, simpledialog
 import tkinter as tk
 
-# 嘗試載入通知模組
-try:
-    from plyer import notification
-    NOTIFY_AVAILABLE = True
-except ImportError:
-    NOTIFY_AVAILABLE = False
+_T_IMPORTED = time.perf_counter()
 
-from version_manager import VersionManager
-from update_dialog import UpdateDialog, NoUpdateDialog
+# 通知模組（plyer）於第一次發送通知時才載入；None 表示尚未嘗試
+NOTIFY_AVAILABLE = None
+_notification = None
 
 # ============================================================================
 # 全域設定
@@ -40,8 +36,13 @@ SETTINGS_FILE = "settings.json"
 TEMPLATES_FILE = "templates.json"
 STATS_FILE = "stats.json"
 SCHEDULE_FILE = "schedule_times.json"
+SCHEDULE_STATE_FILE = "schedule_state.json"
+JOURNAL_FILE = "move_journal.jsonl"
+THROUGHPUT_FILE = "throughput.json"
+RELEASE_CACHE_FILE = "release_cache.json"
 GITHUB_REPO = "Lucienwooo/ChroLens_Sorting"
 CURRENT_VERSION = "1.2"
+DEFAULT_PROFILE = "目前設定"  # 與 sorting_engine.DEFAULT_PROFILE 相同（命令列解析不載入引擎）
 
 # 模板設定（使用者完全自訂）
 
@@ -70,28 +71,100 @@ class AutoMoveApp:
         # v1.2 新功能變數
         self.auto_subfolder_var = tk.BooleanVar(value=False)  # 移動時建立當日資料夾
         self.conflict_var = tk.StringVar(value="skip")  # 衝突處理
+        self.recursive_var = tk.BooleanVar(value=False)  # 包含子資料夾
+        self.watch_var = tk.BooleanVar(value=False)  # 監看模式
+        self.settle_var = tk.StringVar(value="5")  # 檔案需穩定的秒數
+        self.profile_run_var = tk.BooleanVar(value=False)  # 下一次移動時擷取效能分析
         
         # 停止標記
         self._stop_flag = False
         self._countdown_after_id = None
+        self._moving = False  # 背景執行緒正在執行移動（見 _run_profile_moves）
+        
+        # 常駐排程器（取代 schtasks，於視窗顯示後啟動）
+        self._scheduler = None
+        
+        # 背景更新檢查（於視窗顯示後啟動）
+        self._update_service = None
+        
+        # 監看模式
+        self._watcher = None
+        self._watch_profile = None
+        self._watch_rules = None
+        self._watch_batcher = None
+        self._watch_settler = None  # settle.BatchSettler：監看的一批事件整批等待穩定
+        
+        # 執行日誌：每批移動一筆記錄
+        self._journal = None
+        
+        # 尚未穩定（下載中）的檔案：{設定檔名稱: (SortProfile, SettleTracker)}
+        self._settle_trackers = {}
+        
+        # 目的磁碟空間不足時的備用位置與檢查方式（settings.json 的 overflow、space_check）
+        self._overflow = {}
+        self._space_check = "trim"
+        self._verify = False  # settings.json 的 verify：跨裝置複製後驗證內容
+        self._transfer = {}  # settings.json 的 transfer：目的地 → 傳送方式（見 transfer.py）
+        self._order = "rule"  # settings.json 的 order：移動順序（見 ordering.py）
+        self._throttle_rules = []  # settings.json 的 throttle（見 throttle.py）
+        self._allow_unverified_updates = False  # settings.json 的 allow_unverified_updates：安裝沒有 SHA-256 的更新
+        self._settle_after_id = None
+        self._close_after_settle = 0
         
         # 移動歷史（用於復原）
         self._move_history = []
         self._max_history = 100
         
-        # 統計資料
-        self._stats = self._load_stats()
-        
-        # 模板
-        self._templates = self._load_templates()
+        # 統計資料與模板：視窗顯示後於背景載入（見 _load_deferred_data）
+        self._stats = {"total": 0, "daily": {}}
+        self._templates = {}
+        self._data_ready = None
         
         # 拖曳功能
         self._drag_data = {"widget": None, "index": None, "type": None, "tip": None}
         
         self._build_ui()
         self._settings_loaded = False
+        self._runtime_configured = False
         self.load_settings()
         self._start_auto_move()
+        self.root.after_idle(self._configure_runtime)
+        self.root.after_idle(self._load_deferred_data)
+        self.root.after_idle(self._start_scheduler)
+        self.root.after_idle(self._start_update_service)
+    
+    def _configure_runtime(self):
+        """視窗顯示後載入限速、大檔案續傳、傳送記錄與歷史速度並套用設定（之後重新載入設定時只更新限速）"""
+        import largefile
+        import ordering
+        import throttle
+        import transfer
+        throttle.configure(self._throttle_rules)
+        if not self._runtime_configured:
+            largefile.configure(JOURNAL_FILE)
+            transfer.configure(JOURNAL_FILE)
+            ordering.configure(THROUGHPUT_FILE)
+            self._runtime_configured = True
+    
+    def _load_deferred_data(self):
+        """於背景執行緒載入統計與模板，不阻塞首次繪製"""
+        import threading
+        self._data_ready = threading.Event()
+        
+        def load():
+            try:
+                self._stats = self._load_stats()
+                self._templates = self._load_templates()
+            finally:
+                self._data_ready.set()
+        
+        threading.Thread(target=load, daemon=True).start()
+    
+    def _wait_data_ready(self):
+        """確保統計與模板已載入（背景尚未開始時直接同步載入）"""
+        if self._data_ready is None:
+            self._load_deferred_data()
+        self._data_ready.wait()
     
     def _set_icon(self):
         try:
@@ -112,7 +185,8 @@ class AutoMoveApp:
         tb.Button(top_frame, text="復原", command=self.undo_move, bootstyle="danger").pack(side=LEFT, padx=2)
         tb.Button(top_frame, text="模板", command=self.open_template_window, bootstyle="info").pack(side=LEFT, padx=2)
         tb.Button(top_frame, text="統計", command=self.show_stats, bootstyle="secondary").pack(side=LEFT, padx=2)
-        tb.Button(top_frame, text="版本", command=self.check_for_updates, bootstyle="info").pack(side=LEFT, padx=2)
+        self.version_btn = tb.Button(top_frame, text="版本", command=self.check_for_updates, bootstyle="info")
+        self.version_btn.pack(side=LEFT, padx=2)
         
         # 種類選擇
         kind_box = tb.Combobox(top_frame, textvariable=self.kind_var, width=3, values=[str(i) for i in range(1, 21)])
@@ -125,6 +199,9 @@ class AutoMoveApp:
         opt_frame.pack(pady=3, anchor='w', padx=10, fill='x')
         
         tb.Checkbutton(opt_frame, text="移動時建立當日資料夾", variable=self.auto_subfolder_var, bootstyle="round-toggle").pack(side=LEFT, padx=5)
+        tb.Checkbutton(opt_frame, text="包含子資料夾", variable=self.recursive_var, bootstyle="round-toggle").pack(side=LEFT, padx=5)
+        tb.Checkbutton(opt_frame, text="監看", variable=self.watch_var, command=self.toggle_watch, bootstyle="round-toggle").pack(side=LEFT, padx=5)
+        tb.Checkbutton(opt_frame, text="分析下次執行", variable=self.profile_run_var, bootstyle="round-toggle").pack(side=LEFT, padx=5)
         
         # 衝突處理
         tb.Label(opt_frame, text="衝突:").pack(side=LEFT, padx=(10, 2))
@@ -137,6 +214,8 @@ class AutoMoveApp:
         tb.Label(opt_frame, text="秒後移動").pack(side=LEFT)
         tb.Entry(opt_frame, width=3, textvariable=self.auto_close_var).pack(side=LEFT, padx=(10, 0))
         tb.Label(opt_frame, text="秒後關閉").pack(side=LEFT)
+        tb.Entry(opt_frame, width=3, textvariable=self.settle_var).pack(side=LEFT, padx=(10, 0))
+        tb.Label(opt_frame, text="秒未變動才移動").pack(side=LEFT)
         
         # === row 2: 全部欄位 ===
         zero_frame = tb.Frame(self.root)
@@ -236,55 +315,41 @@ class AutoMoveApp:
             entry.delete(0, 'end')
             entry.insert(0, folder)
     
-    def _get_files(self, path):
-        """取得檔案列表"""
-        files = []
-        for f in os.listdir(path):
-            if os.path.isdir(os.path.join(path, f)):
-                files.append(f + "/")
-            else:
-                files.append(f)
-        return files
+    def _get_files(self, path, recursive=False, exclude=()):
+        """取得檔案列表（exclude：不列出也不進入的資料夾）"""
+        import sorting_engine as engine
+        return engine.list_entries(path, recursive, exclude)
     
     def _match_pattern(self, filename, pattern):
         """匹配檔案"""
-        if pattern == "[資料夾]":
-            return filename.endswith("/")
-        elif pattern.startswith("."):
-            return filename.lower().endswith(pattern.lower()) and not filename.endswith("/")
-        else:
-            return pattern.lower() in filename.lower()
-    
-    def _resolve_dest_path(self, base_dest, filename):
-        """解析目的路徑（建立當日資料夾）"""
-        if not self.auto_subfolder_var.get():
-            return base_dest
-        
-        # 建立 YYYY-MM-DD 格式的資料夾
-        today = datetime.date.today().strftime("%Y-%m-%d")
-        dest = os.path.join(base_dest, today)
-        
-        if not os.path.exists(dest):
-            os.makedirs(dest, exist_ok=True)
-        return dest
+        import sorting_engine as engine
+        return engine.match_pattern(filename, pattern)
     
     def _handle_conflict(self, src_path, dst_path):
         """處理檔案衝突"""
-        if not os.path.exists(dst_path):
-            return dst_path, True
-        
-        mode = self.conflict_var.get()
-        if mode == "skip":
-            return dst_path, False
-        elif mode == "overwrite":
-            return dst_path, True
-        elif mode == "rename":
-            base, ext = os.path.splitext(dst_path)
-            i = 1
-            while os.path.exists(f"{base}_{i}{ext}"):
-                i += 1
-            return f"{base}_{i}{ext}", True
-        return dst_path, False
+        import sorting_engine as engine
+        return engine.resolve_conflict(dst_path, self.conflict_var.get())
+    
+    def _current_profile(self):
+        """以目前介面上的設定建立 SortProfile"""
+        import sorting_engine as engine
+        return engine.SortProfile(
+            name=engine.DEFAULT_PROFILE,
+            source=self.source_entry.get().strip(),
+            rules=list(zip([e.get() for e in self.extension_entries],
+                           [e.get() for e in self.dest_entries])),
+            all_enabled=self.all_var.get(),
+            all_dest=self.entry_all_path.get(),
+            auto_subfolder=self.auto_subfolder_var.get(),
+            conflict=self.conflict_var.get(),
+            recursive=self.recursive_var.get(),
+            settle_seconds=engine._to_float(self.settle_var.get(), 5.0),
+            overflow=self._overflow,
+            space_check=self._space_check,
+            verify=self._verify,
+            transfer=self._transfer,
+            order=self._order,
+        )
     
     def list_files(self):
         """列出檔案"""
@@ -323,41 +388,93 @@ class AutoMoveApp:
                 entry.delete(0, "end")
                 entry.insert(0, path)
     
+    def toggle_watch(self):
+        """開啟/關閉監看模式：來源資料夾有新檔案寫入完成時立即分類"""
+        import sorting_engine as engine
+        from watcher import create_watcher
+        
+        from batcher import EventBatcher
+        
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+            self._watch_batcher.stop(flush_pending=False)
+            self._watch_batcher = None
+            self._watch_settler = None
+            self.log("監看已停止")
+        if not self.watch_var.get():
+            return
+        
+        profile = self._current_profile()
+        if not profile.source or not os.path.isdir(profile.source):
+            self.log("錯誤：來源路徑無效")
+            self.watch_var.set(False)
+            return
+        from settle import BatchSettler
+        self._watch_profile = profile
+        self._watch_rules = engine.CompiledRules(profile)
+        self._watch_settler = BatchSettler(self._settle_tracker(profile))
+        
+        # 監看事件先經合併，再整批交回主執行緒
+        def on_batch(paths):
+            self.root.after(0, lambda: self._on_watch_batch(paths))
+        
+        def log(msg):
+            self.root.after(0, lambda: self.log(msg))
+        
+        self._watch_batcher = EventBatcher(on_batch, log=log)
+        self._watch_batcher.start()
+        self._watcher = create_watcher(profile.source, self._watch_batcher.add, profile.recursive, log,
+                                       profile.destination_roots())
+        self._watcher.start()
+        self.log(f"監看中：{profile.source}（{type(self._watcher).__name__}）")
+    
+    def _on_watch_batch(self, paths):
+        """
+        監看到一批寫入完成的項目：逐一套用已編譯的規則後整批等待穩定，
+        全部穩定後一起移動，一批事件只產生一筆執行日誌、復原與統計記錄
+        """
+        import sorting_engine as engine
+        profile = self._watch_profile
+        if self._watcher is None or profile is None:
+            return
+        moves = []
+        for path in paths:
+            if not os.path.lexists(path):
+                continue
+            rel = os.path.relpath(path, profile.source).replace(os.sep, "/")
+            if os.path.isdir(path):
+                rel += "/"
+            move = engine.plan_single(self._watch_rules, rel)
+            if move is not None:
+                moves.append(move)
+        if moves:
+            # 整批都已穩定（例如以 mv 移入、修改時間較早，或 settle_seconds 為 0）時立即移動
+            ready, held, skipped = self._watch_settler.add(profile.source, moves)
+            self._log_unsettled(profile, held, skipped)
+            self._move_settled(profile, ready)
+    
     def stop_all(self):
         """停止所有動作"""
         self._stop_flag = True
+        if self._settle_after_id:
+            self.root.after_cancel(self._settle_after_id)
+            self._settle_after_id = None
+        for _, tracker in self._settle_trackers.values():
+            tracker.clear()
+        if self._watch_settler is not None:
+            self._watch_settler.clear()
+        self._close_after_settle = 0
         if self._countdown_after_id:
             self.root.after_cancel(self._countdown_after_id)
             self._countdown_after_id = None
         self.log("已停止所有動作")
     
-    def _calculate_moves(self, src):
+    def _calculate_moves(self, src, profile=None):
         """計算要移動的檔案"""
-        files = self._get_files(src)
-        moves = []
-        moved = set()
-        
-        for ext, dst in zip([e.get().strip() for e in self.extension_entries],
-                           [e.get().strip() for e in self.dest_entries]):
-            if not ext or not dst:
-                continue
-            for f in files:
-                if f in moved:
-                    continue
-                if self._match_pattern(f.rstrip("/"), ext):
-                    real_dst = self._resolve_dest_path(dst, f.rstrip("/"))
-                    moves.append((f.rstrip("/"), real_dst))
-                    moved.add(f)
-        
-        # 處理「全部」
-        if self.all_var.get():
-            all_dst = self.entry_all_path.get().strip()
-            if all_dst:
-                for f in files:
-                    if f not in moved:
-                        moves.append((f.rstrip("/"), all_dst))
-        
-        return moves
+        import sorting_engine as engine
+        profile = profile or self._current_profile()
+        return engine.plan_moves(profile, self._get_files(src, profile.recursive, profile.destination_roots()))
     
     def move_files(self):
         """執行移動"""
@@ -367,63 +484,175 @@ class AutoMoveApp:
             messagebox.showerror("錯誤", "請選擇有效的來源資料夾")
             return
         
-        moves = self._calculate_moves(src)
-        if not moves:
-            self.log("沒有符合條件的檔案")
+        profile = self._current_profile()
+        capture_dir = None
+        if self.profile_run_var.get():
+            # 只分析這一次，報告寫在執行日誌旁
+            self.profile_run_var.set(False)
+            capture_dir = os.path.dirname(os.path.abspath(JOURNAL_FILE))
+        self._run_profile_moves(profile, done=self._after_move, capture_dir=capture_dir)
+    
+    def _after_move(self, ran):
+        """按下「移動」完成後：自動關閉（仍有檔案等待穩定時，待全部移動後再倒數）"""
+        if not ran:
             return
+        try:
+            sec = int(self.auto_close_var.get())
+            if sec > 0:
+                if self._settle_pending():
+                    self._close_after_settle = sec
+                else:
+                    self._countdown("關閉", sec, self.root.destroy)
+        except:
+            pass
+    
+    def _run_profile_moves(self, profile, background=None, done=None, capture_dir=None):
+        """
+        於背景執行緒執行設定檔的移動，完成後在主執行緒記錄歷史、統計與通知，
+        再呼叫 done(是否有檔案可移動)；移動期間視窗保持回應，「停止」在項目之間
+        與大檔案的續傳點生效（見 largefile.py）。
+        background 指定時（排程）以較低的優先權執行，按下「移動」時維持一般優先權；
+        capture_dir 指定時擷取這次執行的效能報告（見 profiling.RunCapture）
+        """
+        import threading
+        from pipeline import run_pipeline
+        
+        if self._moving:
+            self.log("移動進行中，請稍候")
+            return
+        self._moving = True
+        self._stop_flag = False
+        tracker = self._settle_tracker(profile)
         
-        moved = 0
-        failed = 0
-        batch_history = []
+        def log(msg):
+            self.root.after(0, lambda: self.log(msg))
         
-        for filename, dest in moves:
-            src_path = os.path.join(src, filename)
-            dst_path = os.path.join(dest, os.path.basename(filename))
-            
-            if not os.path.exists(dest):
-                try:
-                    os.makedirs(dest, exist_ok=True)
-                except:
-                    self.log(f"無法建立目錄：{dest}")
-                    failed += 1
-                    continue
-            
-            final_dst, should_move = self._handle_conflict(src_path, dst_path)
-            
-            if not should_move:
-                self.log(f"跳過：{filename}（已存在）")
-                failed += 1
-                continue
-            
+        def work():
+            result = None
             try:
-                shutil.move(src_path, final_dst)
-                self.log(f"移動：{filename}")
-                batch_history.append((final_dst, src_path))
-                moved += 1
+                # 列出、比對與移動同時進行（見 pipeline.py）
+                if capture_dir:
+                    import profiling
+                    with profiling.RunCapture(capture_dir, profile.name, log):
+                        result = run_pipeline(profile, log, lambda: self._stop_flag, tracker, background=background)
+                else:
+                    result = run_pipeline(profile, log, lambda: self._stop_flag, tracker, background=background)
             except Exception as e:
-                self.log(f"失敗：{filename}（{e}）")
-                failed += 1
+                log(f"移動失敗：{e}")
+            finally:
+                self.root.after(0, lambda: finish(result))
+        
+        def finish(result):
+            self._moving = False
+            ran = result is not None and self._finish_profile_moves(profile, result)
+            if done:
+                done(ran)
         
-        # 記錄歷史
-        if batch_history:
-            self._move_history.append(batch_history)
+        threading.Thread(target=work, name="ChroLensMove", daemon=True).start()
+    
+    def _finish_profile_moves(self, profile, result):
+        """記錄一次執行的結果；沒有檔案可移動時回傳 False"""
+        if not result.matched:
+            self.log("沒有符合條件的檔案")
+            return False
+        
+        self._log_unsettled(profile, result.held, result.skipped)
+        if not result.moved and not result.failed:
+            return True
+        
+        self._record_result(result, profile)
+        return True
+    
+    def _get_journal(self):
+        if self._journal is None:
+            from journal import shared
+            self._journal = shared(JOURNAL_FILE)
+        return self._journal
+    
+    def _record_result(self, result, profile):
+        """記錄一批移動的歷史、日誌、統計與通知（一批為一個單位）"""
+        if result.history:
+            self._move_history.append(result.history)
             if len(self._move_history) > self._max_history:
                 self._move_history.pop(0)
+            self._get_journal().record_batch(profile.name, profile.source, result)
         
-        self.log(f"完成：{moved} 成功，{failed} 失敗")
-        self._update_stats(moved)
-        self._send_notification(f"移動完成：{moved} 成功，{failed} 失敗")
-        
-        # 自動關閉
-        try:
-            sec = int(self.auto_close_var.get())
-            if sec > 0:
-                self._countdown("關閉", sec, self.root.destroy)
-        except:
-            pass
+        self.log(f"完成：{result.summary()}")
+        self._update_stats(result.moved)
+        self._send_notification(f"移動完成：{result.summary()}")
+    
+    # ==================== 穩定偵測 ====================
+    
+    def _settle_tracker(self, profile):
+        """取得設定檔的待定清單（穩定時間改變時重新建立）"""
+        import metrics
+        from settle import SettleTracker
+        
+        entry = self._settle_trackers.get(profile.name)
+        if entry is None or entry[1].window != profile.settle_seconds:
+            entry = (profile, SettleTracker(profile.settle_seconds))
+        tracker = entry[1]
+        self._settle_trackers[profile.name] = (profile, tracker)
+        metrics.SETTLE_PENDING.labels(source=profile.name).set_function(tracker.__len__)
+        return tracker
+    
+    def _log_unsettled(self, profile, held, skipped):
+        if skipped:
+            self.log(f"略過下載中的暫存檔：{skipped} 個")
+        if held:
+            self.log(f"等待檔案穩定：{held} 個（{profile.settle_seconds:g} 秒未變動後移動）")
+            self._schedule_settle_poll()
+    
+    def _settle_pending(self):
+        return any(len(tracker) for _, tracker in self._settle_trackers.values())
+    
+    def _schedule_settle_poll(self):
+        if self._settle_after_id is not None:
+            return
+        delays = [t.next_delay() for _, t in self._settle_trackers.values()]
+        delays = [d for d in delays if d is not None]
+        if not delays:
+            return
+        self._settle_after_id = self.root.after(int(min(delays) * 1000), self._poll_settle)
+    
+    def _poll_settle(self):
+        """以 stat 重新檢查待定檔案，穩定者立即移動"""
+        self._settle_after_id = None
+        settler = self._watch_settler
+        for profile, tracker in list(self._settle_trackers.values()):
+            settled = tracker.poll()
+            if settler is not None and settler.tracker is tracker:
+                # 監看的批次全部穩定後各自移動；其他待定項目（按下「移動」時的）合併移動
+                batches, settled = settler.collect(settled)
+                for batch in batches:
+                    self._move_settled(profile, batch)
+            else:
+                settled = [move[:2] for _, move in settled]
+            self._move_settled(profile, settled)
+        
+        if self._settle_pending():
+            self._schedule_settle_poll()
+        elif self._close_after_settle:
+            sec, self._close_after_settle = self._close_after_settle, 0
+            self._countdown("關閉", sec, self.root.destroy)
+    
+    def _move_settled(self, profile, settled):
+        """移動監看或待定中已穩定的項目並記錄結果"""
+        import sorting_engine as engine
+        import priority
+        settled = engine.check_space(profile, settled, self.log)
+        if not settled:
+            return
+        # 監看與等待穩定的檔案屬於背景工作：暫時降低 I/O 優先權
+        with priority.background():
+            result = engine.execute_batch(profile.source, settled, profile.conflict, self.log,
+                                          verify=profile.verify,
+                                          modes=engine.transfer_map(profile), order=profile.order)
+        self._record_result(result, profile)
     
     def undo_move(self):
         """復原上次移動（含確認視窗）"""
+        import metrics
         if not self._move_history:
             self.log("沒有可復原的移動記錄")
             messagebox.showinfo("提示", "沒有可復原的移動記錄")
@@ -454,7 +683,7 @@ class AutoMoveApp:
         
         # 顯示復原資訊
         batch = self._move_history[-1]
-        for current_path, original_path in batch:
+        for current_path, original_path, *_ in batch:
             text.insert('end', f"{current_path}\n  → {original_path}\n\n")
         
         text.config(state='disabled')
@@ -463,17 +692,30 @@ class AutoMoveApp:
             batch = self._move_history.pop()
             restored = 0
             
-            for current_path, original_path in reversed(batch):
-                try:
-                    if os.path.exists(current_path):
-                        os.makedirs(os.path.dirname(original_path), exist_ok=True)
-                        shutil.move(current_path, original_path)
-                        self.log(f"復原：{os.path.basename(original_path)}")
-                        restored += 1
-                except Exception as e:
-                    self.log(f"復原失敗：{e}")
+            with metrics.PHASE_SECONDS.labels(phase="undo").time():
+                for current_path, original_path, *rest in reversed(batch):
+                    mode = rest[0] if rest else "move"
+                    try:
+                        if mode != "move" and os.path.lexists(original_path):
+                            # 以複製、連結等方式保留了來源：刪除副本即可（來源已不在時改為搬回）
+                            if os.path.isdir(current_path) and not os.path.islink(current_path):
+                                shutil.rmtree(current_path)
+                            else:
+                                os.remove(current_path)
+                            self.log(f"復原：{os.path.basename(original_path)}")
+                            restored += 1
+                        elif os.path.exists(current_path):
+                            os.makedirs(os.path.dirname(original_path), exist_ok=True)
+                            shutil.move(current_path, original_path)
+                            self.log(f"復原：{os.path.basename(original_path)}")
+                            restored += 1
+                    except Exception as e:
+                        metrics.FAILURES.labels(stage="undo").inc()
+                        self.log(f"復原失敗：{e}")
+            metrics.FILES_RESTORED.inc(restored)
             
             self.log(f"復原完成：{restored} 個檔案")
+            self._get_journal().record_undo(restored, batch)
             preview_win.destroy()
         
         # 按鈕
@@ -504,6 +746,7 @@ class AutoMoveApp:
     
     def open_template_window(self):
         """開啟模板管理視窗"""
+        self._wait_data_ready()
         win = tb.Toplevel(self.root)
         win.title("分類模板")
         win.geometry("500x450")
@@ -581,6 +824,11 @@ class AutoMoveApp:
             self.regex_mode_var.set(config.get("regex_mode", False))
             self.auto_subfolder_var.set(config.get("auto_subfolder", False))
             self.conflict_var.set(config.get("conflict", "skip"))
+            self._overflow = config.get("overflow", {})
+            self._space_check = config.get("space_check", "trim")
+            self._verify = config.get("verify", False)
+            self._transfer = config.get("transfer", {})
+            self._order = config.get("order", "rule")
             
             self.log(f"已套用模板：{name}")
             win.destroy()
@@ -610,6 +858,11 @@ class AutoMoveApp:
                     "regex_mode": self.regex_mode_var.get(),
                     "auto_subfolder": self.auto_subfolder_var.get(),
                     "conflict": self.conflict_var.get(),
+                    "overflow": self._overflow,
+                    "space_check": self._space_check,
+                    "verify": self._verify,
+                    "transfer": self._transfer,
+                    "order": self._order,
                 },
                 "description": "完整配置模板"
             }
@@ -672,6 +925,7 @@ class AutoMoveApp:
             pass
     
     def _update_stats(self, count):
+        self._wait_data_ready()
         today = datetime.date.today().isoformat()
         self._stats["total"] += count
         self._stats["daily"][today] = self._stats["daily"].get(today, 0) + count
@@ -679,6 +933,7 @@ class AutoMoveApp:
     
     def show_stats(self):
         """顯示統計"""
+        self._wait_data_ready()
         win = tb.Toplevel(self.root)
         win.title("統計報表")
         win.geometry("400x350")
@@ -698,6 +953,7 @@ class AutoMoveApp:
         def export_csv():
             path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
             if path:
+                import csv
                 with open(path, "w", newline="", encoding="utf-8-sig") as f:
                     writer = csv.writer(f)
                     writer.writerow(["日期", "移動數量"])
@@ -721,6 +977,17 @@ class AutoMoveApp:
             self.auto_close_var.set(data.get("auto_close_var", "0"))
             self.auto_subfolder_var.set(data.get("auto_subfolder", False))
             self.conflict_var.set(data.get("conflict", "skip"))
+            self.recursive_var.set(data.get("recursive", False))
+            self.settle_var.set(str(data.get("settle_seconds", "5")))
+            self._overflow = data.get("overflow", {})
+            self._space_check = data.get("space_check", "trim")
+            self._verify = data.get("verify", False)
+            self._transfer = data.get("transfer", {})
+            self._order = data.get("order", "rule")
+            self._throttle_rules = data.get("throttle", [])
+            self._allow_unverified_updates = data.get("allow_unverified_updates", False)
+            if self._runtime_configured:
+                self._configure_runtime()
             
             self.update_dynamic_fields()
             
@@ -735,6 +1002,10 @@ class AutoMoveApp:
                 self.source_entry.delete(0, "end")
                 self.source_entry.insert(0, data["source"])
             
+            self.all_var.set(data.get("all_enabled", False))
+            self.entry_all_path.delete(0, "end")
+            self.entry_all_path.insert(0, data.get("all_dest", ""))
+            
             self._settings_loaded = True
             self.log("設定載入成功")
         except Exception as e:
@@ -748,6 +1019,17 @@ class AutoMoveApp:
                 "auto_close_var": self.auto_close_var.get(),
                 "auto_subfolder": self.auto_subfolder_var.get(),
                 "conflict": self.conflict_var.get(),
+                "recursive": self.recursive_var.get(),
+                "settle_seconds": self.settle_var.get(),
+                "overflow": self._overflow,
+                "space_check": self._space_check,
+                "verify": self._verify,
+                "transfer": self._transfer,
+                "order": self._order,
+                "throttle": self._throttle_rules,
+                "allow_unverified_updates": self._allow_unverified_updates,
+                "all_enabled": self.all_var.get(),
+                "all_dest": self.entry_all_path.get(),
                 "extensions": [e.get() for e in self.extension_entries],
                 "destinations": [e.get() for e in self.dest_entries],
                 "source": self.source_entry.get(),
@@ -785,9 +1067,16 @@ class AutoMoveApp:
     
     def _send_notification(self, message):
         """發送系統通知"""
+        global NOTIFY_AVAILABLE, _notification
+        if NOTIFY_AVAILABLE is None:
+            try:
+                from plyer import notification as _notification
+                NOTIFY_AVAILABLE = True
+            except ImportError:
+                NOTIFY_AVAILABLE = False
         if NOTIFY_AVAILABLE:
             try:
-                notification.notify(
+                _notification.notify(
                     title="ChroLens Sorting",
                     message=message,
                     timeout=5
@@ -881,11 +1170,55 @@ class AutoMoveApp:
     
     # ==================== 排程與更新 ====================
     
+    def _start_scheduler(self):
+        """啟動常駐排程器並載入 schedule_times.json"""
+        from scheduler import Scheduler, ScheduledJob, load_schedule_entries
+        # 舊版 "HH:MM" 排程於此移除 schtasks 工作並改存新格式（見 scheduler.load_schedule_entries）
+        
+        def run_job(profile_name):
+            self.root.after(0, lambda: self._run_scheduled(profile_name))
+        
+        def log(msg):
+            self.root.after(0, lambda: self.log(msg))
+        
+        self._scheduler = Scheduler(SCHEDULE_STATE_FILE, run_job, log=log)
+        jobs = []
+        for entry in load_schedule_entries(SCHEDULE_FILE, self.log):
+            try:
+                jobs.append(ScheduledJob.from_entry(entry))
+            except (ValueError, KeyError) as e:
+                self.log(f"略過無效排程 {entry}：{e}")
+        self._scheduler.set_jobs(jobs)
+        self._scheduler.start()
+    
+    def _run_scheduled(self, profile_name):
+        """排程觸發：以目前設定或模板內容執行（常駐程序中不觸發自動關閉）"""
+        import sorting_engine as engine
+        if profile_name == engine.DEFAULT_PROFILE:
+            profile = self._current_profile()
+        else:
+            self._wait_data_ready()
+            template = self._templates.get(profile_name)
+            if template is None:
+                self.log(f"找不到設定檔：{profile_name}")
+                return
+            profile = engine.SortProfile.from_template(profile_name, template)
+        if not profile.source or not os.path.isdir(profile.source):
+            self.log(f"錯誤：來源路徑無效（{profile_name}）")
+            return
+        self._run_profile_moves(profile, background="low")
+    
     def open_schedule_window(self):
         """開啟排程視窗"""
+        import sorting_engine as engine
+        from scheduler import ScheduledJob, delete_legacy_task, save_schedule_entries
+        if self._scheduler is None:
+            self._start_scheduler()
+        self._wait_data_ready()
+        
         win = tb.Toplevel(self.root)
         win.title("定時執行")
-        win.geometry("350x400")
+        win.geometry("420x480")
         win.grab_set()
         
         tb.Label(win, text="設定執行時間 (24小時制)", font=('微軟正黑體', 11)).pack(pady=10)
@@ -898,83 +1231,214 @@ class AutoMoveApp:
         tb.Label(time_frame, text=":").pack(side=LEFT)
         tb.Combobox(time_frame, textvariable=minute_var, width=4, values=[f"{i:02d}" for i in range(60)], state="readonly").pack(side=LEFT)
         
+        # cron 表示式（填寫時優先於上方時間）與設定檔
+        cron_frame = tb.Frame(win)
+        cron_frame.pack(pady=5)
+        tb.Label(cron_frame, text="cron:").pack(side=LEFT)
+        cron_var = tk.StringVar(value="")
+        tb.Entry(cron_frame, textvariable=cron_var, width=16).pack(side=LEFT, padx=3)
+        profile_var = tk.StringVar(value=engine.DEFAULT_PROFILE)
+        tb.Combobox(cron_frame, textvariable=profile_var, width=12, state="readonly",
+                    values=[engine.DEFAULT_PROFILE] + list(self._templates)).pack(side=LEFT, padx=3)
+        
         listbox = tk.Listbox(win, height=8, font=('Consolas', 12))
         listbox.pack(pady=10, fill='both', expand=True, padx=20)
         
-        def load_schedule():
-            if os.path.exists(SCHEDULE_FILE):
-                try:
-                    with open(SCHEDULE_FILE, "r", encoding="utf-8") as f:
-                        for t in json.load(f):
-                            listbox.insert(tk.END, t)
-                except:
-                    pass
+        jobs = self._scheduler.jobs()
         
-        def save_schedule():
-            with open(SCHEDULE_FILE, "w", encoding="utf-8") as f:
-                json.dump(list(listbox.get(0, tk.END)), f)
+        def refresh():
+            listbox.delete(0, tk.END)
+            for job in jobs:
+                listbox.insert(tk.END, job.describe())
         
         def add_time():
-            val = f"{hour_var.get()}:{minute_var.get()}"
-            if val not in listbox.get(0, tk.END):
-                listbox.insert(tk.END, val)
-                self._create_task(val)
-                save_schedule()
+            expr = cron_var.get().strip() or f"{hour_var.get()}:{minute_var.get()}"
+            try:
+                job = ScheduledJob(expr, profile_var.get())
+            except ValueError as e:
+                messagebox.showerror("錯誤", f"無效的排程：{e}", parent=win)
+                return
+            if any(j.job_id == job.job_id for j in jobs):
+                return
+            jobs.append(job)
+            self._scheduler.add(job)
+            save_schedule_entries(SCHEDULE_FILE, jobs)
+            refresh()
         
         def remove_time():
             for idx in reversed(listbox.curselection()):
-                self._delete_task(listbox.get(idx))
-                listbox.delete(idx)
-            save_schedule()
+                job = jobs.pop(idx)
+                self._scheduler.remove(job.job_id)
+                delete_legacy_task(str(job.cron))
+            save_schedule_entries(SCHEDULE_FILE, jobs)
+            refresh()
         
         btn_frame = tb.Frame(win)
         btn_frame.pack(pady=10)
         tb.Button(btn_frame, text="新增", command=add_time, bootstyle="success").pack(side=LEFT, padx=5)
         tb.Button(btn_frame, text="移除", command=remove_time, bootstyle="danger").pack(side=LEFT, padx=5)
         
-        load_schedule()
+        tb.Label(win, text="排程於本程式執行期間生效，錯過的排程會在啟動後補執行", 
+                font=('微軟正黑體', 9), foreground='gray').pack(pady=(0, 10))
+        
+        refresh()
     
-    def _create_task(self, time_str):
-        import subprocess
-        task_name = f"ChroLensSorting_{time_str.replace(':', '')}"
-        exe = sys.executable if getattr(sys, 'frozen', False) else f'"{sys.executable}" "{os.path.abspath(sys.argv[0])}"'
-        cmd = f'schtasks /Create /TN "{task_name}" /SC DAILY /TR "{exe}" /ST {time_str} /F'
-        try:
-            subprocess.run(cmd, shell=True, capture_output=True)
-            self.log(f"建立排程：{time_str}")
-        except Exception as e:
-            self.log(f"排程失敗：{e}")
+    def _start_update_service(self):
+        """啟動背景更新檢查（隨機延遲後才連線，不影響視窗與排程）"""
+        from update_service import UpdateService
+        
+        def create_manager():
+            from version_manager import VersionManager
+            return VersionManager(GITHUB_REPO, CURRENT_VERSION, logger=lambda msg: self.root.after(0, lambda: self.log(msg)),
+                                  cache_file=RELEASE_CACHE_FILE,
+                                  allow_unverified=self._allow_unverified_updates)
+        
+        self._update_service = UpdateService(create_manager)
+        self._update_service.start()
+        self.root.after(1000, self._poll_update_results)
     
-    def _delete_task(self, time_str):
-        import subprocess
-        task_name = f"ChroLensSorting_{time_str.replace(':', '')}"
+    def _poll_update_results(self):
+        """從更新服務的佇列取出結果（主執行緒）"""
+        import queue
         try:
-            subprocess.run(f'schtasks /Delete /TN "{task_name}" /F', shell=True, capture_output=True)
-            self.log(f"刪除排程：{time_str}")
-        except:
+            while True:
+                self._show_update_result(self._update_service.results.get_nowait())
+        except queue.Empty:
             pass
+        self.root.after(1000, self._poll_update_results)
+    
+    def _show_update_result(self, result):
+        if result.info:
+            self.version_btn.config(text=f"版本（{result.info['version']}）", bootstyle="warning")
+            if result.requested:
+                from version_info_dialog import VersionInfoDialog
+                dialog = VersionInfoDialog(self.root, self._update_service.manager, CURRENT_VERSION, "ChroLens_Sorting")
+                dialog.check()
+            else:
+                self.log(f"發現新版本 {result.info['version']}，按「版本」更新")
+        elif result.requested:
+            if result.error:
+                messagebox.showerror("錯誤", f"檢查更新失敗：{result.error}")
+            else:
+                messagebox.showinfo("更新", f"目前版本 {CURRENT_VERSION} 已是最新版本")
     
     def check_for_updates(self):
-        """檢查更新"""
-        def check():
-            try:
-                version_mgr = VersionManager(CURRENT_VERSION, logger=self.log)
-                info = version_mgr.check_for_updates()
-                if info:
-                    self.root.after(0, lambda: UpdateDialog(self.root, version_mgr, info, on_update_callback=self.root.quit))
-                else:
-                    self.root.after(0, lambda: NoUpdateDialog(self.root, CURRENT_VERSION))
-            except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("錯誤", f"檢查更新失敗：{e}"))
-        
-        threading.Thread(target=check, daemon=True).start()
+        """檢查更新（交給背景更新服務，結果由 _poll_update_results 顯示）"""
+        if self._update_service is None:
+            self._start_update_service()
+        self._update_service.check_now()
 
 
 # ============================================================================
 # 程式進入點
 # ============================================================================
+def _report_startup_time(root, app):
+    """於首次繪製後回報啟動耗時（--startup-time）"""
+    state = {"done": False}
+    
+    def on_map(event=None):
+        if state["done"]:
+            return
+        state["done"] = True
+        
+        def report():
+            root.update_idletasks()
+            now = time.perf_counter()
+            lines = [
+                f"[啟動] 模組匯入：{(_T_IMPORTED - _T_START) * 1000:.1f} ms",
+                f"[啟動] 首次繪製：{(now - _T_START) * 1000:.1f} ms",
+            ]
+            for line in lines:
+                print(line)
+                app.log(line)
+        
+        root.after_idle(report)
+    
+    root.bind("<Map>", on_map, add="+")
+
+
+def _parse_args(argv):
+    """命令列參數；未指定模式時開啟視窗"""
+    import argparse
+    parser = argparse.ArgumentParser(description="ChroLens_Sorting 自動檔案整理工具")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--scheduler", action="store_true", help="無視窗常駐執行排程")
+    mode.add_argument("--watch", nargs="?", const=DEFAULT_PROFILE, metavar="設定檔",
+                      help="無視窗監看來源資料夾")
+    mode.add_argument("--daemon", nargs="*", metavar="設定檔",
+                      help="無視窗同時整理多個設定檔（未指定時使用所有模板）")
+    mode.add_argument("--ctl", nargs="+", metavar=("指令", "設定檔"),
+                      help="對常駐程序送出控制指令：run/dry_run/stop/progress/status/summary/reload")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="與 --ctl run 一起使用：只列出計畫，不移動")
+    mode.add_argument("--profile-run", nargs="?", const=DEFAULT_PROFILE, metavar="設定檔",
+                      help="執行一次設定檔並擷取 cProfile 與 tracemalloc 報告")
+    parser.add_argument("--interval", type=float, default=60.0, help="常駐模式的掃描間隔（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="常駐模式的移動執行緒數")
+    parser.add_argument("--per-device", type=int, default=2, help="每個目的裝置同時移動的上限")
+    parser.add_argument("--control", nargs="?", const="", metavar="位址",
+                        help="常駐模式開啟控制介面（Unix socket 路徑或 host:port）")
+    parser.add_argument("--metrics-port", type=int, metavar="埠號",
+                        help="於 127.0.0.1 提供 Prometheus 指標（GET /metrics）")
+    parser.add_argument("--metrics-file", metavar="路徑",
+                        help="定期將指標寫入 .prom 檔（node_exporter textfile collector）")
+    parser.add_argument("--trace", metavar="路徑",
+                        help="記錄各執行緒的時間軸，結束時寫成 Chrome trace-event JSON（Perfetto 檢視）")
+    parser.add_argument("--trace-sample", type=float, default=1.0, metavar="比例",
+                        help="逐項目階段的取樣比例（例如 0.01 為每 100 個記錄 1 個，較慢的項目一律記錄）")
+    parser.add_argument("--priority", choices=("low", "idle", "normal"), default="low",
+                        help="無視窗模式的 CPU/I/O 優先權（預設 low；idle 只在磁碟閒置時移動）")
+    parser.add_argument("--startup-time", action="store_true", help="回報匯入與首次繪製時間")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
 if __name__ == "__main__":
     os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+    args = _parse_args(sys.argv[1:])
+    if args.metrics_port or args.metrics_file:
+        import atexit
+        import metrics
+        for exporter in metrics.start_exporters(args.metrics_port, args.metrics_file):
+            atexit.register(exporter.stop)
+    if args.trace:
+        import atexit
+        import tracing
+        tracing.start(args.trace, args.trace_sample)
+        atexit.register(tracing.stop)
+    if args.scheduler or args.watch or args.daemon is not None or args.profile_run:
+        # 視窗模式於首次繪製後才設定（見 AutoMoveApp._configure_runtime）
+        import largefile
+        import ordering
+        import priority
+        import throttle
+        import transfer
+        throttle.load(SETTINGS_FILE)
+        largefile.configure(JOURNAL_FILE)
+        transfer.configure(JOURNAL_FILE)
+        ordering.configure(THROUGHPUT_FILE)
+        # 背景執行不與使用者搶 CPU 與磁碟；之後建立的執行緒沿用
+        priority.lower_process(args.priority)
+    if args.scheduler:
+        # 無視窗常駐排程（Linux 伺服器）
+        from scheduler import run_headless
+        sys.exit(run_headless(SCHEDULE_FILE, SCHEDULE_STATE_FILE, SETTINGS_FILE, TEMPLATES_FILE, STATS_FILE, JOURNAL_FILE))
+    if args.watch:
+        from watcher import run_headless
+        sys.exit(run_headless(args.watch, SETTINGS_FILE, TEMPLATES_FILE, STATS_FILE, JOURNAL_FILE))
+    if args.daemon is not None:
+        from daemon import run_headless
+        sys.exit(run_headless(args.daemon, SETTINGS_FILE, TEMPLATES_FILE, STATS_FILE, JOURNAL_FILE,
+                              args.interval, args.workers, args.per_device, args.control))
+    if args.profile_run:
+        import profiling
+        sys.exit(profiling.run_once(args.profile_run, SETTINGS_FILE, TEMPLATES_FILE, STATS_FILE, JOURNAL_FILE))
+    if args.ctl:
+        from control_api import run_client
+        sys.exit(run_client(args.ctl[0], args.ctl[1] if len(args.ctl) > 1 else None, args.control or None,
+                            args.dry_run))
     root = tb.Window(themename="darkly")
     app = AutoMoveApp(root)
+    if args.startup_time:
+        _report_startup_time(root, app)
     root.mainloop()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 事件合併
+將短時間內大量湧入的監看事件合併成一批，避免解壓縮數千個檔案時逐一處理
+
+- 同一路徑重複的事件只保留一次（保持第一次出現的順序）
+- 等待時間依事件間隔自動調整：事件密集時等到安靜下來，
+  但自第一個事件起最多只等 max_window 秒
+- 累積到 max_batch 個項目時立即送出
+- 處理失敗時以擁有者的 log 記錄，不中斷背景執行緒
+"""
+
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+
+class EventBatcher:
+    """合併事件並於背景執行緒呼叫 flush(項目清單)"""
+
+    def __init__(self, flush: Callable[[List[str]], None], min_window: float = 0.2,
+                 max_window: float = 2.0, max_batch: int = 5000, log: Callable = print):
+        self.flush = flush
+        self.log = log
+        self.min_window = min_window
+        self.max_window = max_window
+        self.max_batch = max_batch
+        self._items: Dict[str, None] = {}
+        self._first_at = 0.0
+        self._last_at = 0.0
+        self._gap = min_window  # 事件間隔的指數移動平均
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="ChroLensBatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, flush_pending: bool = True):
+        with self._cond:
+            self._stopped = True
+            pending = list(self._items) if flush_pending else []
+            self._items.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if pending:
+            self.flush(pending)
+
+    def add(self, item: str):
+        now = time.monotonic()
+        with self._cond:
+            if not self._items:
+                self._first_at = now
+            else:
+                self._gap = 0.8 * self._gap + 0.2 * (now - self._last_at)
+            self._last_at = now
+            self._items[item] = None
+            self._cond.notify()
+
+    def _quiet_window(self) -> float:
+        """事件間隔越長，需等待越久才能判定這一波已結束"""
+        return min(max(4 * self._gap, self.min_window), self.max_window)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._items:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                deadline = min(self._last_at + self._quiet_window(), self._first_at + self.max_window)
+                if now < deadline and len(self._items) < self.max_batch:
+                    self._cond.wait(deadline - now)
+                    continue
+                batch = list(self._items)
+                self._items.clear()
+                self._gap = self.min_window
+            try:
+                self.flush(batch)
+            except Exception as e:
+                self.log(f"監看事件處理失敗（{len(batch)} 個項目）：{e}")
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 控制介面
+讓外部自動化透過本機 socket 控制常駐程序，不必另外啟動新程序
+
+協定：每行一個 JSON 請求，回覆一行 JSON
+    {"cmd": "run", "profile": "下載"}            立即執行設定檔
+    {"cmd": "dry_run", "profile": "下載"}        只列出計畫，不移動
+    {"cmd": "stop", "profile": "下載"}           取消尚未開始的移動（省略 profile 為全部）
+    {"cmd": "progress"}                          各設定檔的待處理與累計數量、進行中的資料夾複製
+    {"cmd": "status"}                            同 progress
+    {"cmd": "summary", "profile": "下載"}        最近一次完成的摘要
+    {"cmd": "reload"}                            重新載入設定檔與規則
+回覆格式：{"ok": true, ...} 或 {"ok": false, "error": "..."}
+
+位址：支援 Unix socket 的平台預設為 $XDG_RUNTIME_DIR（或暫存資料夾）下的
+chrolens_sorting.sock；否則使用 127.0.0.1:47631。"host:port" 形式的位址一律使用 TCP。
+"""
+
+import os
+import json
+import socket
+import tempfile
+import threading
+import socketserver
+from typing import Callable, Dict, Optional, Tuple, Union
+
+DEFAULT_TCP_ADDRESS = ("127.0.0.1", 47631)
+DRY_RUN_PREVIEW = 200  # dry_run 最多回傳的項目數
+
+
+def default_address() -> str:
+    if hasattr(socket, "AF_UNIX"):
+        base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        return os.path.join(base, "chrolens_sorting.sock")
+    return f"{DEFAULT_TCP_ADDRESS[0]}:{DEFAULT_TCP_ADDRESS[1]}"
+
+
+def _parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """"host:port" 轉為 TCP 位址，其他視為 Unix socket 路徑"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and os.sep not in address:
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class DaemonControl:
+    """將控制指令對應到 SortDaemon 的操作"""
+
+    def __init__(self, daemon, reload_profiles: Callable[[], Dict]):
+        self.daemon = daemon
+        self.reload_profiles = reload_profiles
+
+    def handle(self, request: Dict) -> Dict:
+        cmd = request.get("cmd")
+        profile = request.get("profile")
+        handler = getattr(self, f"cmd_{cmd}", None)
+        if handler is None:
+            return {"ok": False, "error": f"未知的指令：{cmd}"}
+        if profile is not None and profile not in self.daemon.profiles:
+            return {"ok": False, "error": f"找不到設定檔：{profile}"}
+        return handler(profile, request)
+
+    def cmd_run(self, profile, request):
+        if request.get("dry_run"):
+            return self.cmd_dry_run(profile, request)
+        names = [profile] if profile else list(self.daemon.profiles)
+        for name in names:
+            self.daemon.trigger(name)
+        return {"ok": True, "started": names}
+
+    def cmd_dry_run(self, profile, request):
+        if not profile:
+            return {"ok": False, "error": "dry_run 需要指定 profile"}
+        moves = self.daemon.dry_run(profile)
+        if moves is None:
+            return {"ok": False, "error": "來源路徑無效"}
+        return {"ok": True, "count": len(moves), "moves": moves[:DRY_RUN_PREVIEW]}
+
+    def cmd_stop(self, profile, request):
+        return {"ok": True, "cancelled": self.daemon.cancel(profile)}
+
+    def cmd_progress(self, profile, request):
+        progress = self.daemon.progress()
+        if profile:
+            progress["profiles"] = {profile: progress["profiles"][profile]}
+        return {"ok": True, **progress}
+
+    cmd_status = cmd_progress
+
+    def cmd_summary(self, profile, request):
+        summaries = self.daemon.summaries
+        if profile:
+            return {"ok": True, "summary": summaries.get(profile)}
+        return {"ok": True, "summaries": summaries}
+
+    def cmd_reload(self, profile, request):
+        profiles = self.reload_profiles()
+        self.daemon.reload(profiles)
+        return {"ok": True, "profiles": list(profiles)}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line.decode("utf-8"))
+                response = self.server.control.handle(request)
+            except ValueError:
+                response = {"ok": False, "error": "無效的 JSON"}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, getattr(socketserver, "UnixStreamServer", object)):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ControlServer:
+    """在背景執行緒中接受控制連線"""
+
+    def __init__(self, control, address: Optional[str] = None, log: Callable = print):
+        self.control = control
+        self.address = address or default_address()
+        self._logger = log
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def start(self):
+        target = _parse_address(self.address)
+        if isinstance(target, tuple):
+            self._server = _TCPServer(target, _RequestHandler)
+        else:
+            if os.path.exists(target):
+                os.remove(target)  # 上次未正常結束留下的 socket 檔
+            # socket 檔在 bind 時就以 0600 建立，不留下其他使用者可連線的空檔
+            previous = os.umask(0o177)
+            try:
+                self._server = _UnixServer(target, _RequestHandler)
+            finally:
+                os.umask(previous)
+        self._server.control = self.control
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ChroLensControl", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            target = _parse_address(self.address)
+            if isinstance(target, str) and os.path.exists(target):
+                os.remove(target)
+            self._server = None
+
+
+class ControlClient:
+    """控制介面的用戶端（命令列 --ctl 與外部腳本使用）"""
+
+    def __init__(self, address: Optional[str] = None, timeout: float = 10.0):
+        self.address = address or default_address()
+        self.timeout = timeout
+
+    def call(self, cmd: str, **params) -> Dict:
+        target = _parse_address(self.address)
+        family = socket.AF_INET if isinstance(target, tuple) else socket.AF_UNIX
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(target)
+            request = {"cmd": cmd, **{k: v for k, v in params.items() if v is not None}}
+            sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        return json.loads(data.decode("utf-8"))
+
+
+def run_client(cmd: str, profile: Optional[str] = None, address: Optional[str] = None,
+               dry_run: bool = False) -> int:
+    """命令列：送出一個控制指令並印出回覆；dry_run 時 run 只列出計畫"""
+    try:
+        response = ControlClient(address).call(cmd, profile=profile, dry_run=True if dry_run else None)
+    except OSError as e:
+        print(f"無法連線到控制介面（{address or default_address()}）：{e}")
+        return 1
+    print(json.dumps(response, ensure_ascii=False, indent=2))
+    return 0 if response.get("ok") else 1
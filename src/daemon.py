@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 多來源常駐模式
+同時整理多個設定檔（各自的來源資料夾與規則），共用一組移動執行緒
+
+- 每個設定檔由自己的掃描執行緒定期掃描
+- 所有移動交給 SharedExecutor：各來源輪流取工作，避免單一來源獨佔
+- 同一個目的裝置（st_dev）同時進行的移動數有上限；來源最前面的工作所屬裝置已滿時，
+  往後找（最多 TAKE_LOOKAHEAD 個）其他裝置的工作，不讓整個來源停下來
+"""
+
+import os
+import time
+import itertools
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+import sorting_engine as engine
+import throttle
+import treecopy
+from space import device_of
+
+TAKE_LOOKAHEAD = 256  # 挑選工作時每個來源最多往後查看的數量
+
+
+class _Run:
+    """一次掃描提交的所有移動，全部完成後回呼一次"""
+
+    def __init__(self, profile: engine.SortProfile, total: int,
+                 on_done: Callable[[engine.SortProfile, engine.RunResult], None]):
+        self.profile = profile
+        self.remaining = total
+        self.result = engine.RunResult()
+        self.on_done = on_done
+        self._lock = threading.Lock()
+
+    def add(self, partial: engine.RunResult) -> bool:
+        with self._lock:
+            self.result.moved += partial.moved
+            self.result.failed += partial.failed
+            self.result.history.extend(partial.history)
+            for name, count in partial.mechanisms.items():
+                self.result.mechanisms[name] = self.result.mechanisms.get(name, 0) + count
+            self.remaining -= 1
+            return self.remaining == 0
+
+
+class SharedExecutor:
+    """所有來源共用的移動執行器"""
+
+    def __init__(self, workers: int = 4, per_device: int = 2, log: Callable = print):
+        self.workers = max(1, workers)
+        self.per_device = max(1, per_device)
+        self._logger = log
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()  # 設定檔名稱 → 待執行工作
+        self._next = 0  # 輪詢起點
+        self._active: Dict[int, int] = {}  # 裝置 → 進行中的移動數
+        self._devices: Dict[str, int] = {}  # 目的資料夾 → 裝置（快取）
+        self._in_flight = set()  # 已排入或執行中的來源路徑
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopped = False
+        self.reservations = engine.NameReservations()
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def start(self):
+        self._stopped = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"ChroLensWorker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            for q in self._queues.values():
+                q.clear()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads.clear()
+
+    def pending(self) -> Dict[str, int]:
+        """各來源尚未執行的工作數"""
+        with self._cond:
+            return {name: len(q) for name, q in self._queues.items()}
+
+    def active(self) -> int:
+        """目前正在執行的移動數"""
+        with self._cond:
+            return sum(self._active.values())
+
+    def cancel(self, name: Optional[str] = None) -> int:
+        """取消尚未開始的工作（不中斷進行中的移動），回傳取消數量"""
+        dropped = []
+        with self._cond:
+            for qname, q in self._queues.items():
+                if name is None or qname == name:
+                    dropped.extend(q)
+                    q.clear()
+            for run, move in dropped:
+                self._in_flight.discard((run.profile.source, move[0]))
+        for run, _ in dropped:
+            if run.add(engine.RunResult()):
+                run.on_done(run.profile, run.result)
+        return len(dropped)
+
+    def submit(self, profile: engine.SortProfile, moves: List[Tuple[str, str]],
+               on_done: Callable[[engine.SortProfile, engine.RunResult], None]) -> int:
+        """提交一個設定檔的移動；已在佇列中的項目會略過，回傳實際提交數"""
+        with self._cond:
+            fresh = [m for m in moves if (profile.source, m[0]) not in self._in_flight]
+            if not fresh:
+                return 0
+            run = _Run(profile, len(fresh), on_done)
+            q = self._queues.get(profile.name)
+            if q is None:
+                q = self._queues[profile.name] = deque()
+                metrics.QUEUE_DEPTH.labels(source=profile.name).set_function(q.__len__)
+            for move in fresh:
+                self._in_flight.add((profile.source, move[0]))
+                q.append((run, move))
+            self._cond.notify_all()
+        return len(fresh)
+
+    def _device(self, dest: str) -> int:
+        dev = self._devices.get(dest)
+        if dev is None:
+            dev = self._devices[dest] = device_of(dest)
+        return dev
+
+    def _take(self):
+        """依來源輪流挑選第一個目的裝置尚有空位的工作（需持有鎖）"""
+        names = list(self._queues)
+        for offset in range(len(names)):
+            name = names[(self._next + offset) % len(names)]
+            q = self._queues[name]
+            for index, (run, move) in enumerate(itertools.islice(q, TAKE_LOOKAHEAD)):
+                dev = self._device(move[1])
+                if self._active.get(dev, 0) >= self.per_device:
+                    continue
+                del q[index]
+                self._active[dev] = self._active.get(dev, 0) + 1
+                self._next = (self._next + offset + 1) % len(names)
+                return run, move, dev
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = None
+                while not self._stopped:
+                    task = self._take()
+                    if task:
+                        break
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            run, move, dev = task
+            profile = run.profile
+            try:
+                partial = engine.execute_moves(profile.source, [move], profile.conflict, self.log,
+                                               should_stop=lambda: self._stopped,
+                                               reservations=self.reservations, verify=profile.verify,
+                                               modes=engine.transfer_map(profile))
+            except Exception as e:
+                self.log(f"失敗：{move[0]}（{e}）")
+                partial = engine.RunResult()
+                partial.failed = 1
+            with self._cond:
+                self._active[dev] -= 1
+                self._in_flight.discard((profile.source, move[0]))
+                self._cond.notify_all()
+            if run.add(partial):
+                try:
+                    run.on_done(profile, run.result)
+                except Exception as e:
+                    self.log(f"記錄結果失敗：{e}")
+
+
+class SortDaemon:
+    """多來源常駐分類"""
+
+    def __init__(self, profiles: Dict[str, engine.SortProfile], executor: SharedExecutor,
+                 interval: float = 60.0, journal=None, stats_file: Optional[str] = None,
+                 log: Callable = print):
+        self.profiles = profiles
+        self.executor = executor
+        self.interval = interval
+        self.journal = journal
+        self.stats_file = stats_file
+        self._logger = log
+        self._threads: Dict[str, threading.Thread] = {}
+        self._wake: Dict[str, threading.Event] = {}
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._totals_lock = threading.Lock()  # 多個移動執行緒同時完成時保護 summaries 與 totals
+        # 設定檔名稱 → 最近一次完成的摘要；更新時整個替換，讀取端（控制介面）不需持有鎖
+        self.summaries: Dict[str, Dict] = {}
+        self.totals: Dict[str, Dict[str, int]] = {}  # 設定檔名稱 → 累計數量
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def start(self):
+        self._stop.clear()
+        self.executor.start()
+        for name in self.profiles:
+            self._start_profile(name)
+
+    def _start_profile(self, name: str):
+        self._wake[name] = threading.Event()
+        t = threading.Thread(target=self._scan_loop, args=(name,), name=f"ChroLensScan-{name}", daemon=True)
+        self._threads[name] = t
+        t.start()
+
+    def stop(self):
+        self._stop.set()
+        for event in self._wake.values():
+            event.set()
+        for t in self._threads.values():
+            t.join(timeout=5)
+        self.executor.stop()
+
+    def trigger(self, name: str) -> bool:
+        """立即掃描指定設定檔"""
+        event = self._wake.get(name)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def dry_run(self, name: str) -> Optional[List[Tuple[str, str]]]:
+        """只計算計畫，不移動任何檔案"""
+        profile = self.profiles.get(name)
+        if profile is None or not os.path.isdir(profile.source):
+            return None
+        return engine.plan_moves(profile)
+
+    def cancel(self, name: Optional[str] = None) -> int:
+        return self.executor.cancel(name)
+
+    def reload(self, profiles: Dict[str, engine.SortProfile]):
+        """以重新載入的設定檔取代現有設定：新增的開始掃描，移除的停止並取消其工作"""
+        removed = [name for name in self.profiles if name not in profiles]
+        self.profiles = profiles
+        for name in removed:
+            self.executor.cancel(name)
+            self._wake.pop(name).set()
+            self._threads.pop(name, None)
+        for name in profiles:
+            if name in self._threads:
+                self._wake[name].set()
+            else:
+                self._start_profile(name)
+
+    def progress(self) -> Dict:
+        pending = self.executor.pending()
+        with self._totals_lock:
+            totals = {name: dict(counts) for name, counts in self.totals.items()}
+        return {
+            "active": self.executor.active(),
+            "profiles": {
+                name: {
+                    "source": profile.source,
+                    "pending": pending.get(name, 0),
+                    **totals.get(name, {"moved": 0, "failed": 0}),
+                }
+                for name, profile in self.profiles.items()
+            },
+            "throttle": throttle.LIMITER.snapshot() if throttle.LIMITER else {},
+            "folders": treecopy.active(),
+        }
+
+    def _scan_loop(self, name: str):
+        from settle import SettleTracker, split_settled
+
+        tracker = None
+        event = self._wake[name]
+        while not self._stop.is_set():
+            profile = self.profiles.get(name)
+            if profile is None:
+                return
+            if tracker is None or tracker.window != profile.settle_seconds:
+                tracker = SettleTracker(profile.settle_seconds)
+                metrics.SETTLE_PENDING.labels(source=name).set_function(tracker.__len__)
+
+            if os.path.isdir(profile.source):
+                try:
+                    moves = engine.plan_moves(profile)
+                    ready, _, _ = split_settled(profile.source, moves, tracker)
+                    ready = list(ready)
+                    ready.extend(move for _, move in tracker.poll())
+                    ready = engine.check_space(profile, list(dict.fromkeys(ready)), self.log)
+                    if ready:
+                        count = self.executor.submit(profile, ready, self._on_done)
+                        if count:
+                            self.log(f"[{name}] 排入 {count} 個項目")
+                except Exception as e:
+                    self.log(f"[{name}] 掃描失敗：{e}")
+            else:
+                self.log(f"[{name}] 錯誤：來源路徑無效（{profile.source}）")
+
+            # 有待定檔案時提早醒來檢查
+            delay = tracker.next_delay()
+            wait = self.interval if delay is None else min(self.interval, delay)
+            event.wait(wait)
+            event.clear()
+
+    def _on_done(self, profile: engine.SortProfile, result: engine.RunResult):
+        self.log(f"[{profile.name}] 完成：{result.summary()}")
+        summary = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "moved": result.moved,
+            "failed": result.failed,
+        }
+        with self._totals_lock:
+            self.summaries = {**self.summaries, profile.name: summary}
+            totals = self.totals.setdefault(profile.name, {"moved": 0, "failed": 0})
+            totals["moved"] += result.moved
+            totals["failed"] += result.failed
+        if result.history and self.journal:
+            self.journal.record_batch(profile.name, profile.source, result)
+        if self.stats_file:
+            with self._stats_lock:
+                engine.record_stats(self.stats_file, result.moved)
+
+
+def run_headless(profile_names: List[str], settings_file: str, templates_file: str,
+                 stats_file: str, journal_file: str, interval: float = 60.0,
+                 workers: int = 4, per_device: int = 2,
+                 control_address: Optional[str] = None) -> int:
+    """無視窗模式：同時整理多個設定檔（未指定時使用所有設有來源的模板）"""
+    import time
+    from journal import shared
+
+    def load():
+        available = engine.load_profiles(settings_file, templates_file)
+        if profile_names:
+            missing = [n for n in profile_names if n not in available]
+            if missing:
+                print(f"找不到設定檔：{'、'.join(missing)}")
+            return {n: available[n] for n in profile_names if n in available}
+        return {n: p for n, p in available.items() if n != engine.DEFAULT_PROFILE and p.source}
+
+    profiles = load()
+    if not profiles:
+        print("沒有可執行的設定檔")
+        return 1
+
+    lock = threading.Lock()
+
+    def log(msg):
+        with lock:
+            print(msg, flush=True)
+
+    daemon = SortDaemon(profiles, SharedExecutor(workers, per_device, log), interval,
+                        shared(journal_file), stats_file, log)
+    daemon.start()
+    log(f"常駐整理：{'、'.join(profiles)}（{workers} 個執行緒，每個裝置最多 {per_device} 個）")
+    server = None
+    if control_address is not None:
+        from control_api import ControlServer, DaemonControl
+        server = ControlServer(DaemonControl(daemon, load), control_address or None, log)
+        server.start()
+        log(f"控制介面：{server.address}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        if server:
+            server.stop()
+        daemon.stop()
+    return 0
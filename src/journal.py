@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 執行日誌
+每一批移動在 move_journal.jsonl 中記錄為一行 JSON，供追查與復原
+
+同一個檔案請以 shared() 取得共用的 RunJournal，批次記錄與大檔案續傳點由同一個鎖依序寫入
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+
+_shared: Dict[str, "RunJournal"] = {}
+_shared_lock = threading.Lock()
+
+
+def shared(path: str) -> "RunJournal":
+    """同一個日誌檔案在程序中共用的 RunJournal"""
+    key = os.path.normcase(os.path.abspath(path))
+    with _shared_lock:
+        journal = _shared.get(key)
+        if journal is None:
+            journal = _shared[key] = RunJournal(path)
+        return journal
+
+
+class RunJournal:
+    """以 JSON Lines 附加寫入的移動日誌"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()  # 續傳點的讀取與更新也在鎖內，與附加寫入共用
+        self._checkpoints: Optional[Dict[str, Dict]] = None  # 來源路徑 → 最新的續傳點
+        self._copies: Optional[Dict[str, str]] = None  # 保留來源的方式：原始路徑 → 副本路徑
+
+    def _append(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+    def record_batch(self, profile: str, source: str, result) -> str:
+        """記錄一批移動（RunResult），回傳批次編號"""
+        batch_id = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+        self._append({
+            "type": "batch",
+            "id": batch_id,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "profile": profile,
+            "source": source,
+            "moved": result.moved,
+            "failed": result.failed,
+            "moves": result.history,
+        })
+        with self._lock:
+            if self._copies is not None:
+                self._index_copies(self._copies, result.history, True)
+        return batch_id
+
+    def record_undo(self, restored: int, moves: List):
+        self._append({
+            "type": "undo",
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "restored": restored,
+            "moves": moves,
+        })
+        with self._lock:
+            if self._copies is not None:
+                self._index_copies(self._copies, moves, False)
+
+    # ==================== 保留來源的傳送 ====================
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def _index_copies(self, copies: Dict[str, str], moves, add: bool):
+        for current, original, *rest in moves:
+            if not rest or rest[0] == "move":
+                continue
+            if add:
+                copies[self._key(original)] = current
+            else:
+                copies.pop(self._key(original), None)
+
+    def copied_to(self, src: str) -> Optional[str]:
+        """以複製、連結等方式處理過（且尚未復原）的來源，回傳最近一次的副本路徑"""
+        with self._lock:
+            if self._copies is None:
+                copies = {}
+                for record in self.read():
+                    kind = record.get("type")
+                    if kind in ("batch", "undo"):
+                        self._index_copies(copies, record.get("moves", []), kind == "batch")
+                self._copies = copies
+            return self._copies.get(self._key(src))
+
+    # ==================== 大檔案續傳點 ====================
+
+    def _load_checkpoints(self) -> Dict[str, Dict]:
+        with self._lock:
+            if self._checkpoints is None:
+                checkpoints = {}
+                for record in self.read():
+                    kind = record.get("type")
+                    if kind == "checkpoint":
+                        checkpoints[record["src"]] = record
+                    elif kind == "checkpoint_done":
+                        checkpoints.pop(record.get("src"), None)
+                self._checkpoints = checkpoints
+            return self._checkpoints
+
+    def record_checkpoint(self, src: str, dst: str, tmp: str, offset: int,
+                          size: int, mtime_ns: int, crc: int):
+        """記錄大檔案複製進度：暫存檔 tmp 已寫入並同步到 offset，crc 為來源前 offset 位元組的 CRC32"""
+        record = {
+            "type": "checkpoint",
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "src": src,
+            "dst": dst,
+            "tmp": tmp,
+            "offset": offset,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "crc": crc,
+        }
+        with self._lock:
+            self._load_checkpoints()[src] = record
+            self._append(record)
+
+    def clear_checkpoint(self, src: str):
+        """大檔案已完成（或放棄）時清除續傳點"""
+        with self._lock:
+            if self._load_checkpoints().pop(src, None) is None:
+                return
+            self._append({"type": "checkpoint_done", "time": time.strftime("%Y-%m-%d %H:%M:%S"), "src": src})
+
+    def checkpoint(self, src: str) -> Optional[Dict]:
+        with self._lock:
+            return self._load_checkpoints().get(src)
+
+    def read(self, limit: Optional[int] = None) -> List[Dict]:
+        """讀取最近的記錄"""
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records[-limit:] if limit else records
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 大檔案續傳複製
+跨裝置移動大檔案（例如數十 GB 的磁碟映像）時分段複製，中斷後下次從中斷處繼續
+
+- 先寫入目的資料夾中的暫存檔（檔名加上 PART_SUFFIX），每寫入 CHECKPOINT_BYTES
+  就同步到磁碟並在執行日誌記錄續傳點（位移與來源前段的 CRC32）
+- 複製期間以 CRC32 累計來源內容；完成後重新讀取暫存檔比對，一致才改名為正式檔名並刪除來源
+- 來源的大小或修改時間改變時捨棄續傳點，從頭複製
+- 每個續傳點檢查是否要求停止：停止時保留暫存檔與續傳點並拋出 Interrupted，下次從該處繼續
+- 續傳點寫入 journal.shared() 取得的執行日誌，同一個檔案的所有寫入共用一個鎖
+"""
+
+import os
+import zlib
+import shutil
+import time
+from typing import Callable, Optional
+
+import metrics
+import profiling
+from integrity import VerifyError, drop_cache
+
+LARGE_FILE = 256 * 1024 * 1024  # 超過此大小的檔案使用續傳複製
+CHUNK = 8 * 1024 * 1024  # 每次讀寫的大小
+CHECKPOINT_BYTES = 256 * 1024 * 1024  # 每寫入多少位元組記錄一次續傳點
+PART_SUFFIX = ".chrolens-part"
+
+JOURNAL = None  # journal.RunJournal，由 configure() 設定；未設定時不使用續傳複製
+
+
+class Interrupted(Exception):
+    """複製在續傳點停止（暫存檔與續傳點保留，下次從該處繼續）"""
+
+
+def configure(journal_file: Optional[str]):
+    """指定記錄續傳點的執行日誌（與其他記錄共用同一個 RunJournal）"""
+    global JOURNAL
+    if journal_file:
+        from journal import shared
+        JOURNAL = shared(journal_file)
+    else:
+        JOURNAL = None
+    return JOURNAL
+
+
+def should_use(src_path: str) -> bool:
+    if JOURNAL is None:
+        return False
+    try:
+        return os.path.getsize(src_path) >= LARGE_FILE
+    except OSError:
+        return False
+
+
+def file_crc(path: str) -> int:
+    """繞過快取重新讀取整個檔案的 CRC32"""
+    crc = 0
+    with open(path, "rb") as f:
+        drop_cache(f.fileno())
+        while True:
+            buf = f.read(CHUNK)
+            if not buf:
+                return crc
+            crc = zlib.crc32(buf, crc)
+
+
+def _resume_point(src_path: str, dst_path: str, tmp: str, st) -> tuple:
+    """回傳可續傳的 (位移, CRC32)；沒有可用的續傳點時為 (0, 0)"""
+    record = JOURNAL.checkpoint(src_path)
+    if record is None:
+        return 0, 0
+    if record.get("dst") != dst_path:
+        # 目的地已改變：舊的暫存檔不會再用到
+        try:
+            os.remove(record.get("tmp", ""))
+        except OSError:
+            pass
+        return 0, 0
+    offset = int(record.get("offset", 0))
+    if (record.get("size") != st.st_size or record.get("mtime_ns") != st.st_mtime_ns
+            or not os.path.exists(tmp) or os.path.getsize(tmp) < offset):
+        return 0, 0
+    return offset, int(record.get("crc", 0))
+
+
+def move(src_path: str, dst_path: str, throttle=None,
+         should_stop: Optional[Callable[[], bool]] = None) -> int:
+    """
+    以可續傳的方式將大檔案移到另一個裝置（throttle 為 throttle.DeviceThrottle），
+    回傳續傳時略過的位元組數；should_stop 在每個續傳點檢查，要求停止時拋出 Interrupted
+    """
+    st = os.stat(src_path)
+    tmp = dst_path + PART_SUFFIX
+    offset, crc = _resume_point(src_path, dst_path, tmp, st)
+    resumed = offset
+
+    since_checkpoint = 0
+    with open(src_path, "rb") as fsrc, open(tmp, "r+b" if offset else "wb") as fdst:
+        fsrc.seek(offset)
+        fdst.seek(offset)
+        fdst.truncate()
+        while True:
+            buf = fsrc.read(CHUNK)
+            if not buf:
+                break
+            if throttle is not None:
+                throttle.consume(len(buf))
+            fdst.write(buf)
+            crc = zlib.crc32(buf, crc)
+            offset += len(buf)
+            since_checkpoint += len(buf)
+            if since_checkpoint >= CHECKPOINT_BYTES:
+                fdst.flush()
+                os.fsync(fdst.fileno())
+                JOURNAL.record_checkpoint(src_path, dst_path, tmp, offset, st.st_size, st.st_mtime_ns, crc)
+                since_checkpoint = 0
+                if should_stop is not None and should_stop():
+                    raise Interrupted(f"已複製 {offset * 100 // max(st.st_size, 1)}%，下次從此處續傳")
+        fdst.flush()
+        os.fsync(fdst.fileno())
+
+    start = time.perf_counter()
+    with profiling.span("verify"):
+        ok = file_crc(tmp) == crc
+    metrics.PHASE_SECONDS.labels(phase="verify").observe(time.perf_counter() - start)
+    metrics.VERIFIED_BYTES.inc(st.st_size)
+    if not ok:
+        metrics.FAILURES.labels(stage="verify").inc()
+        os.remove(tmp)
+        JOURNAL.clear_checkpoint(src_path)
+        raise VerifyError(f"複製後內容不一致，已刪除暫存檔：{tmp}")
+
+    shutil.copystat(src_path, tmp)
+    os.replace(tmp, dst_path)
+    os.unlink(src_path)
+    JOURNAL.clear_checkpoint(src_path)
+    return resumed
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 執行指標
+以 Prometheus 文字格式輸出掃描、計畫、移動的耗時與數量，以及待處理的積壓
+
+輸出方式：
+- MetricsServer：本機 HTTP 端點（GET /metrics）
+- TextfileWriter：定期寫入檔案，供 node_exporter textfile collector 讀取
+"""
+
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        """沒有標籤的指標直接操作預設的子項"""
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._children.items())
+        for key, child in items:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.func: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, func: Callable[[], float]):
+        """輸出時才呼叫 func 取得數值（例如佇列長度）"""
+        self.func = func
+
+    def get(self) -> float:
+        if self.func is not None:
+            try:
+                return float(self.func())
+            except Exception:
+                return 0.0
+        return self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self.observe)
+
+
+class _Timer:
+    def __init__(self, observe: Callable[[float], None]):
+        self._observe = observe
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._observe(time.perf_counter() - self._start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, key, child):
+        lines = []
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """指標集合"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if not metric.labelnames:
+            metric.labels()  # 沒有標籤的指標一開始就輸出 0
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ==================== 預先定義的指標 ====================
+
+ENTRIES_SCANNED = REGISTRY.counter("chrolens_entries_scanned_total", "掃描到的項目數")
+FILES_MOVED = REGISTRY.counter("chrolens_files_moved_total", "成功移動的項目數")
+BYTES_MOVED = REGISTRY.counter("chrolens_bytes_moved_total", "移動的檔案位元組數")
+VERIFIED_BYTES = REGISTRY.counter("chrolens_verified_bytes_total", "複製後重新讀取驗證的位元組數")
+TRANSFERS = REGISTRY.counter("chrolens_transfers_total", "各傳送方式實際使用的方式（rename/copy/hardlink/reflink）",
+                            ("mode", "mechanism"))
+FILES_RESTORED = REGISTRY.counter("chrolens_files_restored_total", "復原的項目數")
+CONFLICTS = REGISTRY.counter("chrolens_conflicts_total", "目的地已存在同名項目的次數", ("mode",))
+FAILURES = REGISTRY.counter("chrolens_failures_total", "移動失敗的次數", ("stage",))
+# phase：scan、plan、execute（含衝突處理）、verify、undo；管線各階段對應到相同的名稱（見 pipeline.PHASE_OF_STAGE）
+PHASE_SECONDS = REGISTRY.histogram("chrolens_phase_duration_seconds", "各階段耗時（秒）", ("phase",))
+QUEUE_DEPTH = REGISTRY.gauge("chrolens_queue_depth", "等待執行的移動數", ("source",))
+SETTLE_PENDING = REGISTRY.gauge("chrolens_settle_pending", "等待穩定（下載中）的項目數", ("source",))
+PIPELINE_ITEMS = REGISTRY.counter("chrolens_pipeline_items_total", "管線各階段處理的項目數", ("stage",))
+PIPELINE_QUEUE_DEPTH = REGISTRY.gauge("chrolens_pipeline_queue_depth", "管線各階段輸入佇列中的區塊數", ("stage",))
+THROTTLE_WAIT = REGISTRY.counter("chrolens_throttle_wait_seconds_total", "因限速等待的秒數", ("device",))
+THROTTLE_LIMIT = REGISTRY.gauge("chrolens_throttle_limit_bytes_per_second",
+                                "目前生效的每秒位元組上限（0 為不限速）", ("device",))
+THROTTLE_RATE = REGISTRY.gauge("chrolens_throttle_rate_bytes_per_second", "最近幾秒實際的複製速率", ("device",))
+
+
+# ==================== 輸出 ====================
+
+class MetricsServer:
+    """本機 HTTP 端點：GET /metrics"""
+
+    def __init__(self, port: int, registry: Registry = REGISTRY, host: str = "127.0.0.1"):
+        self.port = port
+        self.host = host
+        self.registry = registry
+        self._server = None
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="ChroLensMetrics", daemon=True).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY):
+    """以原子方式寫入 .prom 檔（先寫暫存檔再取代）"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+class TextfileWriter:
+    """定期將指標寫入檔案"""
+
+    def __init__(self, path: str, interval: float = 15.0, registry: Registry = REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._loop, name="ChroLensMetricsFile", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._write()
+
+    def _write(self):
+        try:
+            write_textfile(self.path, self.registry)
+        except OSError:
+            pass
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+
+def start_exporters(port: Optional[int] = None, textfile: Optional[str] = None) -> List:
+    """依命令列參數啟動指標輸出，回傳已啟動的物件（結束時呼叫 stop）"""
+    exporters = []
+    if port:
+        server = MetricsServer(port)
+        server.start()
+        exporters.append(server)
+    if textfile:
+        writer = TextfileWriter(textfile)
+        writer.start()
+        exporters.append(writer)
+    return exporters
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 移動計畫
+以陣列欄位保存大量移動計畫，百萬個檔案時每個項目只佔數十位元組
+
+- 目的地與資料夾各自存成共用的字串表，項目只記錄編號
+- 檔名（不含資料夾）以 UTF-8 連續存放在同一個 bytearray
+- 規則編號、大小、旗標各為一個 array 欄位
+迭代時逐一產生 (相對路徑, 目的地)，與原本的 list[tuple] 用法相同。
+"""
+
+import os
+import copy
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+FLAG_DIR = 1  # 項目是資料夾
+UNKNOWN_SIZE = -1
+
+
+class MovePlan:
+    """
+    移動計畫
+
+    add() 依掃描順序加入項目，sort_by_rule() 再依規則優先順序排列：
+    規則由上到下，每條規則內保持掃描順序，「全部」（規則編號 -1）最後。
+    """
+
+    def __init__(self):
+        self._dests: List[str] = []
+        self._dest_index: Dict[str, int] = {}
+        self._dirs: List[str] = [""]
+        self._dir_index: Dict[str, int] = {"": 0}
+        self._blob = bytearray()
+        self._offsets = array("Q", [0])  # 第 i 個檔名為 _blob[_offsets[i]:_offsets[i + 1]]
+        self._dir_ids = array("I")
+        self._dest_ids = array("I")
+        self._rules = array("h")
+        self._flags = array("B")
+        self._sizes = array("q")
+        self._order: Optional[array] = None  # 輸出順序（記錄編號）；None 表示加入順序
+
+    # ==================== 建立 ====================
+
+    def add(self, name: str, dest: str, rule: int = -1, size: int = UNKNOWN_SIZE) -> int:
+        """加入一個項目（資料夾以 "/" 結尾），回傳記錄編號"""
+        is_dir = name.endswith("/")
+        name = name.rstrip("/")
+        head, sep, base = name.rpartition("/")
+        dir_id = self._dir_index.get(head)
+        if dir_id is None:
+            dir_id = self._dir_index[head] = len(self._dirs)
+            self._dirs.append(head + sep)
+        dest_id = self._intern(self._dests, self._dest_index, dest)
+
+        self._blob += base.encode("utf-8", "surrogateescape")
+        self._offsets.append(len(self._blob))
+        self._dir_ids.append(dir_id)
+        self._dest_ids.append(dest_id)
+        self._rules.append(rule)
+        self._flags.append(FLAG_DIR if is_dir else 0)
+        self._sizes.append(size)
+        self._order = None
+        return len(self._rules) - 1
+
+    def adder(self):
+        """回傳與 add() 相同、但省去屬性查找的函式（大量建立計畫時使用）"""
+        blob = self._blob
+        dirs, dir_index = self._dirs, self._dir_index
+        dests, dest_index = self._dests, self._dest_index
+        offsets_append = self._offsets.append
+        dir_append = self._dir_ids.append
+        dest_append = self._dest_ids.append
+        rule_append = self._rules.append
+        flag_append = self._flags.append
+        size_append = self._sizes.append
+        self._order = None
+
+        def add(name: str, dest: str, rule: int = -1, size: int = UNKNOWN_SIZE):
+            is_dir = name[-1:] == "/"
+            if is_dir:
+                name = name.rstrip("/")
+            head, sep, base = name.rpartition("/")
+            dir_id = dir_index.get(head)
+            if dir_id is None:
+                dir_id = dir_index[head] = len(dirs)
+                dirs.append(head + sep)
+            dest_id = dest_index.get(dest)
+            if dest_id is None:
+                dest_id = dest_index[dest] = len(dests)
+                dests.append(dest)
+            blob.extend(base.encode("utf-8", "surrogateescape"))
+            offsets_append(len(blob))
+            dir_append(dir_id)
+            dest_append(dest_id)
+            rule_append(rule)
+            flag_append(is_dir)
+            size_append(size)
+
+        return add
+
+    @staticmethod
+    def _intern(table: List[str], index: Dict[str, int], value: str) -> int:
+        idx = index.get(value)
+        if idx is None:
+            idx = index[value] = len(table)
+            table.append(value)
+        return idx
+
+    def sort_by_rule(self):
+        """依規則優先順序排列（穩定的計數排序）"""
+        rules = self._rules
+        keys = sorted(set(rules), key=lambda r: (r < 0, r))
+        counts = dict.fromkeys(keys, 0)
+        for r in rules:
+            counts[r] += 1
+        start = {}
+        total = 0
+        for r in keys:
+            start[r] = total
+            total += counts[r]
+        order = array("I", bytes(4 * len(rules)))
+        for i, r in enumerate(rules):
+            order[start[r]] = i
+            start[r] += 1
+        self._order = order
+
+    def sort_by(self, key: Callable[[str, str, int], object]):
+        """
+        依 key(目的地, 來源資料夾, 大小) 重新排列輸出順序（穩定排序，同鍵保持目前順序）；
+        來源資料夾不含結尾的 "/"（與 ordering.folder_of 相同）
+        """
+        dests, dirs = self._dests, [d.rstrip("/") for d in self._dirs]
+        dest_ids, dir_ids, sizes = self._dest_ids, self._dir_ids, self._sizes
+        records = range(len(self._rules)) if self._order is None else self._order
+        self._order = array("I", sorted(records, key=lambda i: key(dests[dest_ids[i]], dirs[dir_ids[i]], sizes[i])))
+
+    def retarget(self, pos: int, dest: str):
+        """改變某個位置的目的地（例如目的磁碟已滿時改用備用位置）"""
+        self._dest_ids[self._record(pos)] = self._intern(self._dests, self._dest_index, dest)
+
+    def take(self, positions) -> "MovePlan":
+        """依輸出位置取出子集合（共用欄位，不複製檔名）"""
+        view = copy.copy(self)
+        view._order = array("I", (self._record(p) for p in positions))
+        return view
+
+    # ==================== 讀取 ====================
+
+    def _record(self, pos: int) -> int:
+        return pos if self._order is None else self._order[pos]
+
+    def _name(self, i: int) -> str:
+        base = self._blob[self._offsets[i]:self._offsets[i + 1]].decode("utf-8", "surrogateescape")
+        return self._dirs[self._dir_ids[i]] + base
+
+    def __len__(self) -> int:
+        return len(self._rules) if self._order is None else len(self._order)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        dests = self._dests
+        dest_ids = self._dest_ids
+        records = range(len(self._rules)) if self._order is None else self._order
+        for i in records:
+            yield self._name(i), dests[dest_ids[i]]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[p] for p in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        i = self._record(key)
+        return self._name(i), self._dests[self._dest_ids[i]]
+
+    def rule_of(self, pos: int) -> int:
+        return self._rules[self._record(pos)]
+
+    def is_dir(self, pos: int) -> bool:
+        return bool(self._flags[self._record(pos)] & FLAG_DIR)
+
+    def size_of(self, pos: int) -> int:
+        return self._sizes[self._record(pos)]
+
+    def fill_sizes(self, src: str, dir_size: Optional[Callable[[str], int]] = None):
+        """以 lstat 補上未知的檔案大小；資料夾記為 dir_size(路徑)，未指定時為 0"""
+        for i in (range(len(self._rules)) if self._order is None else self._order):
+            if self._sizes[i] != UNKNOWN_SIZE:
+                continue
+            if self._flags[i] & FLAG_DIR:
+                self._sizes[i] = dir_size(os.path.join(src, self._name(i))) if dir_size else 0
+                continue
+            try:
+                self._sizes[i] = os.lstat(os.path.join(src, self._name(i))).st_size
+            except OSError:
+                pass
+
+    @property
+    def destinations(self) -> List[str]:
+        return list(self._dests)
+
+    def nbytes(self) -> int:
+        """欄位實際佔用的位元組數（不含字串表）"""
+        columns = (self._offsets, self._dir_ids, self._dest_ids, self._rules, self._flags, self._sizes)
+        total = len(self._blob) + sum(c.itemsize * len(c) for c in columns)
+        if self._order is not None:
+            total += self._order.itemsize * len(self._order)
+        return total
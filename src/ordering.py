@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 移動順序
+計畫預設依規則順序輸出，執行時會在不同的目的磁碟與資料夾之間來回切換；
+settings.json（或模板的 config）的 "order" 可改用以下順序：
+
+- rule：依規則順序（預設）
+- locality：依目的裝置、目的資料夾、來源資料夾分組，連續寫入同一處
+- small_first：小檔案優先，很快就能看到進度
+- large_first：大檔案優先，多個執行緒同時移動時較平均（常駐模式）
+- cost：依各裝置組合的歷史速度估計每個項目的耗時，短的優先，並回報預估總時間
+
+歷史速度記錄在 throughput.json：每個 (來源裝置, 目的裝置) 記錄每個檔案的固定成本與傳輸速率，
+以指數移動平均更新（小檔案反映固定成本，大檔案反映速率）。
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from space import device_of, entry_size
+
+ORDERS = ("rule", "locality", "small_first", "large_first", "cost")
+
+HISTORY: Optional["ThroughputHistory"] = None  # 由 configure() 設定；未設定時 cost 使用預設速度
+
+SMALL_FILE = 256 * 1024  # 小於此大小的檔案只用來估計固定成本
+ALPHA = 0.2  # 指數移動平均的權重
+SAVE_INTERVAL = 60.0  # 寫回 throughput.json 的最短間隔（秒）
+# 沒有歷史記錄時的預設值：(每個檔案的秒數, 每秒位元組數)
+SAME_DEVICE = (0.001, float("inf"))  # 同裝置只是改名，與大小無關
+CROSS_DEVICE = (0.01, 50 * 1024 * 1024)
+
+
+class ThroughputHistory:
+    """各 (來源裝置, 目的裝置) 的歷史移動速度"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pairs: Dict[str, Dict[str, float]] = {}
+        self._dirty = False
+        self._saved = time.monotonic()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._pairs = json.load(f).get("pairs", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def _key(src_dev: int, dst_dev: int) -> str:
+        return f"{src_dev}:{dst_dev}"
+
+    def _model(self, src_dev: int, dst_dev: int) -> Tuple[float, float]:
+        per_file, rate = SAME_DEVICE if src_dev == dst_dev else CROSS_DEVICE
+        pair = self._pairs.get(self._key(src_dev, dst_dev))
+        if pair:
+            per_file = pair.get("per_file", per_file)
+            rate = pair.get("bytes_per_sec", rate) or rate
+        return per_file, rate
+
+    def estimate(self, src_dev: int, dst_dev: int, size: int) -> float:
+        """估計移動一個 size 位元組的項目所需秒數"""
+        per_file, rate = self._model(src_dev, dst_dev)
+        return per_file + max(size, 0) / rate
+
+    def observe(self, src_dev: int, dst_dev: int, size: int, seconds: float):
+        """記錄一次實際移動的大小與耗時"""
+        with self._lock:
+            per_file, rate = self._model(src_dev, dst_dev)
+            pair = self._pairs.setdefault(self._key(src_dev, dst_dev), {"samples": 0})
+            if size < SMALL_FILE:
+                pair["per_file"] = per_file + ALPHA * (seconds - per_file)
+            else:
+                # 扣除固定成本，但至少以一半的耗時計算，避免估計偏低時算出不合理的速率
+                observed = size / max(seconds - per_file, seconds / 2, 1e-6)
+                pair["bytes_per_sec"] = observed if rate == float("inf") else rate + ALPHA * (observed - rate)
+            pair["samples"] = pair.get("samples", 0) + 1
+            self._dirty = True
+            due = time.monotonic() - self._saved >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"pairs": self._pairs}, ensure_ascii=False, indent=2)
+            self._dirty = False
+            self._saved = time.monotonic()
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except OSError:
+            pass
+
+
+def configure(history_file: Optional[str]) -> Optional[ThroughputHistory]:
+    """指定記錄歷史速度的檔案；結束時寫回尚未儲存的記錄"""
+    global HISTORY
+    HISTORY = ThroughputHistory(history_file) if history_file else None
+    if HISTORY is not None:
+        atexit.register(HISTORY.save)
+    return HISTORY
+
+
+# ==================== 記錄 ====================
+
+_dir_devices: Dict[str, int] = {}
+_DIR_CACHE_LIMIT = 4096
+
+
+def _dir_device(path: str) -> int:
+    folder = os.path.dirname(path)
+    dev = _dir_devices.get(folder)
+    if dev is None:
+        if len(_dir_devices) >= _DIR_CACHE_LIMIT:
+            _dir_devices.clear()
+        dev = _dir_devices[folder] = device_of(folder)
+    return dev
+
+
+def record(src_path: str, dst_path: str, size: int, seconds: float):
+    """移動完成後呼叫：更新來源與目的裝置組合的歷史速度"""
+    history = HISTORY
+    if history is not None:
+        history.observe(_dir_device(src_path), _dir_device(dst_path), size, seconds)
+
+
+# ==================== 排序 ====================
+
+def needs_size(order: str) -> bool:
+    return order in ("small_first", "large_first", "cost")
+
+
+def folder_of(name: str) -> str:
+    """項目所在的來源資料夾（相對路徑，不含結尾的 "/"，最上層為 ""），sort_key 的第二個參數"""
+    return name.rstrip("/").rpartition("/")[0]
+
+
+def sort_key(order: str, src: str) -> Callable[[str, str, int], tuple]:
+    """
+    回傳 key(目的地, 來源資料夾, 大小)；同鍵的項目保持原順序（排序是穩定的）。
+    來源資料夾一律以 folder_of() 的形式傳入，MovePlan 與 [(名稱, 目的地)] 兩種計畫的順序相同
+    """
+    devices: Dict[str, int] = {}
+
+    def dev(dest: str) -> int:
+        d = devices.get(dest)
+        if d is None:
+            d = devices[dest] = device_of(dest)
+        return d
+
+    if order == "locality":
+        return lambda dest, folder, size: (dev(dest), dest, folder)
+    if order == "small_first":
+        return lambda dest, folder, size: (size, dev(dest), dest)
+    if order == "large_first":
+        return lambda dest, folder, size: (-size, dev(dest), dest)
+    if order == "cost":
+        src_dev = device_of(src)
+        history = HISTORY or ThroughputHistory("")
+        return lambda dest, folder, size: (history.estimate(src_dev, dev(dest), size), dev(dest), dest)
+    raise ValueError(f"未知的移動順序：{order}")
+
+
+def estimate(moves_with_sizes, src: str) -> float:
+    """依歷史速度估計 [(名稱, 目的地, 大小)] 全部移動所需的秒數"""
+    history = HISTORY or ThroughputHistory("")
+    src_dev = device_of(src)
+    devices: Dict[str, int] = {}
+    total = 0.0
+    for _, dest, size in moves_with_sizes:
+        if dest not in devices:
+            devices[dest] = device_of(dest)
+        total += history.estimate(src_dev, devices[dest], size)
+    return total
+
+
+def order_plan(plan, order: str, src: str):
+    """依順序重新排列 MovePlan（rule 時不變）"""
+    if order == "rule" or not len(plan):
+        return plan
+    if needs_size(order):
+        plan.fill_sizes(src, entry_size)
+    plan.sort_by(sort_key(order, src))
+    return plan
+
+
+def order_moves(moves: List[Tuple[str, str]], order: str, src: str) -> Tuple[List[Tuple[str, str]], float]:
+    """
+    依順序重新排列 [(名稱, 目的地)]，回傳 (排列後的清單, 預估秒數)；
+    預估秒數只在 cost 時計算，其餘為 0
+    """
+    if order == "rule" or not moves:
+        return moves, 0.0
+    sized = [(name, dest, entry_size(os.path.join(src, name)) if needs_size(order) else 0)
+             for name, dest in moves]
+    key = sort_key(order, src)
+    sized.sort(key=lambda m: key(m[1], folder_of(m[0]), m[2]))
+    seconds = estimate(sized, src) if order == "cost" else 0.0
+    return [(name, dest) for name, dest, _ in sized], seconds
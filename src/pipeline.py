@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 移動管線
+列出、比對、衝突處理與移動分成四個階段，以有上限的佇列串接，
+列出資料夾與比對規則的同時就開始移動，磁碟不必等整份計畫完成
+
+    列出（執行緒）→ 比對（執行緒）→ 衝突處理（執行緒）→ 移動（呼叫端執行緒）
+
+- 佇列以區塊（數百個項目）為單位傳遞，下游來不及時上游會停下等待
+- 移動在呼叫端執行緒進行，GUI 的記錄與復原歷史仍由主執行緒處理；
+  背景執行（排程）時移動也在降低優先權的執行緒進行，呼叫端只負責輸出記錄
+- 每個階段記錄處理數量、忙碌/等待輸入/等待下游的時間與佇列深度
+- 設定檔指定移動順序時，比對階段每累積 ORDER_WINDOW 個項目排序一次（見 ordering.py）
+- 遞迴列出時不進入位於來源內的目的地與備用位置，剛移入的項目不會再被列出
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import metrics
+import ordering
+import priority
+import profiling
+import sorting_engine as engine
+import throttle
+import transfer
+from settle import SettleTracker, TEMP_SUFFIXES
+from space import SpaceBudget, device_of, entry_size
+
+CHUNK_SIZE = 256  # 每個區塊的項目數
+QUEUE_CHUNKS = 8  # 每個佇列最多容納的區塊數
+ORDER_WINDOW = 4096  # 指定移動順序時一次排序的項目數
+SUMMARY_THRESHOLD = 1000  # 項目超過此數量時在結束後記錄各階段摘要
+# 管線階段 → 階段耗時指標的名稱，與 sorting_engine 的 scan/plan/execute 相同（衝突處理屬於 execute）
+PHASE_OF_STAGE = {"scan": "scan", "match": "plan", "resolve": "execute", "execute": "execute"}
+
+_DONE = object()  # 上游結束的標記
+
+
+class StageStats:
+    """單一階段的統計：處理數量與時間分配"""
+
+    def __init__(self, name: str, inbox: Optional[queue.Queue] = None):
+        self.name = name
+        self.inbox = inbox  # 此階段的輸入佇列（列出階段沒有）
+        self.items = 0
+        self.busy = 0.0  # 處理項目的時間
+        self.idle = 0.0  # 等待上游的時間
+        self.blocked = 0.0  # 下游佇列已滿、等待放入的時間
+        self.max_depth = 0
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+        self._items_metric = metrics.PIPELINE_ITEMS.labels(stage=name)
+        if inbox is not None:
+            metrics.PIPELINE_QUEUE_DEPTH.labels(stage=name).set_function(inbox.qsize)
+
+    def depth(self) -> int:
+        return self.inbox.qsize() if self.inbox is not None else 0
+
+    def count(self, n: int):
+        self.items += n
+        self._items_metric.inc(n)
+        if self.inbox is not None:
+            self.max_depth = max(self.max_depth, self.inbox.qsize())
+
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.ended or time.perf_counter()) - self.started
+
+    def rate(self) -> float:
+        """每秒處理的項目數（以忙碌時間計算）"""
+        return self.items / self.busy if self.busy > 0 else 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy": round(self.busy, 4),
+            "idle": round(self.idle, 4),
+            "blocked": round(self.blocked, 4),
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "rate": round(self.rate(), 1),
+        }
+
+    def summary(self) -> str:
+        return (f"{self.name}：{self.items} 個，忙碌 {self.busy:.2f} 秒，"
+                f"等待輸入 {self.idle:.2f} 秒，等待下游 {self.blocked:.2f} 秒，"
+                f"佇列最深 {self.max_depth}")
+
+
+class PipelineResult(engine.RunResult):
+    """管線執行結果；另外記錄比對數量、待定與略過的暫存檔，以及各階段統計"""
+
+    def __init__(self):
+        super().__init__()
+        self.matched = 0
+        self.held = 0
+        self.skipped = 0
+        self.spilled = 0  # 因空間不足改用備用位置
+        self.no_space = 0  # 空間不足而未移動
+        self.stages: List[Dict] = []
+        self.throttle: Dict[str, Dict] = {}  # 各目的裝置的限速與實際速率
+        self.estimated = 0.0  # cost 順序依歷史速度預估的秒數
+
+
+class MovePipeline:
+    """
+    以管線方式執行一個設定檔
+
+    每個檔案仍歸給第一個符合的規則（「全部」最後），
+    但移動依列出順序進行，而不是先移完規則 1 再移規則 2；
+    設定檔指定移動順序時在每個排序視窗內依該順序進行。
+    """
+
+    def __init__(self, profile: engine.SortProfile, log: Callable = print,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 tracker: Optional[SettleTracker] = None,
+                 budget: Optional[SpaceBudget] = None,
+                 background: Optional[str] = None,
+                 chunk_size: int = CHUNK_SIZE, queue_chunks: int = QUEUE_CHUNKS):
+        self.profile = profile
+        self._logger = log
+        self.should_stop = should_stop
+        self.tracker = tracker if tracker is not None else SettleTracker(profile.settle_seconds)
+        self.chunk_size = chunk_size
+        self.background = background  # priority 的等級（"low"/"idle"）；None 為一般優先權
+        self.result = PipelineResult()
+        self.reservations = engine.NameReservations()
+        if profile.space_check != "off":
+            self.budget = budget if budget is not None else SpaceBudget()
+        else:
+            self.budget = None
+
+        self._stop = threading.Event()
+        self._messages = deque()  # 背景階段的記錄，交由呼叫端執行緒輸出
+        self._errors: List[str] = []
+        self._scan_out = queue.Queue(queue_chunks)
+        self._match_out = queue.Queue(queue_chunks)
+        self._resolve_out = queue.Queue(queue_chunks)
+        self.stages = [
+            StageStats("scan"),
+            StageStats("match", self._scan_out),
+            StageStats("resolve", self._match_out),
+            StageStats("execute", self._resolve_out),
+        ]
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def _defer(self, msg: str):
+        self._messages.append(msg)
+
+    def _flush_messages(self):
+        while self._messages:
+            self.log(self._messages.popleft())
+
+    def stats(self) -> List[Dict]:
+        """目前各階段的統計（可在執行中從其他執行緒讀取）"""
+        return [stage.snapshot() for stage in self.stages]
+
+    # ==================== 佇列 ====================
+
+    def _put(self, q: queue.Queue, chunk, stage: StageStats) -> bool:
+        """放入下游佇列；佇列已滿時等待，管線停止時回傳 False"""
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    q.put(chunk, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            stage.blocked += time.perf_counter() - start
+
+    def _get(self, q: queue.Queue, stage: StageStats):
+        """取出上游的下一個區塊；上游結束或管線停止時回傳 _DONE"""
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            stage.idle += time.perf_counter() - start
+
+    def _worker(self, stage: StageStats, body: Callable, out: queue.Queue):
+        if self.background:
+            priority.lower_thread(self.background)
+        stage.started = time.perf_counter()
+        try:
+            body(stage, out)
+        except Exception as e:
+            self._errors.append(f"{stage.name} 階段錯誤：{e}")
+            self._stop.set()
+        finally:
+            stage.ended = time.perf_counter()
+            self._put(out, _DONE, stage)
+
+    # ==================== 各階段 ====================
+
+    def _scan(self, stage: StageStats, out: queue.Queue):
+        chunk = []
+        start = time.perf_counter()
+        with profiling.span("scan"):
+            for name in engine.iter_entries(self.profile.source, self.profile.recursive,
+                                            self.profile.destination_roots()):
+                chunk.append(name)
+                if len(chunk) >= self.chunk_size:
+                    stage.busy += time.perf_counter() - start
+                    stage.count(len(chunk))
+                    metrics.ENTRIES_SCANNED.inc(len(chunk))
+                    if not self._put(out, chunk, stage):
+                        return
+                    chunk = []
+                    start = time.perf_counter()
+        stage.busy += time.perf_counter() - start
+        if chunk:
+            stage.count(len(chunk))
+            metrics.ENTRIES_SCANNED.inc(len(chunk))
+            self._put(out, chunk, stage)
+
+    def _match(self, stage: StageStats, out: queue.Queue):
+        rules = engine.CompiledRules(self.profile)
+        capture = profiling.ACTIVE
+        match = rules.match if capture is None else capture.timed_match(rules)
+        src = self.profile.source
+        tracker = self.tracker
+        result = self.result
+        ordered = self.profile.order != "rule"
+        window = []
+
+        while True:
+            chunk = self._get(self._scan_out, stage)
+            if chunk is _DONE:
+                if window and not self._stop.is_set():
+                    self._put_ordered(window, stage, out)
+                return
+            start = time.perf_counter()
+            ready = []
+            with profiling.span("plan"):
+                for name in chunk:
+                    hit = match(name)
+                    if hit is None:
+                        continue
+                    result.matched += 1
+                    name = name.rstrip("/")
+                    path = os.path.join(src, name)
+                    if name.lower().endswith(TEMP_SUFFIXES):
+                        result.skipped += 1
+                    elif tracker.is_settled(path):
+                        ready.append((name, hit[1]))
+                    else:
+                        tracker.hold(path, (name, hit[1]))
+                        result.held += 1
+            stage.busy += time.perf_counter() - start
+            stage.count(len(chunk))
+            if ordered:
+                window.extend(ready)
+                if len(window) >= ORDER_WINDOW:
+                    ready, window = window, []
+                    if not self._put_ordered(ready, stage, out):
+                        return
+                continue
+            if ready and not self._put(out, ready, stage):
+                return
+
+    def _put_ordered(self, moves, stage: StageStats, out: queue.Queue) -> bool:
+        """依設定檔的移動順序排列一個視窗的項目，再分成區塊放入下游"""
+        start = time.perf_counter()
+        moves, seconds = ordering.order_moves(moves, self.profile.order, self.profile.source)
+        self.result.estimated += seconds
+        stage.busy += time.perf_counter() - start
+        for i in range(0, len(moves), self.chunk_size):
+            if not self._put(out, moves[i:i + self.chunk_size], stage):
+                return False
+        return True
+
+    def _admit(self, src_dev: int, name: str, dest: str, overflow: Dict[str, str]):
+        """預扣目的裝置的空間，回傳 (目的地, 位元組數)；放不下時目的地為 None"""
+        budget = self.budget
+        if budget is None or budget.device(dest) == src_dev:
+            return dest, 0
+        size = entry_size(os.path.join(self.profile.source, name))
+        target = budget.choose(src_dev, dest, size, overflow)
+        if target is None:
+            self.result.no_space += 1
+            if self.profile.space_check == "reject":
+                self._defer(f"空間不足，停止移動：{name}（{dest}）")
+                self._stop.set()
+        elif target != dest:
+            self.result.spilled += 1
+        return target, size
+
+    def _resolve(self, stage: StageStats, out: queue.Queue):
+        src = self.profile.source
+        conflict = self.profile.conflict
+        src_dev = device_of(src)
+        overflow = engine.overflow_map(self.profile)
+        modes = engine.transfer_map(self.profile)
+        while True:
+            chunk = self._get(self._match_out, stage)
+            if chunk is _DONE:
+                return
+            start = time.perf_counter()
+            targets = []
+            for name, dest in chunk:
+                mode = transfer.mode_for(modes, dest)  # 改用備用位置時沿用原規則的傳送方式
+                dest, size = self._admit(src_dev, name, dest, overflow)
+                if dest is None:
+                    if self._stop.is_set():
+                        break
+                    continue
+                target = engine.prepare_move(src, name, dest, conflict, self._defer, self.reservations, mode)
+                if not target and size:
+                    self.budget.refund(dest, size)
+                targets.append((name, target, mode))
+            stage.busy += time.perf_counter() - start
+            stage.count(len(chunk))
+            if not self._put(out, targets, stage):
+                return
+
+    def _execute(self, stage: StageStats):
+        result = self.result
+        log = self._defer if self.background else self.log
+        stage.started = time.perf_counter()
+        while True:
+            chunk = self._get(self._resolve_out, stage)
+            if not self.background:
+                self._flush_messages()
+            if chunk is _DONE:
+                break
+            start = time.perf_counter()
+            done = 0
+            for name, target, mode in chunk:
+                if self.should_stop and self.should_stop():
+                    log("已停止移動")
+                    self._stop.set()
+                    break
+                done += 1
+                if not target:
+                    if target is None:
+                        result.failed += 1
+                    continue
+                profiling.item(name)
+                engine.perform_move(target[0], target[1], name, result, log,
+                                    reservations=self.reservations, verify=self.profile.verify, mode=mode,
+                                    should_stop=self.should_stop)
+            stage.busy += time.perf_counter() - start
+            stage.count(done)
+            if self._stop.is_set():
+                break
+        stage.ended = time.perf_counter()
+
+    def _execute_background(self, stage: StageStats):
+        priority.lower_thread(self.background)
+        try:
+            self._execute(stage)
+        except Exception as e:
+            self._errors.append(f"{stage.name} 階段錯誤：{e}")
+            self._stop.set()
+
+    # ==================== 執行 ====================
+
+    def _reject_preflight(self) -> bool:
+        """
+        space_check 為 reject 時先計算整批所需空間：管線邊列出邊移動，
+        到第一個放不下的項目才停止會留下移動了一半的批次。回傳 True 表示整批取消；
+        與比對階段相同，暫存檔與尚未穩定的項目不列入（它們這次不會移動）
+        """
+        from space import preflight
+
+        src = self.profile.source
+        plan = engine.plan_moves(self.profile)
+        movable = [(name, dest) for name, dest in plan
+                   if not name.rstrip("/").lower().endswith(TEMP_SUFFIXES)
+                   and self.tracker.is_settled(os.path.join(src, name.rstrip("/")))]
+        _, _, rejected = preflight(src, movable, engine.overflow_map(self.profile), "reject", self.log)
+        if rejected:
+            self.result.matched = len(plan)
+            self.result.no_space = rejected
+        return bool(rejected)
+
+    def run(self) -> PipelineResult:
+        if self.budget is not None and self.profile.space_check == "reject" and self._reject_preflight():
+            return self.result
+        bodies = (self._scan, self._match, self._resolve)
+        outputs = (self._scan_out, self._match_out, self._resolve_out)
+        threads = []
+        for stage, body, out in zip(self.stages, bodies, outputs):
+            t = threading.Thread(target=self._worker, args=(stage, body, out),
+                                 name=f"ChroLensPipeline-{stage.name}", daemon=True)
+            t.start()
+            threads.append(t)
+
+        try:
+            if self.background:
+                executor = threading.Thread(target=self._execute_background, args=(self.stages[3],),
+                                            name="ChroLensPipeline-execute", daemon=True)
+                executor.start()
+                while executor.is_alive():
+                    executor.join(0.1)
+                    self._flush_messages()
+            else:
+                self._execute(self.stages[3])
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join()
+            self._flush_messages()
+
+        for err in self._errors:
+            self.log(err)
+        if self.result.spilled:
+            self.log(f"目的磁碟空間不足，{self.result.spilled} 個項目改用備用位置")
+        if self.result.no_space and self.profile.space_check != "reject":
+            self.log(f"略過空間不足的項目：{self.result.no_space} 個")
+        if self.result.estimated >= 1.0:
+            self.log(f"預估 {self.result.estimated:.1f} 秒，實際 {self.stages[3].elapsed():.1f} 秒")
+        if self.profile.transfer and self.result.mechanisms:
+            self.log(f"傳送方式：{self.result.mechanism_summary()}")
+        phases: Dict[str, float] = {}
+        for stage in self.stages:
+            phase = PHASE_OF_STAGE[stage.name]
+            phases[phase] = phases.get(phase, 0.0) + stage.busy
+        for phase, busy in phases.items():
+            metrics.PHASE_SECONDS.labels(phase=phase).observe(busy)
+        self.result.stages = self.stats()
+        if self.result.matched >= SUMMARY_THRESHOLD:
+            for stage in self.stages:
+                self.log(stage.summary())
+        if throttle.LIMITER is not None:
+            self.result.throttle = throttle.LIMITER.snapshot()
+            for line in throttle.LIMITER.describe():
+                self.log(f"限速 {line}")
+        return self.result
+
+
+def run_pipeline(profile: engine.SortProfile, log: Callable = print,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 tracker: Optional[SettleTracker] = None,
+                 background: Optional[str] = None) -> PipelineResult:
+    """
+    以管線執行設定檔一次；tracker 未指定時尚未穩定的檔案留給下一次，
+    background 指定時各階段以較低的 CPU 與 I/O 優先權執行
+    """
+    return MovePipeline(profile, log, should_stop, tracker, background=background).run()
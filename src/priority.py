@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 背景優先權
+排程、監看與命令列執行時降低 CPU 與 I/O 優先權，避免影響正在使用電腦的人
+
+- Linux：nice 加上 ioprio_set（以 ctypes 呼叫系統呼叫）設定 I/O 類別
+- Windows：執行緒/行程的背景模式（同時降低 CPU 與 I/O 優先權）
+- 其他平台只調整 nice；不支援的部分略過，不影響移動
+- 使用者按下「移動」時維持一般優先權
+"""
+
+import os
+import sys
+import ctypes
+import platform
+import contextlib
+from typing import Callable, List, Optional
+
+LEVELS = ("low", "idle", "normal")
+
+# Linux ioprio
+IOPRIO_CLASS_BE = 2  # best-effort
+IOPRIO_CLASS_IDLE = 3  # 磁碟閒置時才執行
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1  # who=0 表示呼叫的執行緒
+_SYSCALLS = {  # (ioprio_set, ioprio_get)
+    "x86_64": (251, 252),
+    "amd64": (251, 252),
+    "i386": (289, 290),
+    "i686": (289, 290),
+    "aarch64": (30, 31),
+    "arm64": (30, 31),
+    "armv7l": (314, 315),
+}
+
+# 各等級的 (nice 增量, I/O 類別, I/O 等級)
+_PROFILES = {
+    "low": (10, IOPRIO_CLASS_BE, 7),
+    "idle": (19, IOPRIO_CLASS_IDLE, 0),
+}
+
+# Windows
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+THREAD_MODE_BACKGROUND_END = 0x00020000
+PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+
+_libc = None
+
+
+def _syscall(index: int, *args) -> int:
+    """呼叫 ioprio 系統呼叫；不支援時回傳 -1"""
+    global _libc
+    numbers = _SYSCALLS.get(platform.machine().lower())
+    if not sys.platform.startswith("linux") or numbers is None:
+        return -1
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    return _libc.syscall(numbers[index], *args)
+
+
+def get_io_priority() -> Optional[int]:
+    """目前執行緒的 ioprio 值；不支援時回傳 None"""
+    value = _syscall(1, IOPRIO_WHO_PROCESS, 0)
+    return None if value < 0 else value
+
+
+def set_io_priority(io_class: int, level: int = 0, value: Optional[int] = None) -> bool:
+    """設定目前執行緒的 I/O 類別與等級（新建立的執行緒會沿用）"""
+    if value is None:
+        value = (io_class << IOPRIO_CLASS_SHIFT) | level
+    return _syscall(0, IOPRIO_WHO_PROCESS, 0, value) == 0
+
+
+def _windows_thread_background(begin: bool) -> bool:
+    try:
+        kernel32 = ctypes.windll.kernel32
+        mode = THREAD_MODE_BACKGROUND_BEGIN if begin else THREAD_MODE_BACKGROUND_END
+        return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), mode))
+    except (AttributeError, OSError):
+        return False
+
+
+def lower_thread(level: str = "low") -> List[str]:
+    """
+    降低目前執行緒的 CPU 與 I/O 優先權，回傳實際套用的項目
+
+    Linux 的 nice 與 ioprio 都以執行緒為單位，之後由此執行緒建立的執行緒也會沿用；
+    一般使用者無法再調回，只應在專用的執行緒或背景程序中呼叫。
+    """
+    if level not in _PROFILES:
+        return []
+    nice, io_class, io_level = _PROFILES[level]
+    applied = []
+    if sys.platform == "win32":
+        if _windows_thread_background(True):
+            applied.append("背景模式")
+        return applied
+    if sys.platform.startswith("linux"):
+        try:
+            os.nice(nice)  # Linux 上只影響目前執行緒
+            applied.append(f"nice +{nice}")
+        except OSError:
+            pass
+        if set_io_priority(io_class, io_level):
+            applied.append("I/O 閒置" if io_class == IOPRIO_CLASS_IDLE else f"I/O best-effort {io_level}")
+    return applied
+
+
+def lower_process(level: str = "low", log: Callable = print) -> List[str]:
+    """背景程序啟動時呼叫：降低整個程序（含之後建立的執行緒）的優先權"""
+    if level not in _PROFILES:
+        return []
+    applied = []
+    if sys.platform == "win32":
+        try:
+            kernel32 = ctypes.windll.kernel32
+            if kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN):
+                applied.append("背景模式")
+        except (AttributeError, OSError):
+            pass
+    elif sys.platform.startswith("linux"):
+        applied = lower_thread(level)  # 主執行緒設定後，其他執行緒建立時沿用
+    else:
+        try:
+            os.nice(_PROFILES[level][0])
+            applied.append(f"nice +{_PROFILES[level][0]}")
+        except (AttributeError, OSError):
+            pass
+    if applied:
+        log(f"背景優先權：{'、'.join(applied)}")
+    else:
+        log("此平台不支援調整優先權，以一般優先權執行")
+    return applied
+
+
+@contextlib.contextmanager
+def background(level: str = "low"):
+    """
+    暫時降低目前執行緒的 I/O 優先權，結束後還原（GUI 主執行緒使用）
+
+    CPU 的 nice 調低後無法還原，因此這裡只調整 I/O；Windows 使用可還原的執行緒背景模式。
+    """
+    if level not in _PROFILES:
+        yield
+        return
+    if sys.platform == "win32":
+        begun = _windows_thread_background(True)
+        try:
+            yield
+        finally:
+            if begun:
+                _windows_thread_background(False)
+        return
+    previous = get_io_priority()
+    _, io_class, io_level = _PROFILES[level]
+    lowered = previous is not None and set_io_priority(io_class, io_level)
+    try:
+        yield
+    finally:
+        if lowered:
+            set_io_priority(0, value=previous)
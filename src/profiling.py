@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 效能分析
+找出一次執行的時間花在哪裡：列出檔案、規則比對、衝突處理還是實際移動
+
+- span(名稱)：包住各階段；沒有進行分析時幾乎沒有額外成本
+- RunCapture：對單次執行記錄各階段耗時、每條規則的比對時間，
+  並擷取 cProfile 與 tracemalloc 快照，寫到執行日誌旁
+"""
+
+import os
+import time
+import datetime
+import threading
+import contextlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+ACTIVE: Optional["RunCapture"] = None  # 目前進行中的分析（一次只有一個）
+TRACER = None  # tracing.Tracer，由 tracing.start() 設定
+
+_NULL_SPAN = contextlib.nullcontext()
+MEMORY_TOP = 25  # tracemalloc 報告列出的行數
+
+
+def span(name: str):
+    """計時一個階段；沒有進行分析或記錄時間軸時回傳空的 context manager"""
+    if ACTIVE is None and TRACER is None:
+        return _NULL_SPAN
+    return _Span(ACTIVE, TRACER, name)
+
+
+def item(name: str):
+    """逐項目處理前呼叫，讓時間軸決定是否取樣此項目"""
+    tracer = TRACER
+    if tracer is not None:
+        tracer.next_item(name)
+
+
+class _Span:
+    def __init__(self, capture: Optional["RunCapture"], tracer, name: str):
+        self.capture = capture
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        if self.capture is not None:
+            self.capture.add(self.name, end - self._start)
+        if self.tracer is not None:
+            self.tracer.record(self.name, self._start, end)
+        return False
+
+
+class RunCapture:
+    """
+    單次執行的效能擷取
+
+    用法：
+        with RunCapture(輸出資料夾, "下載") as capture:
+            ...執行移動...
+        capture.paths  # 寫出的檔案
+    """
+
+    def __init__(self, out_dir: str, label: str = "", log: Callable = print):
+        self.out_dir = out_dir
+        self.label = label
+        self._logger = log
+        self.phases: Dict[str, List[float]] = {}  # 階段 → [次數, 總秒數]
+        self.rules: Dict[int, List[float]] = {}  # 規則編號 → [比對次數, 總秒數, 符合次數]
+        self.paths: List[str] = []
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._started_tracemalloc = False
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, None, name)
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def timed_match(self, rules) -> Callable[[str], Optional[Tuple[int, str]]]:
+        """回傳與 CompiledRules.match 相同行為、但逐條規則計時的比對函式"""
+        stats = self.rules
+        clock = time.perf_counter
+
+        def match(name: str):
+            base = name.rstrip("/").rsplit("/", 1)[-1] + ("/" if name.endswith("/") else "")
+            for idx, matcher, dest in rules.rules:
+                start = clock()
+                hit = matcher(base)
+                entry = stats.get(idx)
+                if entry is None:
+                    entry = stats[idx] = [0, 0.0, 0]
+                entry[0] += 1
+                entry[1] += clock() - start
+                if hit:
+                    entry[2] += 1
+                    return idx, dest
+            if rules.all_dest:
+                return -1, rules.all_dest
+            return None
+
+        return match
+
+    # ==================== 開始/結束 ====================
+
+    def __enter__(self):
+        global ACTIVE
+        import cProfile
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+        ACTIVE = self
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        global ACTIVE
+        import tracemalloc
+
+        self._profiler.disable()
+        ACTIVE = None
+        elapsed = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        try:
+            self._write(elapsed, snapshot, peak)
+            self.log(f"效能分析已寫入：{self.paths[0]}")
+        except OSError as e:
+            self.log(f"效能分析寫入失敗：{e}")
+        return False
+
+    # ==================== 輸出 ====================
+
+    def _write(self, elapsed: float, snapshot, peak: int):
+        import io
+        import pstats
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(self.out_dir, f"run_profile_{stamp}")
+
+        summary = base + ".txt"
+        prof = base + ".prof"
+        memory = base + "_memory.txt"
+
+        self._profiler.dump_stats(prof)
+
+        lines = [f"設定檔：{self.label}", f"總耗時：{elapsed:.3f} 秒", "", "[階段]"]
+        for name, (count, total) in sorted(self.phases.items(), key=lambda kv: -kv[1][1]):
+            lines.append(f"{name:<10} {total:>10.4f} 秒  {int(count):>8} 次  平均 {total / count * 1000:.3f} ms")
+        if self.rules:
+            lines += ["", "[規則比對]"]
+            for idx, (count, total, hits) in sorted(self.rules.items()):
+                lines.append(f"規則 {idx + 1:<4} {total:>10.4f} 秒  比對 {int(count):>8} 次  符合 {int(hits)} 次")
+        lines += ["", "[cProfile：累計時間前 30 名]"]
+        buf = io.StringIO()
+        pstats.Stats(self._profiler, stream=buf).sort_stats("cumulative").print_stats(30)
+        lines.append(buf.getvalue())
+        with open(summary, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+        mem_lines = [f"記憶體峰值：{peak / 1024:.1f} KiB", "", f"[配置位置前 {MEMORY_TOP} 名]"]
+        for stat in snapshot.statistics("lineno")[:MEMORY_TOP]:
+            mem_lines.append(str(stat))
+        with open(memory, "w", encoding="utf-8") as f:
+            f.write("\n".join(mem_lines) + "\n")
+
+        self.paths = [summary, prof, memory]
+
+
+def run_once(profile_name: str, settings_file: str, templates_file: str,
+             stats_file: str, journal_file: str) -> int:
+    """命令列：在分析下執行一次設定檔，報告寫到執行日誌所在的資料夾"""
+    from sorting_engine import load_profiles, run_profile, record_stats
+    from journal import shared
+
+    profile = load_profiles(settings_file, templates_file).get(profile_name)
+    if profile is None:
+        print(f"找不到設定檔：{profile_name}")
+        return 1
+    out_dir = os.path.dirname(os.path.abspath(journal_file))
+    with RunCapture(out_dir, profile.name):
+        result = run_profile(profile)
+    print(f"完成：{result.summary()}（{profile_name}）")
+    if result.history:
+        shared(journal_file).record_batch(profile.name, profile.source, result)
+    record_stats(stats_file, result.moved)
+    return 0
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 排程器
+在常駐程序內以 cron 表示式定時執行設定檔，取代 Windows schtasks
+
+- 單一計時執行緒 + 最小堆積，所有排程共用
+- 每個排程的下次執行時間保存在 schedule_state.json
+- 睡眠/關機期間錯過的排程於恢復後補執行一次
+- 舊版 "HH:MM" 項目第一次載入時移除對應的 schtasks 工作並改存為新格式，
+  避免舊工作在同一時間再開一個程式，同一個排程執行兩次
+"""
+
+import os
+import json
+import heapq
+import datetime
+import threading
+from typing import Optional, Callable, Dict, List, Union
+
+from sorting_engine import DEFAULT_PROFILE
+
+
+class CronExpression:
+    """
+    五欄位 cron 表示式：分 時 日 月 週
+
+    支援 *、數值、範圍 a-b、清單 a,b、間隔 */n 與 a-b/n，
+    以及 @hourly/@daily/@weekly/@monthly 與舊版 "HH:MM" 格式。
+    週欄位 0 與 7 皆為星期日。
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+    ALIASES = {
+        "@hourly": "0 * * * *",
+        "@daily": "0 0 * * *",
+        "@midnight": "0 0 * * *",
+        "@weekly": "0 0 * * 0",
+        "@monthly": "0 0 1 * *",
+    }
+
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        text = self.ALIASES.get(self.expr, self.expr)
+        if ":" in text and " " not in text:
+            # 舊版排程格式 "HH:MM" → 每日執行
+            hour, minute = text.split(":")
+            text = f"{int(minute)} {int(hour)} * * *"
+        fields = text.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表示式需要 5 個欄位：{expr}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, lo, hi, is_weekday=(i == 4))
+            for i, (field, (lo, hi)) in enumerate(zip(fields, self.RANGES))
+        ]
+        self._dom_any = fields[2] == "*"
+        self._dow_any = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int, is_weekday: bool = False) -> frozenset:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+                if step <= 0:
+                    raise ValueError(f"間隔必須大於 0：{field}")
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = (int(x) for x in part.split("-", 1))
+            else:
+                start = int(part)
+                end = hi if step > 1 else start
+            if is_weekday:
+                end = min(end, 7)
+            if start < lo or end > (7 if is_weekday else hi) or start > end:
+                raise ValueError(f"欄位超出範圍：{field}")
+            for v in range(start, end + 1, step):
+                values.add(0 if is_weekday and v == 7 else v)
+        return frozenset(values)
+
+    def _day_matches(self, dt: datetime.datetime) -> bool:
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._dom_any and self._dow_any:
+            return True
+        if self._dom_any:
+            return dow
+        if self._dow_any:
+            return dom
+        return dom or dow  # 兩者皆指定時，cron 的語意為「任一符合」
+
+    def matches(self, dt: datetime.datetime) -> bool:
+        return (dt.minute in self.minutes and dt.hour in self.hours
+                and dt.month in self.months and self._day_matches(dt))
+
+    def next_after(self, dt: datetime.datetime) -> datetime.datetime:
+        """回傳嚴格晚於 dt 的下一個符合時間"""
+        t = dt.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = t + datetime.timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                year, month = (t.year + 1, 1) if t.month == 12 else (t.year, t.month + 1)
+                t = t.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+                continue
+            if t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            if t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+                continue
+            return t
+        raise ValueError(f"cron 表示式沒有可執行的時間：{self.expr}")
+
+    def __str__(self):
+        return self.expr
+
+
+class ScheduledJob:
+    """一筆排程：cron 表示式 + 設定檔名稱"""
+
+    def __init__(self, cron: str, profile: str = DEFAULT_PROFILE):
+        self.cron = CronExpression(cron)
+        self.profile = profile
+        self.next_run: Optional[datetime.datetime] = None
+        self.last_run: Optional[datetime.datetime] = None
+
+    @property
+    def job_id(self) -> str:
+        return f"{self.profile}|{self.cron}"
+
+    @classmethod
+    def from_entry(cls, entry: Union[str, Dict]) -> "ScheduledJob":
+        """由 schedule_times.json 的項目建立（舊版為 "HH:MM" 字串）"""
+        if isinstance(entry, str):
+            return cls(entry)
+        return cls(entry["cron"], entry.get("profile", DEFAULT_PROFILE))
+
+    def to_entry(self) -> Dict:
+        # 一律存為新格式：檔案中的字串項目代表尚未移除 schtasks 工作的舊版排程
+        return {"cron": str(self.cron), "profile": self.profile}
+
+    def describe(self) -> str:
+        if self.profile == DEFAULT_PROFILE:
+            return str(self.cron)
+        return f"{self.cron}  →  {self.profile}"
+
+
+def delete_legacy_task(time_str: str):
+    """移除舊版以 schtasks 建立的 Windows 工作排程"""
+    if os.name != "nt" or ":" not in time_str:
+        return
+    import subprocess
+    task_name = f"ChroLensSorting_{time_str.replace(':', '')}"
+    try:
+        subprocess.run(f'schtasks /Delete /TN "{task_name}" /F', shell=True, capture_output=True)
+    except Exception:
+        pass
+
+
+def load_schedule_entries(schedule_file: str, log: Callable = print) -> List[Union[str, Dict]]:
+    """讀取 schedule_times.json；含舊版 "HH:MM" 項目時移除其 schtasks 工作並寫回新格式"""
+    entries = []
+    if os.path.exists(schedule_file):
+        try:
+            with open(schedule_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception:
+            pass
+    legacy = [entry for entry in entries if isinstance(entry, str)]
+    if not legacy:
+        return entries
+    for time_str in legacy:
+        delete_legacy_task(time_str)
+    entries = [{"cron": entry, "profile": DEFAULT_PROFILE} if isinstance(entry, str) else entry
+               for entry in entries]
+    try:
+        with open(schedule_file, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        log(f"已將 {len(legacy)} 個舊版排程改由本程式執行（移除 Windows 工作排程）")
+    except OSError:
+        pass
+    return entries
+
+
+def save_schedule_entries(schedule_file: str, jobs: List[ScheduledJob]):
+    with open(schedule_file, "w", encoding="utf-8") as f:
+        json.dump([job.to_entry() for job in jobs], f, ensure_ascii=False)
+
+
+class Scheduler:
+    """
+    常駐排程器
+
+    所有排程放在同一個以下次執行時間排序的堆積中，由單一執行緒等待；
+    每次最多睡 max_sleep 秒以偵測系統睡眠造成的時鐘跳躍。
+    """
+
+    def __init__(self, state_file: str, run_callback: Callable[[str], None],
+                 log: Callable = print, max_sleep: float = 60.0):
+        self.state_file = state_file
+        self.run_callback = run_callback
+        self._logger = log
+        self.max_sleep = max_sleep
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._heap = []  # [(next_run, job_id)]
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    # ==================== 排程管理 ====================
+
+    def set_jobs(self, jobs: List[ScheduledJob]):
+        """以新的排程清單取代現有排程，保留已知的下次執行時間"""
+        state = self._load_state()
+        now = datetime.datetime.now()
+        with self._cond:
+            self._jobs.clear()
+            for job in jobs:
+                saved = state.get(job.job_id, {})
+                job.last_run = _parse_time(saved.get("last_run"))
+                job.next_run = _parse_time(saved.get("next_run")) or job.cron.next_after(now)
+                self._jobs[job.job_id] = job
+            self._rebuild_heap()
+            self._cond.notify()
+        self._save_state()
+
+    def add(self, job: ScheduledJob):
+        with self._cond:
+            job.next_run = job.cron.next_after(datetime.datetime.now())
+            self._jobs[job.job_id] = job
+            self._rebuild_heap()
+            self._cond.notify()
+        self._save_state()
+        self.log(f"建立排程：{job.describe()}（下次 {job.next_run:%Y-%m-%d %H:%M}）")
+
+    def remove(self, job_id: str):
+        with self._cond:
+            job = self._jobs.pop(job_id, None)
+            self._rebuild_heap()
+            self._cond.notify()
+        self._save_state()
+        if job:
+            self.log(f"刪除排程：{job.describe()}")
+
+    def jobs(self) -> List[ScheduledJob]:
+        with self._cond:
+            return list(self._jobs.values())
+
+    def _rebuild_heap(self):
+        self._heap = [(job.next_run, job_id) for job_id, job in self._jobs.items()]
+        heapq.heapify(self._heap)
+
+    # ==================== 執行緒 ====================
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="ChroLensScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self):
+        while True:
+            due = []
+            with self._cond:
+                if self._stopped:
+                    return
+                now = datetime.datetime.now()
+                while self._heap and self._heap[0][0] <= now:
+                    _, job_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(job_id)
+                    if job is None:
+                        continue
+                    # 錯過多次時只補執行一次，再從現在起算下一次
+                    job.last_run = now
+                    job.next_run = job.cron.next_after(now)
+                    heapq.heappush(self._heap, (job.next_run, job_id))
+                    due.append(job)
+                if not due:
+                    wait = self.max_sleep
+                    if self._heap:
+                        wait = min(wait, max((self._heap[0][0] - now).total_seconds(), 0.5))
+                    self._cond.wait(wait)
+                    continue
+            self._save_state()
+            for job in due:
+                self.log(f"排程觸發：{job.describe()}")
+                try:
+                    self.run_callback(job.profile)
+                except Exception as e:
+                    self.log(f"排程執行失敗：{e}")
+
+    # ==================== 狀態保存 ====================
+
+    def _load_state(self) -> Dict:
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception:
+                pass
+        return {}
+
+    def _save_state(self):
+        with self._cond:
+            state = {
+                job_id: {
+                    "profile": job.profile,
+                    "cron": str(job.cron),
+                    "next_run": job.next_run.isoformat() if job.next_run else None,
+                    "last_run": job.last_run.isoformat() if job.last_run else None,
+                }
+                for job_id, job in self._jobs.items()
+            }
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            self.log(f"排程狀態儲存失敗：{e}")
+
+
+def _parse_time(text: Optional[str]) -> Optional[datetime.datetime]:
+    if not text:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def run_headless(schedule_file: str, state_file: str, settings_file: str,
+                 templates_file: str, stats_file: str, journal_file: str) -> int:
+    """無視窗模式：常駐執行 schedule_times.json 中的排程（Linux 伺服器使用）"""
+    from sorting_engine import load_profiles, run_profile, record_stats
+    from journal import shared
+
+    journal = shared(journal_file)
+
+    def run(profile_name: str):
+        profiles = load_profiles(settings_file, templates_file)
+        profile = profiles.get(profile_name)
+        if profile is None:
+            print(f"找不到設定檔：{profile_name}")
+            return
+        result = run_profile(profile)
+        print(f"完成：{result.summary()}（{profile_name}）")
+        if result.history:
+            journal.record_batch(profile.name, profile.source, result)
+        record_stats(stats_file, result.moved)
+
+    scheduler = Scheduler(state_file, run)
+    jobs = []
+    for entry in load_schedule_entries(schedule_file):
+        try:
+            jobs.append(ScheduledJob.from_entry(entry))
+        except (ValueError, KeyError) as e:
+            print(f"略過無效排程 {entry}：{e}")
+    scheduler.set_jobs(jobs)
+    for job in scheduler.jobs():
+        print(f"排程：{job.describe()}（下次 {job.next_run:%Y-%m-%d %H:%M}）")
+    scheduler.start()
+    try:
+        while scheduler._thread.is_alive():
+            scheduler._thread.join(timeout=1)
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
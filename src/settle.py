@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 檔案穩定偵測
+避免移動仍在下載或寫入中的檔案
+
+- 瀏覽器/下載器的暫存檔（.crdownload、.part 等）一律略過
+- 最後修改時間距今不足穩定時間的項目先放入待定清單，
+  之後只以 stat 檢查大小與修改時間，連續不變滿穩定時間才放行
+- 監看模式以 BatchSettler 整批等待：一批事件全部穩定後才一起移動，
+  一批只產生一次移動、一筆執行日誌與一筆復原記錄
+"""
+
+import os
+import time
+import itertools
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# 下載中暫存檔的副檔名
+TEMP_SUFFIXES = (
+    ".crdownload",  # Chrome / Edge
+    ".part",        # Firefox
+    ".partial",     # 舊版 Edge
+    ".download",    # Safari
+    ".opdownload",  # Opera
+    ".tmp",
+    ".!ut",         # uTorrent
+    ".!qb",         # qBittorrent
+    ".aria2",
+)
+
+
+def is_temp_download(path: str) -> bool:
+    """是否為下載中的檔案：本身是暫存檔，或旁邊還有同名暫存檔（Firefox 會先建立空的正式檔）"""
+    lowered = path.rstrip("/\\").lower()
+    if lowered.endswith(TEMP_SUFFIXES):
+        return True
+    base = path.rstrip("/\\")
+    return any(os.path.exists(base + suffix) for suffix in (".part", ".crdownload", ".aria2"))
+
+
+class SettleTracker:
+    """待定清單：記錄每個項目的 (大小, 修改時間) 與開始穩定的時間點"""
+
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self._pending: Dict[str, Tuple[Tuple[int, int], float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return path in self._pending
+
+    def is_settled(self, path: str) -> bool:
+        """掃描時的快速判斷：修改時間已超過穩定時間且非暫存檔"""
+        if self.window <= 0:
+            return not is_temp_download(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return time.time() - st.st_mtime >= self.window and not is_temp_download(path)
+
+    def hold(self, path: str, payload: Any = None):
+        """放入待定清單，payload 會在穩定後原樣回傳"""
+        try:
+            st = os.stat(path)
+            sig = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            return
+        with self._lock:
+            if path in self._pending:
+                old_sig, since, _ = self._pending[path]
+                if old_sig == sig:
+                    self._pending[path] = (sig, since, payload)
+                    return
+            self._pending[path] = (sig, time.monotonic(), payload)
+
+    def poll(self) -> List[Tuple[str, Any]]:
+        """以 stat 重新檢查待定項目，回傳已穩定的 [(路徑, payload)]；消失的項目直接移除"""
+        now = time.monotonic()
+        settled = []
+        with self._lock:
+            for path, (sig, since, payload) in list(self._pending.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del self._pending[path]
+                    continue
+                current = (st.st_size, st.st_mtime_ns)
+                if current != sig:
+                    self._pending[path] = (current, now, payload)
+                elif now - since >= self.window and not is_temp_download(path):
+                    del self._pending[path]
+                    settled.append((path, payload))
+        return settled
+
+    def next_delay(self) -> Optional[float]:
+        """距離最早可能穩定的項目還有幾秒；沒有待定項目時回傳 None"""
+        with self._lock:
+            if not self._pending:
+                return None
+            earliest = min(since for _, since, _ in self._pending.values())
+        return max(0.2, min(self.window - (time.monotonic() - earliest), self.window))
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+
+def split_settled(src: str, moves, tracker: SettleTracker):
+    """
+    將計畫分成可立即移動與待定兩部分
+
+    回傳 (可移動的計畫, 放入待定的數量, 略過的暫存檔數量)；
+    傳入 MovePlan 時可移動的部分也是 MovePlan，否則為 list。
+    待定項目的 payload 為原本的 (名稱, 目的地)。
+    """
+    ready = array("I")  # 可移動項目的位置
+    held = 0
+    skipped = 0
+    for pos, (name, dest) in enumerate(moves):
+        path = os.path.join(src, name)
+        if name.lower().endswith(TEMP_SUFFIXES):
+            skipped += 1
+        elif tracker.is_settled(path):
+            ready.append(pos)
+        else:
+            tracker.hold(path, (name, dest))
+            held += 1
+    if hasattr(moves, "take"):
+        return moves.take(ready), held, skipped
+    return [moves[pos] for pos in ready], held, skipped
+
+
+class BatchSettler:
+    """
+    以整批為單位等待穩定（監看模式使用）：EventBatcher 合併的一批項目中有尚未穩定者時，
+    整批放入待定，全部穩定（或已消失）後才一起回傳；待定項目的 payload 為 (名稱, 目的地, 批次編號)
+    """
+
+    def __init__(self, tracker: SettleTracker):
+        self.tracker = tracker
+        self._batches: Dict[int, Tuple[Set[str], List[Tuple[str, str]]]] = {}  # 編號 → (等待中的路徑, 可移動項目)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, src: str, moves) -> Tuple[List[Tuple[str, str]], int, int]:
+        """
+        加入一批 [(名稱, 目的地)]，回傳 (可立即移動的整批, 放入待定的數量, 略過的暫存檔數量)；
+        有項目放入待定時整批留到 collect() 才回傳
+        """
+        batch = next(self._ids)
+        ready, waiting, skipped = [], set(), 0
+        for name, dest in moves:
+            path = os.path.join(src, name)
+            if name.lower().endswith(TEMP_SUFFIXES):
+                skipped += 1
+            elif self.tracker.is_settled(path):
+                ready.append((name, dest))
+            else:
+                self.tracker.hold(path, (name, dest, batch))
+                waiting.add(path)
+        if not waiting:
+            return ready, 0, skipped
+        with self._lock:
+            self._batches[batch] = (waiting, ready)
+        return [], len(waiting), skipped
+
+    def collect(self, settled: List[Tuple[str, Any]]):
+        """
+        處理 tracker.poll() 的結果，回傳 (已全部穩定的批次清單, 不屬於任何批次的項目)；
+        已不在待定清單中（消失或被清除）的項目不再等待
+        """
+        loose = []
+        with self._lock:
+            for path, payload in settled:
+                entry = self._batches.get(payload[2]) if len(payload) > 2 else None
+                if entry is None:
+                    loose.append(payload[:2])
+                    continue
+                entry[0].discard(path)
+                entry[1].append(payload[:2])
+            done = []
+            for batch, (waiting, ready) in list(self._batches.items()):
+                waiting.difference_update([p for p in waiting if p not in self.tracker])
+                if not waiting:
+                    del self._batches[batch]
+                    if ready:
+                        done.append(ready)
+        return done, loose
+
+    def clear(self):
+        with self._lock:
+            self._batches.clear()
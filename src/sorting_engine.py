@@ -0,0 +1,646 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 分類引擎
+不依賴 GUI 的規則比對與檔案移動，供主程式、排程器等共用
+"""
+
+import os
+import json
+import time
+import shutil
+import datetime
+import threading
+from typing import Optional, Callable, Dict, Iterable, Iterator, List, Set, Tuple
+
+import integrity
+import largefile
+import metrics
+import ordering
+import profiling
+import throttle
+import transfer
+import treecopy
+from move_plan import MovePlan
+
+FOLDER_PATTERN = "[資料夾]"
+DEFAULT_PROFILE = "目前設定"  # settings.json 所代表的設定檔名稱
+
+
+def match_pattern(filename: str, pattern: str) -> bool:
+    """匹配檔案（資料夾以 "/" 結尾）"""
+    if pattern == FOLDER_PATTERN:
+        return filename.endswith("/")
+    elif pattern.startswith("."):
+        return filename.lower().endswith(pattern.lower()) and not filename.endswith("/")
+    else:
+        return pattern.lower() in filename.lower()
+
+
+class CompiledRules:
+    """
+    預先整理好的規則清單，可對單一檔案快速比對
+
+    規則由上到下比對，第一個符合的規則勝出；都不符合時使用「全部」。
+    """
+
+    def __init__(self, profile: "SortProfile"):
+        self.rules = []  # [(規則編號, 比對函式, 目的地)]
+        for idx, (ext, dst) in enumerate(profile.rules):
+            if not ext or not dst:
+                continue
+            self.rules.append((idx, self._compile(ext), resolve_dest_path(dst, profile.auto_subfolder)))
+        self.all_dest = profile.all_dest if profile.all_enabled and profile.all_dest else None
+
+    @staticmethod
+    def _compile(pattern: str) -> Callable[[str], bool]:
+        if pattern == FOLDER_PATTERN:
+            return lambda name: name.endswith("/")
+        lowered = pattern.lower()
+        if pattern.startswith("."):
+            return lambda name: not name.endswith("/") and name.lower().endswith(lowered)
+        return lambda name: lowered in name.lower()
+
+    def match(self, name: str) -> Optional[Tuple[int, str]]:
+        """
+        比對單一項目（相對路徑，資料夾以 "/" 結尾），回傳 (規則編號, 目的地)；
+        由「全部」接收時規則編號為 -1，都不符合時回傳 None
+        """
+        base = name.rstrip("/").rsplit("/", 1)[-1] + ("/" if name.endswith("/") else "")
+        for idx, matcher, dest in self.rules:
+            if matcher(base):
+                return idx, dest
+        if self.all_dest:
+            return -1, self.all_dest
+        return None
+
+
+class SortProfile:
+    """一組分類規則與其來源資料夾"""
+
+    def __init__(self, name: str, source: str, rules: List[Tuple[str, str]],
+                 all_enabled: bool = False, all_dest: str = "",
+                 auto_subfolder: bool = False, conflict: str = "skip",
+                 recursive: bool = False, settle_seconds: float = 5.0,
+                 overflow: Optional[Dict[str, str]] = None, space_check: str = "trim",
+                 verify: bool = False, transfer: Optional[Dict[str, str]] = None,
+                 order: str = "rule"):
+        self.name = name
+        self.source = source
+        self.rules = [(ext.strip(), dst.strip()) for ext, dst in rules]
+        self.all_enabled = all_enabled
+        self.all_dest = all_dest.strip()
+        self.auto_subfolder = auto_subfolder
+        self.conflict = conflict
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds  # 大小與修改時間需穩定的秒數
+        # 目的地 → 備用位置：目的磁碟空間不足時改移到備用位置
+        self.overflow = {k.strip(): v.strip() for k, v in (overflow or {}).items() if k.strip() and v.strip()}
+        self.space_check = space_check if space_check in ("trim", "reject", "off") else "trim"
+        self.verify = bool(verify)  # 跨裝置複製後驗證內容才刪除來源
+        # 目的地 → 傳送方式（move/copy/hardlink/reflink，見 transfer.py），未列出的目的地為移動
+        self.transfer = {k.strip(): v for k, v in (transfer or {}).items()
+                         if k.strip() and v in ("move", "copy", "hardlink", "reflink")}
+        self.order = order if order in ordering.ORDERS else "rule"  # 移動順序（見 ordering.py）
+
+    def destination_roots(self) -> List[str]:
+        """所有目的地與備用位置（遞迴掃描時不進入位於來源內的目的地）"""
+        roots = [dst for _, dst in self.rules if dst]
+        if self.all_enabled and self.all_dest:
+            roots.append(self.all_dest)
+        roots.extend(self.overflow.values())
+        return roots
+
+    @classmethod
+    def from_settings(cls, data: Dict, name: str = DEFAULT_PROFILE) -> "SortProfile":
+        """由 settings.json 格式建立"""
+        return cls(
+            name=name,
+            source=data.get("source", ""),
+            rules=list(zip(data.get("extensions", []), data.get("destinations", []))),
+            all_enabled=data.get("all_enabled", False),
+            all_dest=data.get("all_dest", ""),
+            auto_subfolder=data.get("auto_subfolder", False),
+            conflict=data.get("conflict", "skip"),
+            recursive=data.get("recursive", False),
+            settle_seconds=_to_float(data.get("settle_seconds"), 5.0),
+            overflow=data.get("overflow"),
+            space_check=data.get("space_check", "trim"),
+            verify=data.get("verify", False),
+            transfer=data.get("transfer"),
+            order=data.get("order", "rule"),
+        )
+
+    @classmethod
+    def from_template(cls, name: str, template: Dict) -> "SortProfile":
+        """由 templates.json 中的模板建立"""
+        config = template.get("config", {})
+        return cls(
+            name=name,
+            source=config.get("source", ""),
+            rules=list(zip(template.get("extensions", []), template.get("destinations", []))),
+            all_enabled=config.get("all_enabled", False),
+            all_dest=config.get("all_dest", ""),
+            auto_subfolder=config.get("auto_subfolder", False),
+            conflict=config.get("conflict", "skip"),
+            recursive=config.get("recursive", False),
+            settle_seconds=_to_float(config.get("settle_seconds"), 5.0),
+            overflow=config.get("overflow"),
+            space_check=config.get("space_check", "trim"),
+            verify=config.get("verify", False),
+            transfer=config.get("transfer"),
+            order=config.get("order", "rule"),
+        )
+
+
+def _to_float(value, default: float) -> float:
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def load_profiles(settings_file: str, templates_file: str) -> Dict[str, SortProfile]:
+    """載入目前設定與所有模板，回傳 {名稱: SortProfile}"""
+    profiles = {}
+    if os.path.exists(settings_file):
+        try:
+            with open(settings_file, "r", encoding="utf-8") as f:
+                profiles[DEFAULT_PROFILE] = SortProfile.from_settings(json.load(f))
+        except Exception:
+            pass
+    if os.path.exists(templates_file):
+        try:
+            with open(templates_file, "r", encoding="utf-8") as f:
+                for name, template in json.load(f).items():
+                    profiles[name] = SortProfile.from_template(name, template)
+        except Exception:
+            pass
+    return profiles
+
+
+def list_entries(path: str, recursive: bool = False, exclude: Iterable[str] = ()) -> List[str]:
+    """
+    取得檔案列表（資料夾以 "/" 結尾）
+
+    遞迴模式下會進入子資料夾，回傳 "子資料夾/檔名" 形式的相對路徑，
+    子資料夾本身不再列為項目。exclude 中位於來源內的資料夾（通常是目的地）不列出也不進入。
+    """
+    with metrics.PHASE_SECONDS.labels(phase="scan").time(), profiling.span("scan"):
+        files = list(iter_entries(path, recursive, exclude))
+    metrics.ENTRIES_SCANNED.inc(len(files))
+    return files
+
+
+def _inside(path: str, exclude: Iterable[str]) -> Set[str]:
+    """exclude 中位於 path 之內的資料夾，以相對於 path 的路徑表示"""
+    base = os.path.realpath(path)
+    inside = set()
+    for folder in exclude:
+        try:
+            rel = os.path.relpath(os.path.realpath(folder), base)
+        except ValueError:  # Windows 上不同磁碟機
+            continue
+        if rel != os.curdir and rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+            inside.add(os.path.normcase(rel))
+    return inside
+
+
+def excluded_matcher(path: str, exclude: Iterable[str]) -> Callable[[str], bool]:
+    """回傳判斷完整路徑是否位於 exclude 中（且在 path 之內）的資料夾的函式（監看模式使用）"""
+    skip = _inside(path, exclude) if exclude else set()
+    base = os.path.abspath(path)
+
+    def excluded(full: str) -> bool:
+        if not skip:
+            return False
+        rel = os.path.normcase(os.path.relpath(full, base))
+        while rel and rel != os.curdir:
+            if rel in skip:
+                return True
+            rel = os.path.dirname(rel)
+        return False
+
+    return excluded
+
+
+def iter_entries(path: str, recursive: bool = False, exclude: Iterable[str] = ()) -> Iterator[str]:
+    """與 list_entries 相同的項目，邊列出邊產生（管線模式使用）"""
+    skip = _inside(path, exclude) if exclude else set()
+    if not recursive:
+        for f in os.listdir(path):
+            if os.path.isdir(os.path.join(path, f)):
+                if os.path.normcase(f) not in skip:
+                    yield f + "/"
+            else:
+                yield f
+        return
+
+    for root, dirs, names in os.walk(path):
+        rel = os.path.relpath(root, path)
+        prefix = "" if rel == "." else rel.replace(os.sep, "/") + "/"
+        if skip:
+            parent = "" if rel == "." else rel
+            dirs[:] = [d for d in dirs if os.path.normcase(os.path.join(parent, d)) not in skip]
+        dirs.sort()
+        for name in sorted(names):
+            yield prefix + name
+
+
+def resolve_dest_path(base_dest: str, auto_subfolder: bool) -> str:
+    """解析目的路徑（建立當日資料夾時附加 YYYY-MM-DD）"""
+    if not auto_subfolder:
+        return base_dest
+    return os.path.join(base_dest, datetime.date.today().strftime("%Y-%m-%d"))
+
+
+def overflow_map(profile: "SortProfile") -> Dict[str, str]:
+    """設定檔的備用位置，鍵與值都已套用當日資料夾（與比對結果的目的地相同）"""
+    return {resolve_dest_path(dest, profile.auto_subfolder): resolve_dest_path(spill, profile.auto_subfolder)
+            for dest, spill in profile.overflow.items()}
+
+
+def transfer_map(profile: "SortProfile") -> Dict[str, str]:
+    """設定檔各目的地的傳送方式，鍵已套用當日資料夾（與比對結果的目的地相同）"""
+    return {resolve_dest_path(dest, profile.auto_subfolder): mode
+            for dest, mode in profile.transfer.items()}
+
+
+def resolve_conflict(dst_path: str, mode: str,
+                     exists: Callable[[str], bool] = os.path.exists) -> Tuple[str, bool]:
+    """處理檔案衝突，回傳 (最終路徑, 是否移動)"""
+    if not exists(dst_path):
+        return dst_path, True
+
+    if mode == "skip":
+        return dst_path, False
+    elif mode == "overwrite":
+        return dst_path, True
+    elif mode == "rename":
+        base, ext = os.path.splitext(dst_path)
+        i = 1
+        while exists(f"{base}_{i}{ext}"):
+            i += 1
+        return f"{base}_{i}{ext}", True
+    return dst_path, False
+
+
+class NameReservations:
+    """多個執行緒同時移動時，保留已分配但尚未寫入的目的路徑，避免衝突判斷互相覆蓋"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._taken = set()
+
+    def reserve(self, dst_path: str, mode: str) -> Tuple[str, bool]:
+        with self._lock:
+            final, ok = resolve_conflict(dst_path, mode,
+                                         lambda p: p in self._taken or os.path.exists(p))
+            if ok:
+                self._taken.add(final)
+            return final, ok
+
+    def release(self, path: str):
+        with self._lock:
+            self._taken.discard(path)
+
+
+def plan_moves(profile: SortProfile, files: Optional[List[str]] = None) -> MovePlan:
+    """
+    計算要移動的檔案
+
+    規則由上到下依序比對，已被前面規則選中的檔案不再重複；
+    最後若啟用「全部」，剩下的檔案移到全部的目的地。
+    設定檔指定移動順序時再依該順序排列（見 ordering.py）。
+    回傳的 MovePlan 可像 [(名稱, 目的地)] 一樣迭代。
+    """
+    if files is None:
+        files = list_entries(profile.source, profile.recursive, profile.destination_roots())
+    with metrics.PHASE_SECONDS.labels(phase="plan").time(), profiling.span("plan"):
+        return _plan(profile, files)
+
+
+def _plan(profile: SortProfile, files: List[str]) -> MovePlan:
+    rules = CompiledRules(profile)
+    plan = MovePlan()
+    add = plan.adder()
+    capture = profiling.ACTIVE
+    match = rules.match if capture is None else capture.timed_match(rules)
+
+    # 每個項目歸給第一個符合的規則，再依規則順序（「全部」最後）輸出
+    for f in files:
+        hit = match(f)
+        if hit is not None:
+            add(f, hit[1], hit[0])
+    plan.sort_by_rule()
+    return ordering.order_plan(plan, profile.order, profile.source)
+
+
+def plan_single(rules: CompiledRules, name: str) -> Optional[Tuple[str, str]]:
+    """對單一項目套用已編譯的規則（監看模式使用）"""
+    hit = rules.match(name)
+    if hit is None:
+        return None
+    return name.rstrip("/"), hit[1]
+
+
+class RunResult:
+    """一次移動的結果"""
+
+    def __init__(self):
+        self.moved = 0
+        self.failed = 0
+        self.history = []  # [(目前路徑, 原始路徑, 傳送方式)]，供復原使用（舊記錄沒有傳送方式，視為 move）
+        self.mechanisms: Dict[str, int] = {}  # 實際使用的方式（rename/copy/hardlink/reflink）→ 次數
+
+    def summary(self) -> str:
+        return f"{self.moved} 成功，{self.failed} 失敗"
+
+    def mechanism_summary(self) -> str:
+        return "、".join(f"{name} {count}" for name, count in
+                        sorted(self.mechanisms.items(), key=lambda kv: -kv[1]))
+
+
+BATCH_LOG_LIMIT = 50  # 批次超過此數量時不逐一記錄成功的移動
+
+
+def group_by_destination(moves: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """依目的資料夾分組（組內保持原順序），讓同一資料夾的移動連續執行"""
+    groups: Dict[str, List[Tuple[str, str]]] = {}
+    for move in moves:
+        groups.setdefault(move[1], []).append(move)
+    return [move for group in groups.values() for move in group]
+
+
+def execute_batch(src: str, moves: List[Tuple[str, str]], conflict: str,
+                  log: Callable = print,
+                  should_stop: Optional[Callable[[], bool]] = None,
+                  verify: bool = False,
+                  modes: Optional[Dict[str, str]] = None,
+                  order: str = "rule") -> RunResult:
+    """
+    將多個移動當成一批執行：去除重複、依目的資料夾分組（或依 order 排列，見 ordering.py），
+    大批次只記錄摘要
+    """
+    moves = list(dict.fromkeys(moves))
+    if order == "rule":
+        moves = group_by_destination(moves)
+    else:
+        moves, _ = ordering.order_moves(moves, order, src)
+    log_each = len(moves) <= BATCH_LOG_LIMIT
+    if not log_each:
+        dests = len({dest for _, dest in moves})
+        log(f"批次移動：{len(moves)} 個項目 → {dests} 個資料夾")
+    return execute_moves(src, moves, conflict, log, should_stop, log_each, verify=verify, modes=modes)
+
+
+def check_space(profile: SortProfile, moves, log: Callable = print):
+    """依設定檔的空間檢查方式檢查目的磁碟，回傳放得下的計畫（見 space.preflight）"""
+    if profile.space_check == "off" or not moves:
+        return moves
+    from space import preflight
+
+    moves, _, _ = preflight(profile.source, moves, overflow_map(profile), profile.space_check, log)
+    return moves
+
+
+def move_entry(src_path: str, dst_path: str, verify: bool = False, log: Optional[Callable] = None,
+               should_stop: Optional[Callable[[], bool]] = None) -> str:
+    """
+    與 shutil.move 相同的移動，但將各步驟分開計時：
+    同裝置直接改名；跨裝置的一般檔案先複製再刪除，資料夾平行複製後再刪除（見 treecopy.py，
+    log 接收各資料夾的進度），其他情況交給 shutil.move。
+    跨裝置複製時套用目的裝置的限速（見 throttle.py），大檔案改用可續傳的複製（見 largefile.py）；
+    verify 為 True 時確認目的檔案內容與來源相同才刪除來源（見 integrity.py）。
+    回傳實際使用的方式："rename" 或 "copy"
+    """
+    if not os.path.isdir(dst_path):
+        try:
+            with profiling.span("rename"):
+                os.rename(src_path, dst_path)
+            return "rename"
+        except OSError:
+            pass
+        limit = _device_throttle(dst_path)
+        if os.path.isfile(src_path) and not os.path.islink(src_path):
+            if limit is not None:
+                limit.acquire_file()
+            if largefile.should_use(src_path):
+                # 大檔案分段複製，中斷後可續傳（複製、驗證、改名與刪除來源都在其中）
+                with profiling.span("copy"):
+                    largefile.move(src_path, dst_path, limit, should_stop)
+                return "copy"
+            if verify:
+                integrity.copy_file(src_path, dst_path, limit)
+            else:
+                with profiling.span("copy"):
+                    if limit is None:
+                        shutil.copy2(src_path, dst_path)
+                    else:
+                        throttle.copy_file(src_path, dst_path, limit)
+            with profiling.span("unlink"):
+                os.unlink(src_path)
+            return "copy"
+        if os.path.isdir(src_path) and not os.path.islink(src_path) and not _same_device(dst_path, src_path):
+            treecopy.move_tree(src_path, dst_path, _copy_function(limit, verify), log)
+            return "copy"
+        if verify:
+            shutil.move(src_path, dst_path, copy_function=integrity.copy_function(limit))
+            return "copy"
+        if limit is not None:
+            shutil.move(src_path, dst_path, copy_function=throttle.copy_function(limit))
+            return "copy"
+    shutil.move(src_path, dst_path)
+    return "rename" if _same_device(dst_path, src_path) else "copy"
+
+
+def _same_device(dst_path: str, src_path: str) -> bool:
+    try:
+        return os.stat(os.path.dirname(dst_path)).st_dev == os.stat(os.path.dirname(src_path)).st_dev
+    except OSError:
+        return False
+
+
+def _copy_function(limit, verify: bool) -> Callable[[str, str], object]:
+    """跨裝置複製單一檔案的函式：依設定驗證內容或限速"""
+    if verify:
+        return integrity.copy_function(limit)
+    if limit is not None:
+        return throttle.copy_function(limit)
+    return shutil.copy2
+
+
+def transfer_entry(src_path: str, dst_path: str, mode: str = "move", verify: bool = False,
+                   log: Optional[Callable] = None, should_stop: Optional[Callable[[], bool]] = None) -> str:
+    """
+    依傳送方式處理一個項目，回傳實際使用的方式（見 transfer.py）；
+    保留來源的方式在跨裝置複製時同樣套用限速與驗證
+    """
+    if mode == "move":
+        return move_entry(src_path, dst_path, verify, log, should_stop)
+    limit = None
+    if not _same_device(dst_path, src_path):
+        limit = _device_throttle(dst_path)
+    with profiling.span(mode):
+        return transfer.copy_entry(src_path, dst_path, mode, _copy_function(limit, verify), log)
+
+
+def _device_throttle(dst_path: str):
+    limiter = throttle.LIMITER
+    if limiter is None:
+        return None
+    return limiter.device(os.path.dirname(dst_path))
+
+
+def execute_moves(src: str, moves: List[Tuple[str, str]], conflict: str,
+                  log: Callable = print,
+                  should_stop: Optional[Callable[[], bool]] = None,
+                  log_each: bool = True,
+                  reservations: Optional[NameReservations] = None,
+                  verify: bool = False,
+                  modes: Optional[Dict[str, str]] = None) -> RunResult:
+    """
+    依計畫移動檔案（多執行緒共用目的地時傳入 reservations）；
+    modes 為目的地 → 傳送方式（見 transfer_map），未列出的目的地為移動
+    """
+    with metrics.PHASE_SECONDS.labels(phase="execute").time():
+        return _execute(src, moves, conflict, log, should_stop, log_each, reservations, verify, modes)
+
+
+def _execute(src, moves, conflict, log, should_stop, log_each, reservations,
+             verify=False, modes=None) -> RunResult:
+    result = RunResult()
+
+    for filename, dest in moves:
+        if should_stop and should_stop():
+            log("已停止移動")
+            break
+
+        profiling.item(filename)
+        mode = transfer.mode_for(modes, dest)
+        target = prepare_move(src, filename, dest, conflict, log, reservations, mode)
+        if not target:
+            if target is None:
+                result.failed += 1
+            continue
+        perform_move(target[0], target[1], filename, result, log, log_each, reservations, verify, mode,
+                     should_stop)
+
+    return result
+
+
+ALREADY_DONE: Tuple = ()  # prepare_move：保留來源的方式先前已複製過，不需再處理
+
+
+def prepare_move(src: str, filename: str, dest: str, conflict: str, log: Callable = print,
+                 reservations: Optional[NameReservations] = None,
+                 mode: str = "move") -> Optional[Tuple[str, str]]:
+    """
+    建立目的資料夾並處理衝突，回傳 (來源路徑, 最終路徑)；無法或不需移動時回傳 None，
+    保留來源的方式（複製等）目的地已是先前的結果時回傳 ALREADY_DONE
+    """
+    src_path = os.path.join(src, filename)
+    dst_path = os.path.join(dest, os.path.basename(filename))
+    if os.path.normcase(os.path.abspath(src_path)) == os.path.normcase(os.path.abspath(dst_path)):
+        return None  # 已在目的地（例如位於來源內的目的資料夾）
+    if mode != "move" and (transfer.already_copied(src_path, dst_path) or transfer.copied_before(src_path)):
+        return ALREADY_DONE
+
+    if not os.path.exists(dest):
+        try:
+            with profiling.span("mkdir"):
+                os.makedirs(dest, exist_ok=True)
+        except Exception:
+            log(f"無法建立目錄：{dest}")
+            metrics.FAILURES.labels(stage="mkdir").inc()
+            return None
+
+    with profiling.span("conflict"):
+        if reservations:
+            final_dst, should_move = reservations.reserve(dst_path, conflict)
+        else:
+            final_dst, should_move = resolve_conflict(dst_path, conflict)
+    if final_dst != dst_path or not should_move or (conflict == "overwrite" and os.path.exists(dst_path)):
+        metrics.CONFLICTS.labels(mode=conflict).inc()
+
+    if not should_move:
+        log(f"跳過：{filename}（已存在）")
+        return None
+    return src_path, final_dst
+
+
+def perform_move(src_path: str, final_dst: str, filename: str, result: RunResult,
+                 log: Callable = print, log_each: bool = True,
+                 reservations: Optional[NameReservations] = None,
+                 verify: bool = False, mode: str = "move",
+                 should_stop: Optional[Callable[[], bool]] = None) -> bool:
+    """
+    實際移動（或依 mode 複製、連結）一個項目並記錄到 result；reservations 中的保留在完成後釋放。
+    大檔案續傳複製時 should_stop 在每個續傳點檢查（見 largefile.py）
+    """
+    try:
+        size = os.lstat(src_path).st_size if not os.path.isdir(src_path) else 0
+        start = time.perf_counter()
+        with profiling.span("move"):
+            mechanism = transfer_entry(src_path, final_dst, mode, verify, log, should_stop)
+        if size:
+            ordering.record(src_path, final_dst, size, time.perf_counter() - start)
+        if log_each:
+            if mode == "move":
+                log(f"移動：{filename}")
+            else:
+                log(f"{transfer.MODE_NAMES[mode]}：{filename}（{mechanism}）")
+        result.history.append((final_dst, src_path, mode))
+        result.moved += 1
+        result.mechanisms[mechanism] = result.mechanisms.get(mechanism, 0) + 1
+        metrics.TRANSFERS.labels(mode=mode, mechanism=mechanism).inc()
+        metrics.FILES_MOVED.inc()
+        metrics.BYTES_MOVED.inc(size)
+        return True
+    except largefile.Interrupted as e:
+        log(f"已停止：{filename}（{e}）")
+        return False
+    except Exception as e:
+        log(f"失敗：{filename}（{e}）")
+        metrics.FAILURES.labels(stage="move").inc()
+        result.failed += 1
+        return False
+    finally:
+        if reservations:
+            reservations.release(final_dst)
+
+
+def run_profile(profile: SortProfile, log: Callable = print,
+                should_stop: Optional[Callable[[], bool]] = None) -> RunResult:
+    """對設定檔執行一次完整的分類移動"""
+    if not profile.source or not os.path.isdir(profile.source):
+        log(f"錯誤：來源路徑無效（{profile.name}）")
+        return RunResult()
+    from pipeline import run_pipeline
+
+    # 一次性執行不等待：尚未穩定的檔案留給下一次
+    result = run_pipeline(profile, log, should_stop)
+    if result.held or result.skipped:
+        log(f"略過下載中或尚未穩定的檔案：{result.held + result.skipped} 個")
+    if not result.matched:
+        log(f"沒有符合條件的檔案（{profile.name}）")
+    return result
+
+
+def record_stats(stats_file: str, count: int):
+    """將移動數量累加到統計檔（無 GUI 執行時使用）"""
+    stats = {"total": 0, "daily": {}}
+    if os.path.exists(stats_file):
+        try:
+            with open(stats_file, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except Exception:
+            pass
+    today = datetime.date.today().isoformat()
+    stats["total"] = stats.get("total", 0) + count
+    stats.setdefault("daily", {})
+    stats["daily"][today] = stats["daily"].get(today, 0) + count
+    try:
+        with open(stats_file, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+    except Exception:
+        pass
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 目的磁碟空間檢查
+移動開始前確認目的裝置有足夠空間，避免複製到一半才發現磁碟已滿
+
+- 依目的路徑所在裝置（st_dev）累計要寫入的位元組數
+- 同一裝置內的移動只是改名，不佔用空間
+- 空間不足時改用該目的地的備用位置（overflow），都不夠時略過或取消整批
+"""
+
+import os
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+MIN_FREE = 64 * 1024 * 1024  # 每個裝置至少保留的空間（位元組）
+
+SPACE_MODES = ("trim", "reject", "off")  # 略過放不下的項目 / 整批取消 / 不檢查
+
+
+def device_of(path: str) -> int:
+    """取得路徑所在裝置；路徑尚未建立時往上找最近存在的上層資料夾"""
+    current = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(current).st_dev
+        except OSError:
+            parent = os.path.dirname(current)
+            if parent == current:
+                return -1
+            current = parent
+
+
+def _existing(path: str) -> str:
+    current = os.path.abspath(path)
+    while not os.path.exists(current):
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    return current
+
+
+def free_bytes(path: str) -> int:
+    """路徑所在裝置可供一般使用者寫入的空間"""
+    target = _existing(path)
+    if hasattr(os, "statvfs"):
+        st = os.statvfs(target)
+        return st.f_bavail * st.f_frsize
+    return shutil.disk_usage(target).free
+
+
+def entry_size(path: str) -> int:
+    """項目佔用的位元組數；資料夾為其中所有檔案的總和"""
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return os.lstat(path).st_size
+    except OSError:
+        return 0
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def fmt_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class SpaceBudget:
+    """
+    各目的裝置尚可寫入的位元組數
+
+    第一次用到某裝置時以 statvfs 取得可用空間（扣除保留量），之後每接受一個項目就扣除，
+    多個執行緒可共用同一個 SpaceBudget。
+    """
+
+    def __init__(self, reserve: int = MIN_FREE):
+        self.reserve = reserve
+        self._remaining: Dict[int, int] = {}
+        self._devices: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def device(self, path: str) -> int:
+        dev = self._devices.get(path)
+        if dev is None:
+            dev = self._devices[path] = device_of(path)
+        return dev
+
+    def admit(self, src_dev: int, dest: str, size: int) -> bool:
+        """要寫入 size 位元組到 dest 所在裝置；空間足夠時扣除並回傳 True"""
+        dev = self.device(dest)
+        if dev == src_dev or dev == -1:
+            return True
+        with self._lock:
+            remaining = self._remaining.get(dev)
+            if remaining is None:
+                try:
+                    remaining = free_bytes(dest) - self.reserve
+                except OSError:
+                    return True  # 無法取得時交給實際移動處理
+            if size > remaining:
+                self._remaining[dev] = remaining
+                return False
+            self._remaining[dev] = remaining - size
+            return True
+
+    def refund(self, dest: str, size: int):
+        """項目最後沒有移動時歸還預扣的空間"""
+        dev = self.device(dest)
+        with self._lock:
+            if dev in self._remaining:
+                self._remaining[dev] += size
+
+    def choose(self, src_dev: int, dest: str, size: int,
+               overflow: Dict[str, str]) -> Optional[str]:
+        """回傳放得下的目的地：原目的地或其備用位置；都放不下時回傳 None"""
+        if self.admit(src_dev, dest, size):
+            return dest
+        spill = overflow.get(dest)
+        if spill and self.admit(src_dev, spill, size):
+            return spill
+        return None
+
+    def remaining(self) -> Dict[int, int]:
+        with self._lock:
+            return dict(self._remaining)
+
+
+def preflight(src: str, moves, overflow: Dict[str, str], mode: str = "trim",
+              log: Callable = print, budget: Optional[SpaceBudget] = None):
+    """
+    移動前依目的裝置檢查空間
+
+    回傳 (調整後的計畫, 改用備用位置的數量, 放不下的數量)；
+    mode 為 "reject" 且有放不下的項目時回傳空計畫。
+    傳入 MovePlan 時會直接改寫其目的地並回傳子集合，否則回傳 list。
+    """
+    if mode == "off" or not moves:
+        return moves, 0, 0
+    budget = budget or SpaceBudget()
+    src_dev = device_of(src)
+    is_plan = hasattr(moves, "retarget")
+    keep: List[int] = []
+    kept_moves: List[Tuple[str, str]] = []
+    spilled = 0
+    rejected = 0
+    short: Dict[str, int] = {}
+
+    for pos, (name, dest) in enumerate(moves):
+        if budget.device(dest) == src_dev:
+            keep.append(pos)
+            kept_moves.append((name, dest))
+            continue
+        size = moves.size_of(pos) if is_plan else -1
+        if size < 0 or (is_plan and moves.is_dir(pos)):
+            size = entry_size(os.path.join(src, name))
+        target = budget.choose(src_dev, dest, size, overflow)
+        if target is None:
+            rejected += 1
+            short[dest] = short.get(dest, 0) + size
+            continue
+        if target != dest:
+            spilled += 1
+            if is_plan:
+                moves.retarget(pos, target)
+        keep.append(pos)
+        kept_moves.append((name, target))
+
+    if spilled:
+        log(f"目的磁碟空間不足，{spilled} 個項目改用備用位置")
+    for dest, size in short.items():
+        log(f"空間不足：{dest}（尚缺 {fmt_bytes(size)}）")
+    if rejected and mode == "reject":
+        log(f"空間不足，取消整批移動（{rejected} 個項目放不下）")
+        return (moves.take([]) if is_plan else []), spilled, rejected
+    if rejected:
+        log(f"略過空間不足的項目：{rejected} 個")
+    return (moves.take(keep) if is_plan else kept_moves), spilled, rejected
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 跨裝置複製限速
+複製到 NAS 等其他裝置時，依目的裝置限制每秒位元組數與檔案數，
+避免上班時間大量搬移佔滿網路
+
+settings.json 的 "throttle" 為規則清單，例如：
+    [{"dest": "//nas/share", "bytes_per_sec": "20M", "files_per_sec": 50, "hours": "08:00-18:00"}]
+
+- dest：目的路徑（以其所在裝置為準）；省略時套用到所有跨裝置的複製
+- hours：生效時段，可跨午夜（"22:00-06:00"）；省略時整天生效
+- 同一裝置有多條規則時使用第一條在目前時段生效的規則，都不生效時不限速
+- 同一裝置內的移動只是改名，不受限制
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import metrics
+from space import device_of, fmt_bytes
+
+LIMITER: Optional["Throttle"] = None  # 目前的限速設定，由 configure() / load() 設定
+
+COPY_CHUNK = 1024 * 1024  # 限速複製時每次讀寫的大小
+RATE_WINDOW = 5.0  # 計算實際速率的時間範圍（秒）
+RULE_REFRESH = 30.0  # 重新判斷生效時段的間隔（秒）
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(value) -> float:
+    """將 "20M"、"512K"、1000 等轉為每秒數量；無法解析或未設定時回傳 0（不限速）"""
+    if value in (None, ""):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return max(float(value), 0.0)
+    text = str(value).strip().upper().rstrip("B").rstrip("I")
+    scale = _UNITS.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    try:
+        return max(float(text) * scale, 0.0)
+    except ValueError:
+        return 0.0
+
+
+def parse_hours(value: Optional[str]):
+    """將 "08:00-18:00" 轉為 (開始分鐘, 結束分鐘)；未設定時回傳 None（整天）"""
+    if not value:
+        return None
+    try:
+        start, end = (part.strip() for part in value.split("-", 1))
+        sh, sm = start.split(":")
+        eh, em = end.split(":")
+        return int(sh) * 60 + int(sm), int(eh) * 60 + int(em)
+    except ValueError:
+        return None
+
+
+class RateRule:
+    """一條限速規則"""
+
+    def __init__(self, dest: str = "", bytes_per_sec=0, files_per_sec=0, hours: str = ""):
+        self.dest = dest.strip()
+        self.bytes_per_sec = parse_rate(bytes_per_sec)
+        self.files_per_sec = parse_rate(files_per_sec)
+        self.hours = hours or ""
+        self.window = parse_hours(hours)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RateRule":
+        return cls(data.get("dest", ""), data.get("bytes_per_sec"),
+                   data.get("files_per_sec"), data.get("hours", ""))
+
+    def active(self, minute: int) -> bool:
+        if self.window is None:
+            return True
+        start, end = self.window
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end  # 跨午夜
+
+
+class TokenBucket:
+    """權杖桶：平均速率為 rate，最多可累積一秒的量；rate 為 0 時不限制"""
+
+    def __init__(self, rate: float = 0.0):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            if rate != self.rate:
+                self.rate = rate
+                self._tokens = min(self._tokens, rate)
+
+    def consume(self, amount: float) -> float:
+        """取用 amount 個權杖，不足時等待；回傳等待的秒數"""
+        with self._lock:
+            rate = self.rate
+            if rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(rate, self._tokens + (now - self._last) * rate)
+            self._last = now
+            self._tokens -= amount  # 允許預支，等待到補回為止
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class DeviceThrottle:
+    """單一目的裝置的限速狀態"""
+
+    def __init__(self, label: str, rules: List[RateRule]):
+        self.label = label
+        self.rules = rules
+        self.rule: Optional[RateRule] = None
+        self.bytes = TokenBucket()
+        self.files = TokenBucket()
+        self.waited = 0.0
+        self._recent = deque()  # [(時間, 位元組數)]
+        self._recent_lock = threading.Lock()
+        self._checked = 0.0
+        self._wait_metric = metrics.THROTTLE_WAIT.labels(device=label)
+        metrics.THROTTLE_LIMIT.labels(device=label).set_function(lambda: self.bytes.rate)
+        metrics.THROTTLE_RATE.labels(device=label).set_function(self.rate)
+
+    def refresh(self, now: float):
+        """依目前時段選出生效的規則並調整權杖桶速率"""
+        if now - self._checked < RULE_REFRESH and self._checked:
+            return
+        self._checked = now
+        local = time.localtime()
+        minute = local.tm_hour * 60 + local.tm_min
+        self.rule = next((r for r in self.rules if r.active(minute)), None)
+        self.bytes.set_rate(self.rule.bytes_per_sec if self.rule else 0.0)
+        self.files.set_rate(self.rule.files_per_sec if self.rule else 0.0)
+
+    def limited(self) -> bool:
+        return self.bytes.rate > 0 or self.files.rate > 0
+
+    def _wait(self, seconds: float):
+        if seconds:
+            self.waited += seconds
+            self._wait_metric.inc(seconds)
+
+    def acquire_file(self):
+        self._wait(self.files.consume(1))
+
+    def consume(self, amount: int):
+        self._wait(self.bytes.consume(amount))
+        now = time.monotonic()
+        with self._recent_lock:
+            self._recent.append((now, amount))
+            while self._recent and now - self._recent[0][0] > RATE_WINDOW:
+                self._recent.popleft()
+
+    def rate(self) -> float:
+        """最近 RATE_WINDOW 秒的實際速率（位元組/秒）"""
+        now = time.monotonic()
+        with self._recent_lock:
+            total = sum(n for t, n in self._recent if now - t <= RATE_WINDOW)
+        return total / RATE_WINDOW
+
+    def snapshot(self) -> Dict:
+        return {
+            "limit_bytes_per_sec": self.bytes.rate,
+            "limit_files_per_sec": self.files.rate,
+            "rate_bytes_per_sec": round(self.rate(), 1),
+            "hours": self.rule.hours if self.rule else "",
+            "waited": round(self.waited, 3),
+        }
+
+    def describe(self) -> str:
+        if not self.limited():
+            return f"{self.label}：目前不限速，實際 {fmt_bytes(self.rate())}/s"
+        limits = []
+        if self.bytes.rate:
+            limits.append(f"{fmt_bytes(self.bytes.rate)}/s")
+        if self.files.rate:
+            limits.append(f"{self.files.rate:g} 個/s")
+        return (f"{self.label}：上限 {'、'.join(limits)}，實際 {fmt_bytes(self.rate())}/s，"
+                f"等待 {self.waited:.1f} 秒")
+
+
+class Throttle:
+    """依目的裝置分配限速狀態"""
+
+    def __init__(self, rules: List[RateRule]):
+        self.rules = rules
+        self._devices: Dict[int, Optional[DeviceThrottle]] = {}
+        self._lock = threading.Lock()
+        self._rule_devices: Optional[List[int]] = None
+
+    def _rules_for(self, dev: int) -> List[RateRule]:
+        if self._rule_devices is None:
+            self._rule_devices = [device_of(r.dest) if r.dest else None for r in self.rules]
+        return [r for r, d in zip(self.rules, self._rule_devices) if d is None or d == dev]
+
+    def device(self, dest_dir: str) -> Optional[DeviceThrottle]:
+        """目的資料夾所在裝置的限速狀態；沒有任何規則適用時回傳 None"""
+        dev = device_of(dest_dir)
+        with self._lock:
+            if dev not in self._devices:
+                rules = self._rules_for(dev)
+                label = next((r.dest for r in rules if r.dest), "") or dest_dir
+                self._devices[dev] = DeviceThrottle(label, rules) if rules else None
+            throttle = self._devices[dev]
+        if throttle is not None:
+            throttle.refresh(time.monotonic())
+            if not throttle.limited():
+                return None
+        return throttle
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            devices = [t for t in self._devices.values() if t is not None]
+        return {t.label: t.snapshot() for t in devices}
+
+    def describe(self) -> List[str]:
+        with self._lock:
+            devices = [t for t in self._devices.values() if t is not None and t.waited]
+        return [t.describe() for t in devices]
+
+
+def copy_file(src: str, dst: str, throttle: DeviceThrottle):
+    """與 shutil.copy2 相同，但依限速分段寫入"""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while True:
+            buf = fsrc.read(COPY_CHUNK)
+            if not buf:
+                break
+            throttle.consume(len(buf))
+            fdst.write(buf)
+    shutil.copystat(src, dst)
+    return dst
+
+
+def copy_function(throttle: DeviceThrottle) -> Callable[[str, str], str]:
+    """給 shutil.move / copytree 使用的限速複製函式（每個檔案也計入檔案數限制）"""
+    def copy(src, dst, **kwargs):
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        throttle.acquire_file()
+        return copy_file(src, dst, throttle)
+    return copy
+
+
+def configure(rules: Optional[List[Dict]]) -> Optional[Throttle]:
+    """套用限速規則；沒有規則時關閉限速"""
+    global LIMITER
+    parsed = [RateRule.from_dict(r) for r in (rules or []) if isinstance(r, dict)]
+    parsed = [r for r in parsed if r.bytes_per_sec or r.files_per_sec]
+    LIMITER = Throttle(parsed) if parsed else None
+    return LIMITER
+
+
+def load(settings_file: str) -> Optional[Throttle]:
+    """由 settings.json 的 "throttle" 載入限速規則"""
+    try:
+        with open(settings_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return configure(None)
+    return configure(data.get("throttle"))
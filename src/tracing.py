@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 執行時間軸
+將各執行緒的階段（掃描、計畫、建立資料夾、衝突處理、複製、連結、刪除）記錄為
+Chrome trace-event JSON，可用 Perfetto（ui.perfetto.dev）或 chrome://tracing 檢視
+
+- 掃描與計畫等整批階段一律記錄
+- 逐項目的階段依取樣率記錄；超過 slow_ms 的項目不論是否取樣都會記錄，
+  方便找出慢速裝置造成的停頓
+- 事件存放在有上限的環狀緩衝區，超過上限時捨棄最舊的事件，長時間執行的常駐程序
+  不會無限制佔用記憶體，結束時寫出的是最近的時間軸
+"""
+
+import os
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import profiling
+
+# 逐項目執行的階段，受取樣率影響（tree_scan 為移動資料夾時走訪其內容）
+ITEM_SPANS = frozenset(("mkdir", "conflict", "move", "rename", "copy", "hardlink", "reflink",
+                        "verify", "unlink", "tree_scan"))
+MAX_EVENTS = 200_000  # 環狀緩衝區保留的事件數
+
+
+class Tracer:
+    """收集 trace 事件，結束時寫成 Chrome trace-event JSON"""
+
+    def __init__(self, path: str, sample_rate: float = 1.0, slow_ms: float = 50.0,
+                 max_events: int = MAX_EVENTS):
+        self.path = path
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.slow = slow_ms / 1000.0
+        self.max_events = max_events
+        self.dropped = 0
+        # (名稱, 開始, 結束, 執行緒, 項目)；寫出時才轉成 trace 事件，減少每個事件佔用的記憶體
+        self._events: Deque[Tuple[str, float, float, int, Optional[str]]] = deque(maxlen=max_events)
+        self._threads: Dict[int, str] = {}
+        self._counter = itertools.count()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def next_item(self, name: str):
+        """開始處理下一個項目：決定本執行緒接下來的逐項目階段是否取樣"""
+        local = self._local
+        local.item = name
+        local.sampled = bool(self.sample_every) and next(self._counter) % self.sample_every == 0
+
+    def record(self, name: str, start: float, end: float):
+        item = None
+        if name in ITEM_SPANS:
+            local = self._local
+            if not getattr(local, "sampled", True) and end - start < self.slow:
+                return
+            item = getattr(local, "item", None)
+        tid = threading.get_ident()
+        with self._lock:
+            if len(self._events) == self.max_events:
+                self.dropped += 1  # 環狀緩衝區已滿，append 會捨棄最舊的事件
+            self._events.append((name, start, end, tid, item))
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+
+    def _event(self, name: str, start: float, end: float, tid: int, item: Optional[str]) -> Dict:
+        event = {
+            "name": name,
+            "cat": "item" if name in ITEM_SPANS else "phase",
+            "ph": "X",
+            "ts": round((start - self._origin) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": self._pid,
+            "tid": tid,
+        }
+        if item is not None:
+            event["args"] = {"item": item}
+        return event
+
+    def write(self):
+        with self._lock:
+            events = [self._event(*e) for e in self._events]
+            threads = dict(self._threads)
+        meta = [{"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0,
+                 "args": {"name": "ChroLens_Sorting"}}]
+        for tid, name in threads.items():
+            meta.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                         "args": {"name": name}})
+        data = {
+            "traceEvents": meta + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"sample_every": self.sample_every, "dropped_events": self.dropped},
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+
+def start(path: str, sample_rate: float = 1.0, slow_ms: float = 50.0) -> Tracer:
+    """開始記錄（由 profiling.span 回報各階段）"""
+    tracer = Tracer(path, sample_rate, slow_ms)
+    profiling.TRACER = tracer
+    return tracer
+
+
+def stop(write: bool = True) -> Optional[Tracer]:
+    """停止記錄並寫出檔案"""
+    tracer = profiling.TRACER
+    profiling.TRACER = None
+    if tracer is not None and write:
+        try:
+            tracer.write()
+            print(f"時間軸已寫入：{tracer.path}")
+        except OSError as e:
+            print(f"時間軸寫入失敗：{e}")
+    return tracer
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 傳送方式
+每條規則可選擇移動以外的方式，讓來源保留在原處（封存副本、同時供其他流程使用）
+
+- move：移動（預設）
+- copy：複製；同一個支援 reflink 的檔案系統（btrfs、XFS、APFS）上改用 reflink，不佔額外空間
+- hardlink：建立硬連結；跨裝置或不支援時改用 reflink，再不行才複製
+- reflink：共用資料區塊的複製（Linux FICLONE、macOS clonefile）；不支援時一般複製
+
+實際使用的方式（rename/copy/hardlink/reflink）會回報在執行結果與指標中。
+保留來源的方式完成後記錄在執行日誌（見 configure），常駐、排程與監看重複執行同一個設定檔時，
+副本仍在的項目（包括資料夾與衝突時改名的副本）直接略過，不再進入衝突處理。
+"""
+
+import os
+import sys
+import stat
+import shutil
+import ctypes
+import threading
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+import treecopy
+
+MODES = ("move", "copy", "hardlink", "reflink")
+MODE_NAMES = {"move": "移動", "copy": "複製", "hardlink": "硬連結", "reflink": "reflink"}
+
+FICLONE = 0x40049409  # Linux ioctl：_IOW(0x94, 9, int)
+
+JOURNAL = None  # journal.RunJournal，由 configure() 設定；未設定時只比對同名的目的檔案
+
+_clonefile = None
+
+
+def configure(journal_file: Optional[str]):
+    """指定記錄已完成傳送的執行日誌"""
+    global JOURNAL
+    if journal_file:
+        from journal import shared
+        JOURNAL = shared(journal_file)
+    else:
+        JOURNAL = None
+    return JOURNAL
+
+
+def reflink(src: str, dst: str) -> bool:
+    """以 reflink 複製檔案（不複製資料區塊）；不支援時回傳 False 且不留下目的檔案"""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+                try:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                except OSError:
+                    cloned = False
+                else:
+                    cloned = True
+        except OSError:
+            return False
+        if not cloned:
+            os.remove(dst)
+            return False
+        shutil.copystat(src, dst)
+        return True
+    if sys.platform == "darwin":
+        global _clonefile
+        try:
+            if _clonefile is None:
+                _clonefile = ctypes.CDLL(None, use_errno=True).clonefile
+            return _clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+        except AttributeError:
+            return False
+    return False
+
+
+def hardlink(src: str, dst: str) -> bool:
+    try:
+        os.link(src, dst)
+        return True
+    except (OSError, AttributeError, NotImplementedError):
+        return False
+
+
+def copy_file(src: str, dst: str, mode: str, copy: Callable[[str, str], object] = shutil.copy2) -> str:
+    """依傳送方式複製單一檔案，回傳實際使用的方式；copy 為都不支援時的一般複製"""
+    if mode == "hardlink" and hardlink(src, dst):
+        return "hardlink"
+    if reflink(src, dst):
+        return "reflink"
+    copy(src, dst)
+    return "copy"
+
+
+def copy_entry(src: str, dst: str, mode: str,
+               copy: Callable[[str, str], object] = shutil.copy2,
+               log: Optional[Callable] = None) -> str:
+    """
+    複製檔案或資料夾（來源保留），回傳實際使用的方式；
+    資料夾以平行複製處理（見 treecopy.py），回傳最常用的方式
+    """
+    if os.path.isdir(src) and not os.path.islink(src):
+        used = Counter()
+        lock = threading.Lock()
+
+        def copy_one(s, d):
+            mechanism = copy_file(s, d, mode, copy)
+            with lock:
+                used[mechanism] += 1
+
+        treecopy.copy_tree(src, dst, copy_one, log)
+        return used.most_common(1)[0][0] if used else "copy"
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        return "copy"
+    return copy_file(src, dst, mode, copy)
+
+
+def already_copied(src: str, dst: str) -> bool:
+    """
+    目的地是否已是先前複製的結果（同一個檔案，或大小與修改時間相同）；來源保留的方式重複執行時略過。
+    只比對一般檔案：資料夾與符號連結一律回傳 False，重複執行時交給衝突處理，資料夾內新增的檔案不會被略過
+    """
+    try:
+        s, d = os.lstat(src), os.lstat(dst)
+    except OSError:
+        return False
+    if not (stat.S_ISREG(s.st_mode) and stat.S_ISREG(d.st_mode)):
+        return False
+    if (s.st_dev, s.st_ino) == (d.st_dev, d.st_ino):
+        return True
+    return s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns
+
+
+def copied_before(src: str) -> bool:
+    """來源先前已以保留來源的方式處理，且記錄的副本仍在（一般檔案需大小與修改時間相同）"""
+    journal = JOURNAL
+    if journal is None:
+        return False
+    current = journal.copied_to(src)
+    if current is None:
+        return False
+    if os.path.isdir(src) and not os.path.islink(src):
+        return os.path.isdir(current) and not os.path.islink(current)
+    return already_copied(src, current)
+
+
+def mode_for(modes: Optional[Dict[str, str]], dest: str) -> str:
+    if not modes:
+        return "move"
+    return modes.get(dest, "move")
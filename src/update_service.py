@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 背景更新檢查
+整個程式共用一個 VersionManager（同一條連線與發佈資訊快取），
+由單一背景執行緒於啟動後與固定間隔檢查更新，結果放入佇列交給 UI 取用
+
+- 啟動後隨機延遲再檢查，不影響視窗建立與排程執行
+- 檢查間隔加入隨機抖動，避免多台電腦同時向 GitHub 發出請求
+"""
+
+import queue
+import random
+import threading
+from typing import Callable, Optional
+
+STARTUP_DELAY = (5.0, 30.0)  # 啟動後第一次檢查的延遲範圍（秒）
+CHECK_INTERVAL = 6 * 3600  # 背景檢查間隔（秒）
+JITTER = 0.1  # 間隔的隨機抖動比例
+
+
+class UpdateResult:
+    """一次檢查的結果；info 為 None 表示已是最新版本，error 表示檢查失敗"""
+
+    def __init__(self, info: Optional[dict], requested: bool, error: Optional[str] = None):
+        self.info = info
+        self.requested = requested  # 使用者按下「版本」觸發
+        self.error = error
+
+
+class UpdateService:
+    """常駐的更新檢查服務"""
+
+    def __init__(self, factory: Callable, interval: float = CHECK_INTERVAL,
+                 startup_delay=STARTUP_DELAY, log: Callable = print):
+        self._factory = factory  # 在背景執行緒中建立 VersionManager，匯入也不佔用主執行緒
+        self.interval = interval
+        self.startup_delay = startup_delay
+        self._logger = log
+        self.results: "queue.Queue[UpdateResult]" = queue.Queue()
+        self._manager = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._requested = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    @property
+    def manager(self):
+        """共用的 VersionManager（第一次使用時建立）"""
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._factory()
+            return self._manager
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ChroLensUpdate", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._manager is not None:
+            self._manager.close()
+
+    def check_now(self):
+        """使用者要求立即檢查（略過快取的有效時間）"""
+        self._requested = True
+        self._wake.set()
+
+    def _loop(self):
+        delay = random.uniform(*self.startup_delay)
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            requested, self._requested = self._requested, False
+            try:
+                info = self.manager.check_for_updates(force=requested)
+                self.results.put(UpdateResult(info, requested))
+            except Exception as e:
+                self.results.put(UpdateResult(None, requested, str(e)))
+            delay = self.interval * random.uniform(1 - JITTER, 1 + JITTER)
@@ -1,28 +1,55 @@
 # -*- coding: utf-8 -*-
 import tkinter as tk
 from tkinter import ttk, messagebox
+import os
 import threading
-import webbrowser
 
 class VersionInfoDialog:
     def __init__(self, parent, version_manager, current_version, app_name="ChroLens App"):
         self.vm = version_manager
         self.dialog = tk.Toplevel(parent)
         self.dialog.title(f"關於 {app_name}")
-        self.dialog.geometry("400x300")
+        self.dialog.geometry("400x340")
         ttk.Label(self.dialog, text=app_name, font=("", 16, "bold")).pack(pady=10)
         ttk.Label(self.dialog, text=f"版本: {current_version}").pack(pady=5)
         ttk.Button(self.dialog, text="檢查更新", command=self.check).pack(pady=10)
-        ttk.Button(self.dialog, text="關閉", command=self.dialog.destroy).pack(pady=5)
+        if os.path.exists(os.path.join(self.vm.backup_dir, 'update_backup.json')):
+            ttk.Button(self.dialog, text="還原上一版", command=self.rollback).pack(pady=5)
+        self.progress = ttk.Progressbar(self.dialog, length=300, maximum=100)
+        self.progress_label = ttk.Label(self.dialog, text="")
+        ttk.Button(self.dialog, text="關閉", command=self.dialog.destroy).pack(side="bottom", pady=5)
+
+    def _on_progress(self, done, total):
+        """下載執行緒呼叫（已限制頻率），交回主執行緒更新進度條"""
+        def update():
+            if not self.dialog.winfo_exists():
+                return
+            if not self.progress.winfo_ismapped():
+                self.progress.pack(pady=(5, 0))
+                self.progress_label.pack()
+            if total:
+                self.progress['value'] = done * 100 / total
+                self.progress_label.config(text=f"{done / 1048576:.1f} / {total / 1048576:.1f} MB")
+            else:
+                self.progress_label.config(text=f"{done / 1048576:.1f} MB")
+        self.dialog.after(0, update)
 
     def check(self):
         def task():
             info = self.vm.check_for_updates()
             if info:
                 if messagebox.askyesno("更新", f"發現新版本 {info['version']}\n是否更新?"):
-                    path = self.vm.download_update(info['download_url'])
-                    if path:
-                        ext = self.vm.extract_update(path)
-                        if ext: self.vm.apply_update(ext)
+                    ext = self.vm.prepare_update(info, self._on_progress)
+                    if ext and self.vm.apply_update(ext):
+                        self.dialog.after(0, self.dialog.master.destroy)  # 新版本已啟動
+                    else: messagebox.showerror("更新", "下載失敗或檔案驗證不符，請稍後再試")
             else: messagebox.showinfo("更新", "已是最新版本")
         threading.Thread(target=task, daemon=True).start()
+
+    def rollback(self):
+        if not messagebox.askyesno("還原", "確定要還原為更新前的版本嗎?"):
+            return
+        if self.vm.rollback():
+            messagebox.showinfo("還原", "已還原，請重新啟動程式")
+        else:
+            messagebox.showerror("還原", "還原失敗")
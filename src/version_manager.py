@@ -1,50 +1,272 @@
 # -*- coding: utf-8 -*-
+import io
 import os
+import re
 import sys
 import json
+import shutil
+import hashlib
+import threading
+import http.client
 import urllib.request
 import urllib.error
+import urllib.parse
 import zipfile
 import tempfile
 import subprocess
 import time
+import fnmatch
+import contextlib
 from typing import Optional, Dict, Callable
 from packaging import version as pkg_version
 
+DOWNLOAD_CHUNK = 1024 * 1024  # 每次讀取 1 MiB
+PROGRESS_INTERVAL = 0.1  # 進度回呼的最短間隔（秒）
+DOWNLOAD_RETRIES = 3  # 中斷後續傳的次數
+CACHE_TTL = 6 * 3600  # 發佈資訊快取的有效時間（秒）
+OFFLINE_BACKOFF = 300  # 連線失敗後直接使用快取的時間（秒）
+API_HOST = 'api.github.com'
+MANIFEST_NAME = 'manifest.json'  # 發佈附帶的檔案清單：{"files": {"相對路徑": {"sha256": ..., "size": ...}}}
+RANGE_BLOCK = 1024 * 1024  # 遠端 zip 每次讀取的區塊大小
+_SHA256_RE = re.compile(r'\b([0-9a-fA-F]{64})\b')
+# 執行中會改寫的使用者資料（設定、統計、執行日誌等），更新與還原時複製而不是連結或隨版本替換
+DATA_PATTERNS = ('*.json', '*.jsonl', '*.prom')
+
+
+def file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def build_manifest(root_dir: str, version_text: str = '') -> Dict:
+    """產生發佈用的檔案清單（發佈時與 zip 一起上傳為 manifest.json）"""
+    files = {}
+    for root, dirs, names in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d not in ('__pycache__', '.git')]
+        for name in names:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, root_dir).replace(os.sep, '/')
+            files[rel] = {'sha256': file_sha256(full), 'size': os.path.getsize(full)}
+    return {'version': version_text, 'files': files}
+
+
+class HttpRangeFile(io.RawIOBase):
+    """以 HTTP Range 讀取遠端檔案的可定位檔案物件，讓 zipfile 只下載需要的項目"""
+
+    def __init__(self, url: str, block_size: int = RANGE_BLOCK):
+        req = urllib.request.Request(url, headers={'User-Agent': 'ChroLens-App', 'Range': 'bytes=0-0'})
+        with urllib.request.urlopen(req, timeout=30) as response:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status != 206 or '/' not in content_range:
+                raise OSError("伺服器不支援 Range 請求")
+            self.size = int(content_range.rsplit('/', 1)[1])
+            self.url = response.url  # 轉址後的實際位置
+        parts = urllib.parse.urlsplit(self.url)
+        conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._conn = conn_class(parts.netloc, timeout=30)
+        self._path = parts.path + ('?' + parts.query if parts.query else '')
+        self.block_size = block_size
+        self.fetched = 0  # 實際下載的位元組數
+        self._pos = 0
+        self._block_start = 0
+        self._block = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        for attempt in range(2):
+            try:
+                self._conn.request('GET', self._path, headers={'User-Agent': 'ChroLens-App',
+                                                               'Range': f'bytes={start}-{end - 1}'})
+                response = self._conn.getresponse()
+                data = response.read()
+                if response.status != 206:
+                    raise OSError(f"Range 請求失敗：HTTP {response.status}")
+                self.fetched += len(data)
+                return data
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError):
+                self._conn.close()
+                if attempt:
+                    raise
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), self.size - self._pos)
+        if n <= 0:
+            return 0
+        offset = self._pos - self._block_start
+        if not (0 <= offset and offset + n <= len(self._block)):
+            start = self._pos
+            end = min(self.size, start + max(n, self.block_size))
+            self._block, self._block_start, offset = self._fetch(start, end), start, 0
+        buffer[:n] = self._block[offset:offset + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        self._conn.close()
+        super().close()
+
+
 class VersionManager:
-    def __init__(self, github_repo: str, current_version: str, logger: Optional[Callable] = None):
+    def __init__(self, github_repo: str, current_version: str, logger: Optional[Callable] = None,
+                 cache_file: Optional[str] = None, cache_ttl: float = CACHE_TTL,
+                 allow_unverified: bool = False):
         self.github_repo = github_repo
         self.current_version = current_version
         self._logger = logger or (lambda msg: print(f"[VersionManager] {msg}"))
-        self.api_url = f"https://api.github.com/repos/{github_repo}/releases/latest"
+        self.api_path = f"/repos/{github_repo}/releases/latest"
+        self.api_url = f"https://{API_HOST}{self.api_path}"
         if getattr(sys, 'frozen', False):
             self.app_dir = os.path.dirname(sys.executable)
         else:
             self.app_dir = os.path.dirname(os.path.abspath(__file__))
             if os.path.basename(self.app_dir) in ['main', 'src']:
                 self.app_dir = os.path.dirname(self.app_dir)
+        self.cache_file = cache_file or os.path.join(self.app_dir, 'release_cache.json')
+        self.cache_ttl = cache_ttl
+        # 發佈沒有提供 SHA-256 時是否仍安裝（預設拒絕；settings.json 的 allow_unverified_updates）
+        self.allow_unverified = allow_unverified
+        self._cache: Optional[Dict] = None
+        self._conn: Optional[http.client.HTTPSConnection] = None
+        self._lock = threading.Lock()
+        self._manifest: Optional[Dict] = None  # prepare_update 取得的 manifest，套用時用來驗證
+        # 重新啟動用的進入點（替換資料夾後路徑不變）
+        self._entry = os.path.abspath(sys.executable if getattr(sys, 'frozen', False) else sys.argv[0])
 
     def log(self, msg: str):
         self._logger(msg)
 
-    def check_for_updates(self) -> Optional[Dict]:
+    # ==================== 發佈資訊快取 ====================
+
+    def _load_cache(self) -> Dict:
+        if self._cache is None:
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self._cache = json.load(f)
+            except Exception:
+                self._cache = {}
+            self._cache.setdefault('entries', {})
+        return self._cache
+
+    def _save_cache(self):
+        try:
+            tmp = self.cache_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_file)
+        except Exception as e:
+            self.log(f"快取儲存失敗: {e}")
+
+    def _request(self, path: str, headers: Dict):
+        """以同一條保持連線送出 GET；連線已被伺服器關閉時重連一次"""
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPSConnection(API_HOST, timeout=10)
+            try:
+                self._conn.request('GET', path, headers=headers)
+                response = self._conn.getresponse()
+                return response, response.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+            except Exception:
+                self.close()
+                raise
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _get_json(self, path: str, force: bool = False):
+        """
+        取得 GitHub API 的 JSON：TTL 內直接使用快取，過期時以 ETag 重新驗證；
+        離線或達到速率限制時立即回傳快取（沒有快取時拋出例外）
+        """
+        with self._lock:
+            cache = self._load_cache()
+            entry = cache['entries'].get(path)
+            now = time.time()
+            if entry and not force and now - entry['fetched'] < self.cache_ttl:
+                return entry['body']
+            if entry and now < cache.get('offline_until', 0):
+                return entry['body']
+
+            headers = {'User-Agent': 'ChroLens-App', 'Accept': 'application/vnd.github+json'}
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            try:
+                response, raw = self._request(path, headers)
+            except (OSError, http.client.HTTPException) as e:
+                cache['offline_until'] = now + OFFLINE_BACKOFF
+                if entry:
+                    self.log(f"無法連線，使用快取的發佈資訊: {e}")
+                    return entry['body']
+                raise
+
+            if response.status == 304:
+                entry['fetched'] = now
+            elif response.status == 200:
+                entry = {'etag': response.getheader('ETag'), 'fetched': now,
+                         'body': json.loads(raw.decode('utf-8'))}
+                cache['entries'][path] = entry
+            elif response.status in (403, 429) and entry:
+                # 速率限制：到重設時間前都使用快取
+                reset = response.getheader('Retry-After')
+                until = now + int(reset) if reset and reset.isdigit() else \
+                    float(response.getheader('X-RateLimit-Reset') or now + OFFLINE_BACKOFF)
+                cache['offline_until'] = until
+                self.log("已達 GitHub 速率限制，使用快取的發佈資訊")
+                self._save_cache()
+                return entry['body']
+            else:
+                raise urllib.error.HTTPError(self.api_url, response.status, response.reason,
+                                             response.msg, None)
+            self._save_cache()
+            return entry['body']
+
+    # ==================== 檢查更新 ====================
+
+    def check_for_updates(self, force: bool = False) -> Optional[Dict]:
         try:
             self.log(f"正在檢查 {self.github_repo} 的更新...")
-            req = urllib.request.Request(self.api_url, headers={'User-Agent': 'ChroLens-App'})
-            with urllib.request.urlopen(req, timeout=10) as response:
-                data = json.loads(response.read().decode('utf-8'))
+            data = self._get_json(self.api_path, force)
             latest_version = data['tag_name'].lstrip('v')
             if pkg_version.parse(latest_version) > pkg_version.parse(self.current_version):
-                download_url = None
-                for asset in data.get('assets', []):
-                    if asset['name'].endswith('.zip'):
-                        download_url = asset['browser_download_url']
-                        break
-                if not download_url and data.get('assets'):
-                    download_url = data['assets'][0]['browser_download_url']
+                assets = data.get('assets', [])
+                asset = next((a for a in assets if a['name'].endswith('.zip')), assets[0] if assets else None)
+                manifest = next((a for a in assets if a['name'] == MANIFEST_NAME), None)
+                # 校驗檔資產在下載時才取得，檢查更新只使用快取的發佈資訊，離線時不會等待連線
                 return {
                     'version': latest_version,
-                    'download_url': download_url,
+                    'download_url': asset['browser_download_url'] if asset else None,
+                    'asset_name': asset['name'] if asset else None,
+                    'size': asset.get('size') if asset else None,
+                    'sha256': self._find_sha256(data, asset) if asset else None,
+                    'sha256_urls': self._checksum_urls(data, asset) if asset else [],
+                    'manifest_url': manifest['browser_download_url'] if manifest else None,
+                    'manifest_sha256': self._find_sha256(data, manifest) if manifest else None,
+                    'manifest_sha256_urls': self._checksum_urls(data, manifest) if manifest else [],
                     'release_notes': data.get('body', '無更新說明')
                 }
             return None
@@ -52,42 +274,460 @@ class VersionManager:
             self.log(f"檢查更新失敗: {e}")
             return None
 
-    def download_update(self, download_url: str, progress_callback: Optional[Callable] = None) -> Optional[str]:
+    def fetch_changelog(self, limit: int = 10) -> str:
+        """最近幾個版本的更新說明（與檢查更新共用快取與連線）"""
         try:
-            temp_dir = tempfile.mkdtemp(prefix='chrolens_update_')
+            releases = self._get_json(f"/repos/{self.github_repo}/releases?per_page={limit}")
+        except Exception as e:
+            self.log(f"獲取更新日誌失敗: {e}")
+            return "無法載入更新日誌，請稍後再試。"
+        changelog = ""
+        for release in releases[:limit]:
+            title = release.get('name') or release.get('tag_name', '')
+            changelog += f"\n{'='*50}\n{title}\n{'='*50}\n{(release.get('body') or '').strip()}\n"
+        return changelog or "尚無更新日誌。"
+
+    def _find_sha256(self, data: Dict, asset: Dict) -> Optional[str]:
+        """由發佈資訊取得 SHA-256（不連線）：GitHub 資產摘要或更新說明中的雜湊"""
+        digest = asset.get('digest') or ''
+        if digest.startswith('sha256:'):
+            return digest.split(':', 1)[1].lower()
+        body = data.get('body') or ''
+        for line in body.splitlines():
+            if 'sha256' in line.lower() or 'sha-256' in line.lower():
+                m = _SHA256_RE.search(line)
+                if m:
+                    return m.group(1).lower()
+        return None
+
+    @staticmethod
+    def _checksum_urls(data: Dict, asset: Dict):
+        """可能含有 asset 雜湊的 .sha256 / SHA256SUMS 資產網址"""
+        names = (asset['name'] + '.sha256', 'SHA256SUMS', 'SHA256SUMS.txt', 'checksums.txt')
+        return [a['browser_download_url'] for a in data.get('assets', []) if a['name'] in names]
+
+    def _fetch_sha256(self, urls, asset_name: str) -> Optional[str]:
+        """下載時才讀取校驗檔資產，找出 asset_name 的 SHA-256"""
+        for url in urls or []:
+            try:
+                req = urllib.request.Request(url, headers={'User-Agent': 'ChroLens-App'})
+                with urllib.request.urlopen(req, timeout=10) as response:
+                    text = response.read(64 * 1024).decode('utf-8', 'replace')
+            except Exception as e:
+                self.log(f"無法取得校驗檔 {url}: {e}")
+                continue
+            lines = [l for l in text.splitlines() if asset_name in l] or text.splitlines()
+            for line in lines:
+                m = _SHA256_RE.search(line)
+                if m:
+                    return m.group(1).lower()
+        return None
+
+    def _download_dir(self, download_url: str) -> str:
+        """同一個下載網址固定使用同一個資料夾，中斷後才能從部分檔案續傳"""
+        key = hashlib.sha256(download_url.encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(tempfile.gettempdir(), 'chrolens_update', key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def download_update(self, download_url: str, progress_callback: Optional[Callable] = None,
+                        expected_sha256: Optional[str] = None) -> Optional[str]:
+        """
+        串流下載更新檔：已有部分檔案時以 HTTP Range 續傳，完成後驗證 SHA-256
+        progress_callback(已下載位元組, 總位元組) 最多每 PROGRESS_INTERVAL 秒呼叫一次
+        """
+        try:
+            temp_dir = self._download_dir(download_url)
             zip_path = os.path.join(temp_dir, 'update.zip')
-            urllib.request.urlretrieve(download_url, zip_path, 
-                                        lambda b, s, t: progress_callback(b*s, t) if progress_callback else None)
+            part_path = zip_path + '.part'
+            if os.path.exists(zip_path):
+                os.replace(zip_path, part_path)  # 上次已下載完成，重新驗證
+            for attempt in range(DOWNLOAD_RETRIES + 1):
+                try:
+                    digest = self._fetch(download_url, part_path, progress_callback)
+                    break
+                except (urllib.error.URLError, OSError) as e:
+                    if isinstance(e, urllib.error.HTTPError) or attempt == DOWNLOAD_RETRIES:
+                        raise
+                    self.log(f"下載中斷，{attempt + 1} 秒後續傳: {e}")
+                    time.sleep(attempt + 1)
+            if expected_sha256:
+                if digest != expected_sha256.lower():
+                    os.remove(part_path)
+                    self.log(f"SHA-256 不符，已刪除下載檔（預期 {expected_sha256}，實際 {digest}）")
+                    return None
+                self.log("SHA-256 驗證通過")
+            elif self.allow_unverified:
+                self.log("發佈未提供 SHA-256，依設定略過驗證")
+            else:
+                self.log("發佈未提供 SHA-256，無法驗證更新檔，不安裝"
+                         "（確定要安裝時可在 settings.json 設定 allow_unverified_updates）")
+                return None
+            os.replace(part_path, zip_path)
             return zip_path
         except Exception as e:
             self.log(f"下載失敗: {e}"); return None
 
+    def _fetch(self, url: str, part_path: str, progress_callback: Optional[Callable]) -> str:
+        """將 url 接續寫入 part_path，回傳完整檔案的 SHA-256"""
+        sha = hashlib.sha256()
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK), b''):
+                    sha.update(chunk)
+        headers = {'User-Agent': 'ChroLens-App'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            response = urllib.request.urlopen(req, timeout=30)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # 416：部分檔案已是完整檔案
+            return sha.hexdigest()
+        with response:
+            if offset and response.status != 206:
+                # 伺服器不支援續傳，從頭下載
+                self.log("伺服器不支援續傳，重新下載")
+                offset = 0
+                sha = hashlib.sha256()
+            elif offset:
+                self.log(f"從 {offset / 1048576:.1f} MB 處續傳")
+            length = response.headers.get('Content-Length')
+            total = offset + int(length) if length and length.isdigit() else 0
+            done = offset
+            last = 0.0
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    sha.update(chunk)
+                    done += len(chunk)
+                    now = time.monotonic()
+                    if progress_callback and now - last >= PROGRESS_INTERVAL:
+                        last = now
+                        progress_callback(done, total)
+            if total and done < total:
+                raise OSError(f"連線提早結束（{done}/{total} 位元組）")
+            if progress_callback:
+                progress_callback(done, total or done)
+        return sha.hexdigest()
+
+    # ==================== 差異更新 ====================
+
+    def prepare_update(self, info: Dict, progress_callback: Optional[Callable] = None) -> Optional[str]:
+        """準備更新檔：發佈附有 manifest 時只取得變更的檔案，否則下載完整 zip；回傳解壓資料夾"""
+        if info.get('manifest_url'):
+            manifest_sha256 = info.get('manifest_sha256') or \
+                self._fetch_sha256(info.get('manifest_sha256_urls'), MANIFEST_NAME)
+            manifest = self.fetch_manifest(info['manifest_url'], manifest_sha256)
+            self._manifest = manifest
+            if manifest:
+                extract_dir = self.download_delta(info['download_url'], manifest, progress_callback)
+                if extract_dir:
+                    return extract_dir
+                self.log("差異更新失敗，改為下載完整更新檔")
+        sha256 = info.get('sha256') or self._fetch_sha256(info.get('sha256_urls'), info.get('asset_name') or '')
+        path = self.download_update(info['download_url'], progress_callback, sha256)
+        return self.extract_update(path) if path else None
+
+    def fetch_manifest(self, url: str, expected_sha256: Optional[str] = None) -> Optional[Dict]:
+        if not expected_sha256 and not self.allow_unverified:
+            self.log("manifest 沒有 SHA-256，不使用差異更新")
+            return None
+        try:
+            req = urllib.request.Request(url, headers={'User-Agent': 'ChroLens-App'})
+            with urllib.request.urlopen(req, timeout=30) as response:
+                raw = response.read()
+            if expected_sha256 and hashlib.sha256(raw).hexdigest() != expected_sha256.lower():
+                self.log("manifest 的 SHA-256 不符，不使用差異更新")
+                return None
+            return json.loads(raw.decode('utf-8'))
+        except Exception as e:
+            self.log(f"取得 manifest 失敗: {e}"); return None
+
+    def changed_files(self, manifest: Dict) -> Dict[str, Dict]:
+        """與已安裝的檔案比較，回傳需要更新的 {相對路徑: 項目}（大小不同時不必計算雜湊）"""
+        changed = {}
+        for rel, entry in manifest.get('files', {}).items():
+            local = os.path.join(self.app_dir, *rel.split('/'))
+            try:
+                if os.path.getsize(local) == entry.get('size') and file_sha256(local) == entry['sha256']:
+                    continue
+            except OSError:
+                pass
+            changed[rel] = entry
+        return changed
+
+    def download_delta(self, download_url: str, manifest: Dict,
+                       progress_callback: Optional[Callable] = None) -> Optional[str]:
+        """
+        只從遠端 zip 取出變更的項目（以 Range 讀取中央目錄與各項目），逐一驗證 SHA-256；
+        回傳可交給 apply_update 的資料夾，伺服器不支援 Range 時回傳 None
+        """
+        try:
+            changed = self.changed_files(manifest)
+            extract_dir = os.path.join(self._download_dir(download_url), 'extracted')
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            # 變更的檔案放在單一子資料夾下，apply_update 會以它為根目錄
+            out_root = os.path.join(extract_dir, 'delta')
+            os.makedirs(out_root, exist_ok=True)
+            if not changed:
+                self.log("所有檔案都已是最新")
+                return extract_dir
+            total = sum(entry.get('size', 0) for entry in changed.values())
+            done = 0
+            with HttpRangeFile(download_url) as remote, zipfile.ZipFile(remote) as z:
+                names = [n for n in z.namelist() if not n.endswith('/')]
+                top = {n.split('/', 1)[0] for n in names}
+                prefix = f"{top.pop()}/" if len(top) == 1 and all('/' in n for n in names) else ''
+                available = set(names)
+                for rel, entry in changed.items():
+                    member = prefix + rel if prefix + rel in available else rel
+                    target = os.path.join(out_root, *rel.split('/'))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    sha = hashlib.sha256()
+                    with z.open(member) as src, open(target, 'wb') as dst:
+                        for chunk in iter(lambda: src.read(DOWNLOAD_CHUNK), b''):
+                            dst.write(chunk)
+                            sha.update(chunk)
+                    if sha.hexdigest() != entry['sha256']:
+                        raise ValueError(f"{rel} 的 SHA-256 與 manifest 不符")
+                    done += entry.get('size', 0)
+                    if progress_callback:
+                        progress_callback(done, total)
+                self.log(f"差異更新：{len(changed)} 個檔案，下載 {remote.fetched / 1048576:.1f} MB"
+                         f"（完整檔 {remote.size / 1048576:.1f} MB）")
+            return extract_dir
+        except Exception as e:
+            self.log(f"差異更新失敗: {e}"); return None
+
+    def _prune_identical(self, src_dir: str) -> int:
+        """刪除與已安裝版本相同的檔案，套用時只複製有變更的部分"""
+        removed = 0
+        for root, _, names in os.walk(src_dir):
+            for name in names:
+                new = os.path.join(root, name)
+                old = os.path.join(self.app_dir, os.path.relpath(new, src_dir))
+                try:
+                    if os.path.getsize(old) == os.path.getsize(new) and file_sha256(old) == file_sha256(new):
+                        os.remove(new)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
     def extract_update(self, zip_path: str) -> Optional[str]:
         try:
             extract_dir = os.path.join(os.path.dirname(zip_path), 'extracted')
+            shutil.rmtree(extract_dir, ignore_errors=True)  # 清除上次解壓留下的檔案
             os.makedirs(extract_dir, exist_ok=True)
             with zipfile.ZipFile(zip_path, 'r') as z: z.extractall(extract_dir)
             return extract_dir
         except Exception as e:
             self.log(f"解壓失敗: {e}"); return None
 
+    # ==================== 套用更新 ====================
+
+    @property
+    def backup_dir(self) -> str:
+        return self.app_dir + '.old'
+
     def apply_update(self, extract_dir: str, restart_after: bool = True) -> bool:
+        """
+        套用更新：在旁邊的 .new 資料夾組出新版本並驗證，再以資料夾改名替換；
+        舊版本保留在 .old 供 rollback() 使用。資料夾被鎖定時（Windows 執行中）改為逐檔替換。
+        呼叫端在回傳 True 且 restart_after 時應結束程式。
+        """
         try:
             src_dir = extract_dir
             files = os.listdir(extract_dir)
             if len(files) == 1 and os.path.isdir(os.path.join(extract_dir, files[0])):
                 src_dir = os.path.join(extract_dir, files[0])
-            bat = os.path.join(self.app_dir, 'update_temp.bat')
-            exe = os.path.basename(sys.executable)
-            content = f'''@echo off
-timeout /t 2 /nobreak >nul
-taskkill /F /IM "{exe}" >nul 2>&1
-robocopy "{src_dir}" "{self.app_dir}" /E /IS /IT /R:3 /W:1
-start "" "{sys.executable if getattr(sys, "frozen", False) else "python"}" {"" if getattr(sys, "frozen", False) else sys.argv[0]}
-del "%~f0"
-'''
-            with open(bat, 'w', encoding='utf-8') as f: f.write(content)
-            subprocess.Popen(['cmd', '/c', 'start', '', '/min', bat], shell=True)
+            skipped = self._prune_identical(src_dir)
+            if skipped:
+                self.log(f"略過 {skipped} 個未變更的檔案")
+            changed = [os.path.relpath(os.path.join(root, name), src_dir)
+                       for root, _, names in os.walk(src_dir) for name in names]
+            if not changed:
+                self.log("沒有需要更新的檔案")
+                return False
+
+            stage = self.app_dir + '.new'
+            self._build_stage(stage, src_dir, changed)
+            self._verify_stage(stage, src_dir, changed)
+            try:
+                self._swap_dirs(stage, changed)
+                self.log(f"已更新 {len(changed)} 個檔案（舊版本保留於 {self.backup_dir}）")
+            except OSError as e:
+                self.log(f"無法替換資料夾（{e}），改為逐檔替換")
+                self._swap_files(stage, changed)
+                shutil.rmtree(stage, ignore_errors=True)
+                self.log(f"已更新 {len(changed)} 個檔案")
+            if restart_after:
+                self._restart()
             return True
         except Exception as e:
             self.log(f"更新失敗: {e}"); return False
+
+    def _is_data(self, rel: str, release_files) -> bool:
+        """rel 是否為使用者資料（不屬於發佈內容、符合 DATA_PATTERNS）"""
+        if rel in release_files:
+            return False
+        return any(fnmatch.fnmatch(os.path.basename(rel), pattern) for pattern in DATA_PATTERNS)
+
+    def _release_files(self, changed) -> set:
+        files = set(changed)
+        if self._manifest:
+            files.update(os.path.normpath(rel) for rel in self._manifest.get('files', {}))
+        return files
+
+    def _build_stage(self, stage: str, src_dir: str, changed):
+        """
+        未變更的程式檔以硬連結沿用（不重寫內容），變更的檔案從更新來源複製；
+        使用者資料會被原地改寫，一律複製，讓 .old 保留更新當時的內容
+        """
+        shutil.rmtree(stage, ignore_errors=True)
+        changed_set = set(changed)
+        release_files = self._release_files(changed)
+        for root, dirs, names in os.walk(self.app_dir):
+            rel_root = os.path.relpath(root, self.app_dir)
+            os.makedirs(os.path.join(stage, rel_root), exist_ok=True)
+            for name in names:
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                if rel in changed_set:
+                    continue
+                src, dst = os.path.join(root, name), os.path.join(stage, rel)
+                if self._is_data(rel, release_files):
+                    shutil.copy2(src, dst)
+                    continue
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)
+        for rel in changed:
+            dst = os.path.join(stage, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(os.path.join(src_dir, rel), dst)
+
+    def _verify_stage(self, stage: str, src_dir: str, changed):
+        manifest = self._manifest
+        if manifest:
+            for rel, entry in manifest.get('files', {}).items():
+                path = os.path.join(stage, *rel.split('/'))
+                if not os.path.exists(path) or file_sha256(path) != entry['sha256']:
+                    raise ValueError(f"新版本驗證失敗：{rel}")
+            return
+        for rel in changed:
+            if file_sha256(os.path.join(stage, rel)) != file_sha256(os.path.join(src_dir, rel)):
+                raise ValueError(f"新版本驗證失敗：{rel}")
+
+    @contextlib.contextmanager
+    def _outside_app_dir(self):
+        """
+        暫時切換到上層資料夾（Windows 無法改名目前工作目錄所在的資料夾），
+        結束後以原本的路徑切回，讓相對路徑的資料檔指向替換後的資料夾
+        """
+        previous = os.getcwd()
+        os.chdir(os.path.dirname(self.app_dir))
+        try:
+            yield
+        finally:
+            try:
+                os.chdir(previous)
+            except OSError:
+                os.chdir(self.app_dir)
+
+    def _swap_dirs(self, stage: str, changed):
+        """app → .old、.new → app；第二步失敗時還原"""
+        with self._outside_app_dir():
+            shutil.rmtree(self.backup_dir, ignore_errors=True)
+            os.rename(self.app_dir, self.backup_dir)
+            try:
+                os.rename(stage, self.app_dir)
+            except OSError:
+                os.rename(self.backup_dir, self.app_dir)
+                raise
+        self._write_backup_info('dir', [], sorted(self._release_files(changed)))
+
+    def _carry_data(self, info: Dict):
+        """還原前把更新後寫入的使用者資料複製到 .old，還原後不會遺失"""
+        release_files = set(os.path.normpath(rel) for rel in info.get('release', []))
+        for root, _, names in os.walk(self.app_dir):
+            rel_root = os.path.relpath(root, self.app_dir)
+            for name in names:
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                if rel == 'update_backup.json' or not self._is_data(rel, release_files):
+                    continue
+                dst = os.path.join(self.backup_dir, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(os.path.join(root, name), dst)
+
+    def _swap_files(self, stage: str, changed):
+        """逐檔替換：舊檔先移到 .old（執行中的 exe 也能改名），再放入新檔"""
+        shutil.rmtree(self.backup_dir, ignore_errors=True)
+        replaced = []
+        try:
+            for rel in changed:
+                target = os.path.join(self.app_dir, rel)
+                backup = os.path.join(self.backup_dir, rel)
+                os.makedirs(os.path.dirname(backup), exist_ok=True)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                had_old = os.path.exists(target)
+                if had_old:
+                    os.replace(target, backup)
+                os.replace(os.path.join(stage, rel), target)
+                replaced.append((rel, had_old))
+        except OSError:
+            self._restore_files(replaced)
+            raise
+        self._write_backup_info('files', replaced)
+
+    def _restore_files(self, replaced):
+        for rel, had_old in reversed(replaced):
+            target = os.path.join(self.app_dir, rel)
+            if had_old:
+                os.replace(os.path.join(self.backup_dir, rel), target)
+            elif os.path.exists(target):
+                os.remove(target)
+
+    def _write_backup_info(self, mode: str, replaced, release=()):
+        """記錄還原方式；release 為新版本發佈的檔案（還原時不視為使用者資料）"""
+        with open(os.path.join(self.backup_dir, 'update_backup.json'), 'w', encoding='utf-8') as f:
+            json.dump({'mode': mode, 'version': self.current_version, 'files': replaced,
+                       'release': list(release)}, f, ensure_ascii=False)
+
+    def rollback(self) -> bool:
+        """還原為更新前的版本"""
+        info_file = os.path.join(self.backup_dir, 'update_backup.json')
+        try:
+            with open(info_file, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            os.remove(info_file)
+            if info['mode'] == 'dir':
+                self._carry_data(info)
+                with self._outside_app_dir():
+                    failed = self.app_dir + '.failed'
+                    shutil.rmtree(failed, ignore_errors=True)
+                    os.rename(self.app_dir, failed)
+                    os.rename(self.backup_dir, self.app_dir)
+                    shutil.rmtree(failed, ignore_errors=True)
+            else:
+                self._restore_files([tuple(item) for item in info['files']])
+                shutil.rmtree(self.backup_dir, ignore_errors=True)
+            self.log(f"已還原至 {info['version']}")
+            return True
+        except Exception as e:
+            self.log(f"還原失敗: {e}"); return False
+
+    def _restart(self):
+        """以新版本重新啟動（呼叫端隨後結束目前程式）"""
+        if getattr(sys, 'frozen', False):
+            args = [self._entry] + sys.argv[1:]
+        else:
+            args = [sys.executable, self._entry] + sys.argv[1:]
+        subprocess.Popen(args, cwd=os.path.dirname(self._entry))
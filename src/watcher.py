@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+ChroLens_Sorting 監看模式
+持續監看來源資料夾，檔案寫入完成後立即交給規則分類
+
+- Linux：透過 inotify 訂閱 IN_CLOSE_WRITE / IN_MOVED_TO（遞迴模式含子資料夾）
+- 其他平台：定期比對資料夾快照，項目大小與時間連續兩次不變才回報
+- exclude 中位於來源內的資料夾（目的地）不監看也不回報，移入目的地的項目不會再被分類
+"""
+
+import os
+import sys
+import struct
+import select
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# inotify 常數（linux/inotify.h）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    """取得支援 inotify 的 libc，不支援時回傳 None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def _excluded(path: str, exclude: Iterable[str]) -> Callable[[str], bool]:
+    if not exclude:
+        return lambda full: False
+    from sorting_engine import excluded_matcher
+    return excluded_matcher(path, exclude)
+
+
+class InotifyWatcher:
+    """以 inotify 監看資料夾，對寫入完成或移入的項目呼叫 callback(完整路徑)"""
+
+    FILE_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+    DIR_MASK = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self, path: str, callback: Callable[[str], None],
+                 recursive: bool = False, log: Callable = print, exclude: Iterable[str] = ()):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.recursive = recursive
+        self.excluded = _excluded(self.path, exclude)
+        self._logger = log
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError("此平台不支援 inotify")
+        self._fd = -1
+        self._watches: Dict[int, str] = {}  # wd → 資料夾路徑
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def start(self):
+        import ctypes
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        self._add_watch(self.path)
+        if self.recursive:
+            for root, dirs, _ in os.walk(self.path):
+                dirs[:] = [d for d in dirs if not self.excluded(os.path.join(root, d))]
+                for d in dirs:
+                    self._add_watch(os.path.join(root, d))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ChroLensWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._watches.clear()
+
+    def _add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                          self.FILE_MASK | self.DIR_MASK | IN_ONLYDIR)
+        if wd >= 0:
+            self._watches[wd] = path
+        else:
+            self.log(f"無法監看：{path}")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self._fd, 64 * 1024)
+            except (OSError, ValueError):
+                return
+            self._dispatch(data)
+
+    def _dispatch(self, data: bytes):
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件佇列溢位：重新列出所有項目
+                self.log("監看事件過多，重新掃描來源資料夾")
+                self._emit_existing(self.path)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            parent = self._watches.get(wd)
+            if parent is None or not name:
+                continue
+            full = os.path.join(parent, name)
+            if self.excluded(full):
+                continue
+
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_watch(full)
+                    # 監看建立前已寫入的檔案
+                    self._emit_existing(full)
+                elif mask & IN_MOVED_TO and parent == self.path:
+                    self._emit(full)
+                continue
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._emit(full)
+
+    def _emit_existing(self, path: str):
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if not self.excluded(os.path.join(root, d))]
+            if not self.recursive:
+                for d in dirs:
+                    self._emit(os.path.join(root, d))
+                dirs.clear()
+            for name in names:
+                self._emit(os.path.join(root, name))
+
+    def _emit(self, path: str):
+        try:
+            self.callback(path)
+        except Exception as e:
+            self.log(f"監看處理失敗：{e}")
+
+
+class PollingWatcher:
+    """以快照比對監看資料夾（無 inotify 時的替代方案）"""
+
+    def __init__(self, path: str, callback: Callable[[str], None],
+                 recursive: bool = False, log: Callable = print, interval: float = 2.0,
+                 exclude: Iterable[str] = ()):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.recursive = recursive
+        self.excluded = _excluded(self.path, exclude)
+        self._logger = log
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def log(self, msg: str):
+        self._logger(msg)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ChroLensPoller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snap = {}
+        stack = [self.path]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if self.excluded(entry.path):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive:
+                                stack.append(entry.path)
+                                continue
+                        snap[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        return snap
+
+    def _loop(self):
+        # 啟動時已存在的項目不回報，與 inotify 行為一致
+        previous = self._snapshot()
+        changed = set()
+        while not self._stop.wait(self.interval):
+            current = self._snapshot()
+            for path, sig in current.items():
+                if path in changed and previous.get(path) == sig:
+                    changed.discard(path)
+                    try:
+                        self.callback(path)
+                    except Exception as e:
+                        self.log(f"監看處理失敗：{e}")
+                elif previous.get(path) != sig:
+                    changed.add(path)
+            changed &= current.keys()
+            previous = current
+
+
+def create_watcher(path: str, callback: Callable[[str], None], recursive: bool = False,
+                   log: Callable = print, exclude: Iterable[str] = ()):
+    """建立適合目前平台的監看器（優先使用 inotify）；exclude 為不監看的資料夾（目的地）"""
+    try:
+        return InotifyWatcher(path, callback, recursive, log, exclude)
+    except OSError:
+        return PollingWatcher(path, callback, recursive, log, exclude=exclude)
+
+
+def run_headless(profile_name: str, settings_file: str, templates_file: str,
+                 stats_file: str, journal_file: str) -> int:
+    """無視窗模式：持續監看設定檔的來源資料夾並即時分類（一批事件全部穩定後一起移動與記錄）"""
+    import time
+    from collections import deque
+    from sorting_engine import (CompiledRules, load_profiles, plan_single,
+                                execute_batch, record_stats, check_space, transfer_map)
+    from settle import BatchSettler, SettleTracker
+    from batcher import EventBatcher
+    import metrics
+    from journal import shared
+
+    profile = load_profiles(settings_file, templates_file).get(profile_name)
+    if profile is None or not os.path.isdir(profile.source):
+        print(f"找不到設定檔或來源路徑無效：{profile_name}")
+        return 1
+    rules = CompiledRules(profile)
+    tracker = SettleTracker(profile.settle_seconds)
+    metrics.SETTLE_PENDING.labels(source=profile.name).set_function(tracker.__len__)
+    settler = BatchSettler(tracker)
+    ready_batches = deque()  # 加入時已全部穩定的批次，由主迴圈移動
+    journal = shared(journal_file)
+
+    def on_batch(paths):
+        moves = []
+        for path in paths:
+            rel = os.path.relpath(path, profile.source).replace(os.sep, "/")
+            if os.path.isdir(path):
+                rel += "/"
+            move = plan_single(rules, rel)
+            if move is not None:
+                moves.append(move)
+        ready, _, _ = settler.add(profile.source, moves)
+        if ready:
+            ready_batches.append(ready)
+
+    batcher = EventBatcher(on_batch)
+    batcher.start()
+    watcher = create_watcher(profile.source, batcher.add, profile.recursive,
+                             exclude=profile.destination_roots())
+    watcher.start()
+    print(f"監看中：{profile.source}（{type(watcher).__name__}，Ctrl+C 結束）")
+    try:
+        while True:
+            time.sleep(1)
+            batches, _ = settler.collect(tracker.poll())
+            while ready_batches:
+                batches.append(ready_batches.popleft())
+            for batch in batches:
+                settled = check_space(profile, batch)
+                if not settled:
+                    continue
+                result = execute_batch(profile.source, settled, profile.conflict, verify=profile.verify,
+                                       modes=transfer_map(profile), order=profile.order)
+                print(f"完成：{result.summary()}")
+                if result.history:
+                    journal.record_batch(profile.name, profile.source, result)
+                record_stats(stats_file, result.moved)
+    except KeyboardInterrupt:
+        watcher.stop()
+        batcher.stop(flush_pending=False)
+    return 0
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""測試共用設定：模組位於 src/，以平面匯入（與主程式相同）"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""控制介面：以暫存 socket 上的 ControlServer 與 ControlClient 測試，常駐程序以替身代替"""
+
+import os
+import socket
+import stat
+import tempfile
+
+import pytest
+
+from control_api import ControlClient, ControlServer, DaemonControl
+
+
+class _DaemonStub:
+    def __init__(self):
+        self.profiles = {"下載": object()}
+        self.summaries = {}
+        self.triggered = []
+        self.reloaded = None
+
+    def trigger(self, name):
+        self.triggered.append(name)
+
+    def dry_run(self, name):
+        return [["a.txt", "/dest"], ["b.txt", "/dest"]]
+
+    def cancel(self, name):
+        return 0
+
+    def progress(self):
+        return {"active": 0, "profiles": {"下載": {"pending": 3, "moved": 1, "failed": 0}},
+                "throttle": {}, "folders": {}}
+
+    def reload(self, profiles):
+        self.reloaded = profiles
+        self.profiles = profiles
+
+
+@pytest.fixture
+def client():
+    daemon = _DaemonStub()
+    control = DaemonControl(daemon, lambda: {"下載": object(), "文件": object()})
+    if hasattr(socket, "AF_UNIX"):
+        # Unix socket 路徑長度有限，使用短的暫存資料夾
+        address = os.path.join(tempfile.mkdtemp(prefix="cl"), "ctl.sock")
+    else:
+        address = "127.0.0.1:0"
+    server = ControlServer(control, address)
+    server.start()
+    if not hasattr(socket, "AF_UNIX"):
+        host, port = server._server.server_address
+        address = f"{host}:{port}"
+    c = ControlClient(address, timeout=5)
+    c.daemon = daemon
+    c.server = server
+    yield c
+    server.stop()
+
+
+def test_status(client):
+    response = client.call("status")
+    assert response["ok"]
+    assert response["profiles"]["下載"]["pending"] == 3
+
+
+def test_dry_run(client):
+    response = client.call("dry_run", profile="下載")
+    assert response == {"ok": True, "count": 2, "moves": [["a.txt", "/dest"], ["b.txt", "/dest"]]}
+    response = client.call("run", profile="下載", dry_run=True)
+    assert response["count"] == 2
+    assert client.daemon.triggered == []
+
+
+def test_unknown_profile(client):
+    response = client.call("run", profile="不存在")
+    assert not response["ok"]
+
+
+def test_reload(client):
+    response = client.call("reload")
+    assert response == {"ok": True, "profiles": ["下載", "文件"]}
+    assert set(client.daemon.reloaded) == {"下載", "文件"}
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="需要 Unix socket")
+def test_bad_json(client):
+    target = client.address
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(target)
+        sock.sendall(b"{not json\n")
+        data = sock.makefile("rb").readline()
+    assert b'"ok": false' in data
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="需要 Unix socket")
+def test_socket_is_private(client):
+    assert stat.S_IMODE(os.stat(client.address).st_mode) == 0o600
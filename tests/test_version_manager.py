@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""更新檔下載驗證：以本機 HTTP 伺服器代替 GitHub 發佈資產"""
+
+import hashlib
+import http.server
+import io
+import os
+import threading
+import zipfile
+
+import pytest
+
+import version_manager
+from version_manager import VersionManager
+
+
+def _zip_bytes() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("app/prog.py", "print('v2')\n")
+    return buf.getvalue()
+
+
+PAYLOAD = _zip_bytes()
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+FILES = {
+    "/update.zip": PAYLOAD,
+    "/SHA256SUMS": f"{SHA256}  update.zip\n".encode(),
+}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = FILES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(version_manager.tempfile, "gettempdir", lambda: str(tmp_path))
+    logs = []
+    vm = VersionManager("owner/repo", "1.0", logger=logs.append, cache_file=str(tmp_path / "cache.json"))
+    vm.logs = logs
+    return vm
+
+
+def test_download_verifies_matching_sha256(server, manager):
+    path = manager.download_update(server + "/update.zip", expected_sha256=SHA256)
+    assert path is not None
+    with open(path, "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+def test_download_rejects_mismatched_sha256(server, manager):
+    assert manager.download_update(server + "/update.zip", expected_sha256="0" * 64) is None
+    assert not os.path.exists(os.path.join(manager._download_dir(server + "/update.zip"), "update.zip"))
+
+
+def test_download_refuses_without_sha256(server, manager):
+    assert manager.download_update(server + "/update.zip") is None
+    assert any("不安裝" in msg for msg in manager.logs)
+
+
+def test_download_without_sha256_requires_opt_in(server, manager):
+    manager.allow_unverified = True
+    assert manager.download_update(server + "/update.zip") is not None
+
+
+def test_manifest_without_sha256_is_not_used(server, manager):
+    assert manager.fetch_manifest(server + "/manifest.json") is None
+
+
+def _release(base: str):
+    return {
+        "tag_name": "v2.0",
+        "body": "",
+        "assets": [
+            {"name": "update.zip", "browser_download_url": base + "/update.zip", "size": len(PAYLOAD)},
+            {"name": "SHA256SUMS", "browser_download_url": base + "/SHA256SUMS"},
+        ],
+    }
+
+
+def test_check_for_updates_does_not_fetch_checksums(server, manager, monkeypatch):
+    monkeypatch.setattr(manager, "_get_json", lambda path, force=False: _release(server))
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("檢查更新不應連線取得校驗檔")
+
+    monkeypatch.setattr(version_manager.urllib.request, "urlopen", no_network)
+    info = manager.check_for_updates()
+    assert info["version"] == "2.0"
+    assert info["sha256"] is None
+    assert info["sha256_urls"] == [server + "/SHA256SUMS"]
+
+
+def test_prepare_update_resolves_checksum_at_download(server, manager, monkeypatch):
+    monkeypatch.setattr(manager, "_get_json", lambda path, force=False: _release(server))
+    info = manager.check_for_updates()
+    extract_dir = manager.prepare_update(info)
+    assert extract_dir is not None
+    assert os.path.exists(os.path.join(extract_dir, "app", "prog.py"))